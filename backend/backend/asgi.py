@@ -3,6 +3,16 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve with an ASGI server (e.g. ``gunicorn -k uvicorn.workers.UvicornWorker
+backend.asgi``) so the async views and the progress event streams share one
+event loop per worker instead of a thread per connection.
+
+Django's ASGI handler reads a synchronous streaming body into memory before
+sending it, so file responses (media files, ZIP exports, live streams) are
+given async bodies that read each block in a worker thread; see
+my_mp4.media.for_server. Setting MEDIA_OFFLOAD lets nginx or Apache send
+finished files instead, which is still the cheapest option.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -117,6 +117,143 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Hand media transfers to the web server instead of streaming them from Python.
+# None, 'x-accel-redirect' (nginx, needs an internal location at the prefix
+# aliased to MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile, lighttpd).
+MEDIA_OFFLOAD = None
+MEDIA_OFFLOAD_PREFIX = '/protected-media/'
+
+# Download engine: 'threads' runs yt-dlp in-process on pooled worker threads
+# with warm YoutubeDL instances (see YTDLP_POOL). 'asyncio' supervises one
+# yt-dlp child process per attempt from an event loop: no thread per running
+# job and hard cancellation, but every attempt pays an interpreter start and
+# a cold YoutubeDL. On `manage.py bench_downloads --jobs 16 --size 2000000`
+# threads ran about 5x the jobs/s, so it stays the default.
+DOWNLOAD_ENGINE = 'threads'
+
+# Download job queue - concurrent jobs per lane, per process
+DOWNLOAD_QUEUE = {
+    'LANES': {
+        'mp4': 4,  # network-heavy
+        'mp3': 2,  # ffmpeg transcode, CPU-heavy
+    },
+    'POLL_INTERVAL': 2,
+    'HEARTBEAT_INTERVAL': 15,
+    'STALE_AFTER': 120,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': (3, 11),  # seconds, doubled per attempt
+    'CANCEL_CHECK_INTERVAL': 2,
+    # Shortest job first with aging: a job's cost is its expected size at
+    # EXPECTED_THROUGHPUT bytes/s, less AGING_RATE per second it has waited
+    'EXPECTED_THROUGHPUT': 1_250_000,
+    'AGING_RATE': 1.0,
+}
+
+# Download progress store, shared by all worker processes on this host.
+# Use my_mp4.progress.RedisProgressStore (OPTIONS: HOST, PORT, DB) across hosts.
+DOWNLOAD_PROGRESS = {
+    'BACKEND': 'my_mp4.progress.SQLiteProgressStore',
+    'OPTIONS': {
+        'PATH': os.path.join(BASE_DIR, 'progress.sqlite3'),
+    },
+    'TTL': 3600,
+    'MIN_INTERVAL': 0.5,
+    'MIN_DELTA': 1.0,
+}
+
+# yt-dlp metadata cache for video info, search and download. SHARED_CACHE names
+# an alias in CACHES (e.g. Redis or memcached) shared by all workers.
+METADATA_CACHE = {
+    'TTL': 1800,
+    'SEARCH_TTL': 600,
+    'PLAYLIST_TTL': 600,
+    'MAX_ENTRIES': 256,
+    'SHARED_CACHE': None,
+}
+
+# Warm, reusable YoutubeDL instances per client profile
+YTDLP_POOL = {
+    'MAX_IDLE': 4,
+    'MAX_AGE': 3600,
+    'CACHE_DIR': os.path.join(BASE_DIR, '.ytdlp-cache'),
+}
+
+# ffmpeg encodes (mp3) share this many single-threaded slots per host,
+# see my_mp4.audio.TranscodePool
+TRANSCODE = {
+    'WORKERS': os.cpu_count() or 1,
+    'FFMPEG': 'ffmpeg',
+    'LOCK_DIR': os.path.join(BASE_DIR, '.transcode-slots'),
+}
+
+# Download connections shared by all jobs on this host, see my_mp4.bandwidth.
+# Set UPLINK_BPS (bytes/s) to cap total download bandwidth.
+BANDWIDTH = {
+    'MAX_CONNECTIONS': 16,
+    'MAX_PER_JOB': 8,
+    'UPLINK_BPS': None,
+    'LOCK_DIR': os.path.join(BASE_DIR, '.bandwidth-slots'),
+}
+
+# Media storage quota, enforced by my_mp4.janitor (sizes in bytes)
+MEDIA_JANITOR = {
+    'INTERVAL': 600,
+    'HIGH_WATERMARK': 10 * 1024 ** 3,
+    'LOW_WATERMARK': 8 * 1024 ** 3,
+    'MAX_AGE': 86400,
+    'GRACE_PERIOD': 600,
+}
+
+# Batch and playlist downloads, see my_mp4/groups.py
+DOWNLOAD_GROUPS = {
+    'MAX_ITEMS': 100,  # capped at ADMISSION's MAX_QUEUED and MAX_ACTIVE
+    'MAX_PARALLEL': 3,  # per group; clients may ask for fewer
+}
+
+# Admission control for start_download, see my_mp4/admission.py. Requests
+# over a limit get 429 (per device) or 503 (server-wide) with Retry-After.
+ADMISSION = {
+    'MAX_PER_DEVICE': 3,
+    'MAX_ACTIVE': 200,
+    'MAX_QUEUED': 100,
+    'MIN_FREE_BYTES': 2 * 1024 ** 3,
+    'DISK_SAFETY_FACTOR': 2,
+    'DEFAULT_DURATION': 600,
+    'RETRY_AFTER': 30,
+    'DISK_RETRY_AFTER': 600,
+}
+
+# Structured logging. Records are queued and written as JSON lines by a
+# background thread (my_mp4/logs.py), so logging never blocks a download
+# thread on stderr. Set per-module levels under 'loggers'.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'my_mp4.logs.JsonFormatter'},
+    },
+    'handlers': {
+        'background': {
+            'class': 'my_mp4.logs.BackgroundHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'my_mp4': {'handlers': ['background'], 'level': 'INFO', 'propagate': False},
+        # Sampled download progress, one line per job every LOG_PROGRESS_INTERVAL
+        'my_mp4.views.progress': {'level': 'INFO'},
+        # yt-dlp's own output
+        'my_mp4.ytdlp': {'level': 'WARNING'},
+    },
+}
+
+# Start the download workers and media janitor in each web process on its
+# first request. Turn off when `manage.py run_services` runs them instead.
+BACKGROUND_SERVICES = True
+
+# Seconds between logged progress lines per job
+LOG_PROGRESS_INTERVAL = 10
+
 # CORS settings - IMPORTANT for API to work
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = [
@@ -147,6 +284,12 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
 ]
 
+# Let the frontend read the history pagination cursor
+CORS_EXPOSE_HEADERS = [
+    'x-next-cursor',
+    'retry-after',
+]
+
 # CSRF Settings
 CSRF_TRUSTED_ORIGINS = [
     'https://youtubedownloder.207.180.201.93.sslip.io',
@@ -2,10 +2,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from my_mp4 import views as my_mp4_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('my_mp4.urls')),
+    path('metrics', my_mp4_views.metrics, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,127 @@
+"""Admission control for new downloads.
+
+start_download checks a per-device cap on every request, and global queue,
+active-job and free-disk limits on requests that would start a new fetch.
+Rejected requests get 429 (the device's own limit) or 503 (the server's)
+with Retry-After, and are counted in my_mp4_admission_rejections_total.
+"""
+import shutil
+
+from django.conf import settings
+from django.db.models import Count
+
+from . import storage
+from .bandwidth import expected_size
+from .metacache import cached_duration
+from .metrics import rejections_total
+from .models import UNFINISHED, DownloadRequest
+
+ADMISSION_DEFAULTS = {
+    # Unfinished downloads one device may have at once
+    'MAX_PER_DEVICE': 3,
+    # Downloads queued or running across all workers
+    'MAX_ACTIVE': 200,
+    # Downloads waiting for a worker
+    'MAX_QUEUED': 100,
+    # Free space MEDIA_ROOT must keep after a download's estimated size
+    'MIN_FREE_BYTES': 2 * 1024 ** 3,
+    # A download needs room for the fetched file and its post-processed copy
+    'DISK_SAFETY_FACTOR': 2,
+    # Assumed length when the video's duration is not known yet
+    'DEFAULT_DURATION': 600,
+    # Retry-After seconds for rejected requests
+    'RETRY_AFTER': 30,
+    'DISK_RETRY_AFTER': 600,
+}
+
+
+def admission_setting(name):
+    """Read an ADMISSION setting, falling back to the defaults"""
+    return getattr(settings, 'ADMISSION', {}).get(name, ADMISSION_DEFAULTS[name])
+
+
+class Rejection:
+    """Why a request was turned away, and when to try again"""
+
+    def __init__(self, reason, status, message, retry_after):
+        self.reason = reason
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+def estimated_bytes(video_id, format_type, clip=None, client_types=(), duration=None):
+    """Expected output size from the video's duration: given, from cached metadata, or assumed"""
+    if not duration:
+        for client_type in client_types:
+            duration = cached_duration(video_id, client_type)
+            if duration:
+                break
+    return expected_size({'duration': duration or admission_setting('DEFAULT_DURATION')}, format_type, clip)
+
+
+def active_counts():
+    """Queued and processing jobs across all workers"""
+    counts = dict(
+        DownloadRequest.objects.filter(status__in=['queued', 'processing'])
+        .values_list('status')
+        .annotate(total=Count('id'))
+    )
+    return counts.get('queued', 0), counts.get('processing', 0)
+
+
+def free_bytes():
+    return shutil.disk_usage(storage.media_root()).free
+
+
+def check_device(device_id):
+    """Per-device cap, applied to every request; a batch holds one place however large"""
+    unfinished = DownloadRequest.objects.filter(device_id=device_id, status__in=UNFINISHED)
+    places = (
+        unfinished.filter(group__isnull=True).count()
+        + unfinished.filter(group__isnull=False).values('group').distinct().count()
+    )
+    if places >= admission_setting('MAX_PER_DEVICE'):
+        return reject(
+            'device', 429,
+            'Too many downloads in progress for this device, wait for one to finish',
+            admission_setting('RETRY_AFTER'),
+        )
+    return None
+
+
+def check_fetch(expected, jobs=1):
+    """Global caps and disk space, applied to requests that start new fetches.
+
+    expected is the total estimated size of the new fetches, jobs their number.
+    """
+    queued, processing = active_counts()
+    if queued + jobs > admission_setting('MAX_QUEUED'):
+        return reject('queue', 503, 'The download queue is full, try again shortly', admission_setting('RETRY_AFTER'))
+    if queued + processing + jobs > admission_setting('MAX_ACTIVE'):
+        return reject('active', 503, 'The server is at capacity, try again shortly', admission_setting('RETRY_AFTER'))
+
+    needed = (expected or 0) * admission_setting('DISK_SAFETY_FACTOR') + admission_setting('MIN_FREE_BYTES')
+    if free_bytes() < needed:
+        return reject('disk', 503, 'The server is low on storage, try again later', admission_setting('DISK_RETRY_AFTER'))
+    return None
+
+
+def reject(reason, status, message, retry_after):
+    rejections_total.inc(reason=reason)
+    return Rejection(reason, status, message, retry_after)
+
+
+def stats():
+    queued, processing = active_counts()
+    return {
+        'limits': {
+            'max_per_device': admission_setting('MAX_PER_DEVICE'),
+            'max_active': admission_setting('MAX_ACTIVE'),
+            'max_queued': admission_setting('MAX_QUEUED'),
+            'min_free_bytes': admission_setting('MIN_FREE_BYTES'),
+        },
+        'queued': queued,
+        'active': queued + processing,
+        'free_bytes': free_bytes(),
+    }
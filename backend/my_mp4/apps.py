@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MyMp4Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'my_mp4'
+
+    def ready(self):
+        from . import services
+
+        # Job workers and the janitor start with the first request, not on import
+        if services.enabled():
+            services.start_with_first_request()
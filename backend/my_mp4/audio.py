@@ -0,0 +1,217 @@
+import os
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+
+from .errors import JobCancelled, PostProcessingFailure
+from .slots import HostSlots
+
+# Audio formats that keep the source stream as-is and only change the
+# container. YouTube serves AAC (itag 140) and Opus (itag 251) audio; a
+# video without a stream in the target codec falls back to the best audio
+# there is, which is then encoded in the TranscodePool like mp3.
+COPY_FORMATS = {
+    'm4a': {'selector': 'bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best', 'acodec': 'mp4a',
+            'codec': 'aac', 'bitrate': '160k', 'muxer': 'ipod', 'mime': 'audio/mp4'},
+    'opus': {'selector': 'bestaudio[acodec=opus]/bestaudio/best', 'acodec': 'opus',
+             'codec': 'libopus', 'bitrate': '160k', 'muxer': 'opus', 'mime': 'audio/ogg'},
+}
+
+# Audio formats that always need an ffmpeg encode, run through the TranscodePool
+TRANSCODE_FORMATS = {
+    'mp3': {'codec': 'libmp3lame', 'bitrate': '192k', 'muxer': 'mp3', 'mime': 'audio/mpeg'},
+}
+
+AUDIO_FORMATS = (*COPY_FORMATS, *TRANSCODE_FORMATS)
+
+TRANSCODE_DEFAULTS = {
+    # Concurrent ffmpeg encodes per host. Each encode is pinned to one thread,
+    # so this is the number of cores audio transcoding may use.
+    'WORKERS': os.cpu_count() or 1,
+    'FFMPEG': 'ffmpeg',
+    # Slot lock files shared by every worker process on the host
+    'LOCK_DIR': os.path.join(settings.BASE_DIR, '.transcode-slots'),
+    'TIMEOUT': 900,
+}
+
+# Seconds between checks of whether a running encode was cancelled
+CANCEL_POLL_INTERVAL = 0.5
+
+
+def transcode_setting(name):
+    """Read a TRANSCODE setting, falling back to the defaults"""
+    return getattr(settings, 'TRANSCODE', {}).get(name, TRANSCODE_DEFAULTS[name])
+
+
+def parse_accept(value, header=''):
+    """MIME types the client plays, from the request's 'accept' or its Accept header.
+
+    'accept' may be a comma-separated string or a list of strings;
+    anything else raises ValueError.
+    """
+    value = value or header
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or not all(isinstance(mime, str) for mime in value):
+        raise ValueError("accept must be a MIME type string or a list of them")
+    return value
+
+
+def choose_audio_format(requested, accepted=()):
+    """Resolve the 'audio' format to the cheapest one the client can play.
+
+    Explicit formats are honoured as they are. For 'audio' the first
+    stream-copy format whose MIME type the client accepts wins, and mp3,
+    which every client plays, is the fallback.
+    """
+    if requested != 'audio':
+        return requested
+    accepted = {mime.split(';')[0].strip().lower() for mime in accepted}
+    for format_type, spec in COPY_FORMATS.items():
+        if spec['mime'] in accepted:
+            return format_type
+    return 'mp3'
+
+
+def audio_ydl_opts(format_type):
+    """yt-dlp format options for an audio format.
+
+    The source is always downloaded untouched; TranscodePool.transcode
+    remuxes or encodes it afterwards, depending on the codec yt-dlp got.
+    """
+    if format_type in COPY_FORMATS:
+        return {'format': COPY_FORMATS[format_type]['selector']}
+    return {'format': 'bestaudio/best'}
+
+
+def can_copy(format_type, acodec):
+    """Whether a stream in acodec goes into format_type without an encode"""
+    spec = COPY_FORMATS.get(format_type)
+    return bool(spec and acodec and acodec.startswith(spec['acodec']))
+
+
+class TranscodePool:
+    """Host-wide bounded pool of ffmpeg encodes.
+
+    A slot is an flock'ed file under LOCK_DIR, so the bound holds across all
+    gunicorn workers on the machine, not just this process. Callers block
+    until a slot is free; how long they waited is part of the metrics.
+    """
+
+    def __init__(self, workers=None):
+        self._workers = workers
+        self.slots = HostSlots(lambda: transcode_setting('LOCK_DIR'), lambda: self.workers)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def workers(self):
+        return self._workers or transcode_setting('WORKERS')
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def transcode(self, source, format_type='mp3', cancelled=None, acodec=None):
+        """Convert a downloaded file to format_type next to it and return the new path.
+
+        A source already in the format's codec (acodec, as yt-dlp reports
+        it) is only remuxed, without taking a slot. Anything else is encoded
+        in a slot. cancelled is polled while waiting for a slot and while
+        ffmpeg runs; once it returns True ffmpeg is killed and JobCancelled
+        raised.
+        """
+        cancelled = cancelled or (lambda: False)
+        spec = COPY_FORMATS.get(format_type) or TRANSCODE_FORMATS[format_type]
+        target = os.path.splitext(source)[0] + f'.{format_type}'
+        if can_copy(format_type, acodec):
+            if source != target:
+                self._convert(source, target, spec['muxer'], ['-codec:a', 'copy'], cancelled)
+            return target
+
+        self._count(waiting=1)
+        queued_at = time.monotonic()
+        try:
+            slot = self.slots.acquire(cancelled=cancelled)
+        except JobCancelled:
+            self._count(waiting=-1)
+            raise
+        started_at = time.monotonic()
+        self._count(waiting=-1, running=1, wait_seconds=started_at - queued_at)
+        try:
+            self._convert(
+                source, target, spec['muxer'],
+                ['-threads', '1', '-codec:a', spec['codec'], '-b:a', spec['bitrate']], cancelled,
+            )
+        except Exception:
+            self._count(failed=1)
+            raise
+        else:
+            self._count(completed=1)
+        finally:
+            self._count(running=-1, run_seconds=time.monotonic() - started_at)
+            self.slots.release(slot)
+        return target
+
+    def _convert(self, source, target, muxer, codec_args, cancelled):
+        """Run one ffmpeg conversion into target, replacing source"""
+        partial = target + '.part'
+        command = [
+            transcode_setting('FFMPEG'), '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+            '-i', source, '-vn', *codec_args, '-f', muxer, partial,
+        ]
+        try:
+            self._run(command, cancelled)
+            os.replace(partial, target)
+        except subprocess.CalledProcessError as e:
+            raise PostProcessingFailure(f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()[-500:]}")
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        if source != target:
+            os.remove(source)
+
+    def _run(self, command, cancelled):
+        """subprocess.run(check=True, timeout=TIMEOUT) that also stops on cancellation"""
+        deadline = time.monotonic() + transcode_setting('TIMEOUT')
+        with subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) as proc:
+            while True:
+                if cancelled():
+                    proc.kill()
+                    proc.wait()
+                    raise JobCancelled("Transcode cancelled")
+                try:
+                    _, stderr = proc.communicate(timeout=CANCEL_POLL_INTERVAL)
+                    break
+                except subprocess.TimeoutExpired:
+                    if time.monotonic() > deadline:
+                        proc.kill()
+                        proc.wait()
+                        raise
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, command, stderr=stderr)
+
+    def stats(self):
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                'workers': self.workers,
+                'waiting': self.waiting,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_wait_seconds': round(self.wait_seconds / done, 2) if done else 0,
+                'avg_run_seconds': round(self.run_seconds / done, 2) if done else 0,
+            }
+
+
+transcode_pool = TranscodePool()
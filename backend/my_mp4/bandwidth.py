@@ -0,0 +1,248 @@
+import logging
+import math
+import os
+import threading
+
+from django.conf import settings
+
+from .slots import HostSlots
+
+logger = logging.getLogger(__name__)
+
+BANDWIDTH_DEFAULTS = {
+    # Concurrent download connections for the whole host, across all jobs
+    # and worker processes
+    'MAX_CONNECTIONS': 16,
+    # Parallel fragment downloads a single job may get
+    'MAX_PER_JOB': 8,
+    # Ask for one more connection per this many expected bytes
+    'BYTES_PER_CONNECTION': 32 * 1024 ** 2,
+    # Host uplink budget in bytes/s, shared out by connection; None for no limit
+    'UPLINK_BPS': None,
+    # http_chunk_size bounds, and how many seconds of transfer a chunk should cover
+    'MIN_CHUNK_SIZE': 1024 ** 2,
+    'MAX_CHUNK_SIZE': 10 * 1024 ** 2,
+    'CHUNK_SECONDS': 5,
+    # Slot lock files shared by every worker process on the host
+    'LOCK_DIR': os.path.join(settings.BASE_DIR, '.bandwidth-slots'),
+    # Seconds a job waits for a free connection before the attempt fails
+    # (transient, so it is retried later)
+    'WAIT_TIMEOUT': 300,
+}
+
+# Rough bitrates (bits/s) used to size a job before yt-dlp has picked a format
+ESTIMATED_BITRATES = {
+    'mp4': 2_500_000,
+    'audio': 160_000,
+}
+
+# Protocols yt-dlp downloads fragment by fragment, the only ones that can use
+# concurrent_fragment_downloads. Progressive HTTPS files take one connection.
+FRAGMENTED_PROTOCOLS = ('http_dash_segments', 'dash_frag_urls', 'm3u8_native', 'm3u8', 'ism', 'f4m')
+
+# Weight of the newest sample in the per-connection throughput average
+THROUGHPUT_SMOOTHING = 0.3
+
+
+def bandwidth_setting(name):
+    """Read a BANDWIDTH setting, falling back to the defaults"""
+    return getattr(settings, 'BANDWIDTH', {}).get(name, BANDWIDTH_DEFAULTS[name])
+
+
+def expected_size(raw_info, format_type, clip=None):
+    """Best guess at a job's download size in bytes, or None"""
+    if not raw_info:
+        return None
+    duration = raw_info.get('duration')
+    if not duration:
+        return None
+    if clip:
+        duration = max(min(clip[1], duration) - clip[0], 0)
+    bitrate = ESTIMATED_BITRATES['mp4' if format_type == 'mp4' else 'audio']
+    return int(duration * bitrate / 8)
+
+
+def format_demand(info):
+    """(size in bytes or None, fragmented) of the format(s) yt-dlp chose for an info dict"""
+    formats = info.get('requested_formats') or [info]
+    sizes = [f.get('filesize') or f.get('filesize_approx') for f in formats]
+    # Clip sections are cut by ffmpeg, one connection per stream
+    sectioned = info.get('section_start') is not None or info.get('section_end') is not None
+    fragmented = not sectioned and any(
+        f.get('fragments') or f.get('protocol') in FRAGMENTED_PROTOCOLS for f in formats
+    )
+    return (sum(sizes) if all(sizes) else None), fragmented
+
+
+class Grant:
+    """Connections handed to one job, and what it measured while using them"""
+
+    def __init__(self, budget, slots, chunk_size, ratelimit):
+        self.budget = budget
+        self.slots = slots
+        self.connections = len(slots)
+        self.chunk_size = chunk_size
+        self.ratelimit = ratelimit
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def ydl_params(self):
+        return {
+            'concurrent_fragment_downloads': self.connections,
+            'http_chunk_size': self.chunk_size,
+            'ratelimit': self.ratelimit,
+        }
+
+    def observe(self, d):
+        """Progress hook: collect size and time of each finished file"""
+        if d.get('status') == 'finished':
+            self.bytes += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            self.seconds += d.get('elapsed') or 0
+
+    def release(self):
+        if self.slots:
+            self.budget.release(self)
+            self.slots = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class FormatGrant:
+    """A job's grant, allocated once yt-dlp has chosen the format.
+
+    Called as the YoutubeDL format hook (see YDLPool.acquire) with the info
+    dict about to be downloaded; returns the ydl params of the grant. Until
+    then the job holds no connection at all.
+    """
+
+    def __init__(self, budget, format_type, clip=None, cancelled=None):
+        self.budget = budget
+        self.format_type = format_type
+        self.clip = clip
+        self.cancelled = cancelled
+        self.grant = None
+
+    def __call__(self, info):
+        if self.grant is None:
+            size, fragmented = format_demand(info)
+            if size is None:
+                size = expected_size(info, self.format_type, self.clip)
+            self.grant = self.budget.allocate(size, fragmented, cancelled=self.cancelled)
+            logger.debug("%d connections for format %s", self.grant.connections, info.get('format_id'))
+        return self.grant.ydl_params()
+
+    @property
+    def connections(self):
+        return self.grant.connections if self.grant else 0
+
+    def observe(self, d):
+        if self.grant is not None:
+            self.grant.observe(d)
+
+    def release(self):
+        if self.grant is not None:
+            self.grant.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class BandwidthBudget:
+    """Shares the host's download connections and uplink between jobs.
+
+    Connections are granted once the format is known (FormatGrant). A
+    progressive file gets exactly one; a fragmented (DASH/HLS) one asks for
+    connections in proportion to its expected size. It gets
+    what is free right now, never fewer than one, and never more than the
+    measured per-connection throughput says the uplink can use. Connections
+    are HostSlots, so MAX_CONNECTIONS holds across every worker process.
+    """
+
+    def __init__(self):
+        self.slots = HostSlots(
+            lambda: bandwidth_setting('LOCK_DIR'),
+            lambda: bandwidth_setting('MAX_CONNECTIONS'),
+        )
+        self._lock = threading.Lock()
+        self.connection_bps = None
+        self.granted = 0
+        self.jobs = 0
+
+    def wanted(self, expected_bytes, fragmented=True):
+        """Connections a job of this size would like"""
+        if not fragmented:
+            # yt-dlp fetches a single file over one connection
+            return 1
+        max_per_job = bandwidth_setting('MAX_PER_JOB')
+        if expected_bytes is None:
+            wanted = max(max_per_job // 2, 1)
+        else:
+            wanted = math.ceil(expected_bytes / bandwidth_setting('BYTES_PER_CONNECTION'))
+
+        # More connections than the uplink can feed only add request overhead
+        uplink = bandwidth_setting('UPLINK_BPS')
+        if uplink and self.connection_bps:
+            wanted = min(wanted, math.ceil(uplink / self.connection_bps))
+        return max(1, min(wanted, max_per_job))
+
+    def chunk_size(self):
+        """Chunk covering CHUNK_SECONDS at the measured per-connection rate"""
+        largest = bandwidth_setting('MAX_CHUNK_SIZE')
+        if not self.connection_bps:
+            return largest
+        size = int(self.connection_bps * bandwidth_setting('CHUNK_SECONDS'))
+        return max(bandwidth_setting('MIN_CHUNK_SIZE'), min(size, largest))
+
+    def allocate(self, expected_bytes=None, fragmented=True, cancelled=None):
+        """Reserve connections for a job; blocks while the host is at its cap.
+
+        cancelled is polled while blocked and the wait is bounded by
+        WAIT_TIMEOUT, see HostSlots.acquire.
+        """
+        slots = self.slots.acquire(
+            minimum=1, maximum=self.wanted(expected_bytes, fragmented),
+            cancelled=cancelled, timeout=bandwidth_setting('WAIT_TIMEOUT'),
+        )
+
+        uplink = bandwidth_setting('UPLINK_BPS')
+        ratelimit = None
+        if uplink:
+            # Each connection's share of the uplink, so the sum stays in budget
+            ratelimit = int(uplink * len(slots) / self.slots.size)
+
+        with self._lock:
+            self.granted += len(slots)
+            self.jobs += 1
+        return Grant(self, slots, self.chunk_size(), ratelimit)
+
+    def release(self, grant):
+        self.slots.release(grant.slots)
+        with self._lock:
+            self.granted -= grant.connections
+            self.jobs -= 1
+            if grant.bytes and grant.seconds > 0:
+                sample = grant.bytes / grant.seconds / grant.connections
+                if self.connection_bps is None:
+                    self.connection_bps = sample
+                else:
+                    self.connection_bps += THROUGHPUT_SMOOTHING * (sample - self.connection_bps)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_connections': self.slots.size,
+                'connections': self.granted,
+                'jobs': self.jobs,
+                'connection_bps': round(self.connection_bps) if self.connection_bps else None,
+                'chunk_size': self.chunk_size(),
+            }
+
+
+bandwidth_budget = BandwidthBudget()
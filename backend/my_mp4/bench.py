@@ -0,0 +1,321 @@
+"""Offline end-to-end throughput benchmark, see `manage.py bench_downloads`.
+
+A local HTTP origin serves synthetic media. Each benchmark video gets a
+YouTube-style ID whose unprocessed info dict, pointing at the origin, is
+put in the metadata cache, so the download path runs exactly as for a
+metadata-cache hit: format selection, yt-dlp's HTTP downloader, storage
+commit and the result cache, without touching the network. Jobs are driven
+through the real views (start_download, check_status, download_file) by
+the Django test client at a configurable concurrency.
+"""
+import json
+import math
+import os
+import re
+import resource
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.test import Client
+
+from .metacache import info_key, metadata_cache
+from .metrics import STAGES
+from .models import DownloadRequest
+
+# Client-side stages of one job, next to the server-side ones in metrics.STAGES
+CLIENT_STAGES = ('submit', 'wait', 'fetch', 'total')
+
+# Host the test client sends; must be in ALLOWED_HOSTS
+CLIENT_HOST = 'localhost'
+
+RANGE_HEADER = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+class MediaOrigin:
+    """Threaded HTTP server that plays the part of YouTube's media servers.
+
+    Every path returns the same random payload, with Range support and an
+    optional per-connection rate limit.
+    """
+
+    def __init__(self, size, rate=None):
+        self.payload = os.urandom(size)
+        self.rate = rate
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def _handler(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def respond(self, send_body):
+                payload = origin.payload
+                start, end = 0, len(payload) - 1
+                match = RANGE_HEADER.fullmatch(self.headers.get('Range', ''))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2) or end), end)
+                    else:
+                        start = max(len(payload) - int(match.group(2)), 0)
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+                if send_body:
+                    origin.send(self.wfile, memoryview(payload)[start:end + 1])
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def send(self, wfile, body):
+        chunk = 64 * 1024
+        for offset in range(0, len(body), chunk):
+            part = body[offset:offset + chunk]
+            wfile.write(part)
+            with self._lock:
+                self.bytes_sent += len(part)
+            if self.rate:
+                time.sleep(len(part) / self.rate)
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever, name='bench-origin')
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def synthetic_info(video_id, origin, size, duration):
+    """Unprocessed info dict like the YouTube extractor returns, served by the origin"""
+    return {
+        'id': video_id,
+        'title': f'Benchmark {video_id}',
+        'duration': duration,
+        'thumbnail': None,
+        'extractor': 'youtube',
+        'extractor_key': 'Youtube',
+        'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+        'formats': [
+            {
+                'format_id': '18',
+                'url': f'{origin.base_url}/{video_id}.mp4',
+                'ext': 'mp4',
+                'width': 1280,
+                'height': 720,
+                'vcodec': 'avc1.64001F',
+                'acodec': 'mp4a.40.2',
+                'filesize': size,
+            },
+            {
+                'format_id': '140',
+                'url': f'{origin.base_url}/{video_id}.m4a',
+                'ext': 'm4a',
+                'vcodec': 'none',
+                'acodec': 'mp4a.40.2',
+                'filesize': size,
+            },
+        ],
+    }
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile, None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    p50, p99 = percentile(values, 0.5), percentile(values, 0.99)
+    return {
+        'count': len(values),
+        'p50': round(p50, 4) if p50 is not None else None,
+        'p99': round(p99, 4) if p99 is not None else None,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its largest child (ru_maxrss is KiB on Linux)"""
+    return {
+        'process': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+class Benchmark:
+    def __init__(self, jobs=20, concurrency=4, videos=None, size=2 * 1024 ** 2, format_type='mp4',
+                 origin_rate=None, poll_interval=0.05, timeout=120):
+        self.jobs = jobs
+        self.concurrency = concurrency
+        self.videos = videos or jobs
+        self.size = size
+        self.format_type = format_type
+        self.origin_rate = origin_rate
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        # A fresh ID prefix per run, so earlier runs' results are never cache hits
+        self.run_id = secrets.token_hex(2)
+        self.device_id = f'bench-{self.run_id}'
+        self._local = threading.local()
+
+    def video_id(self, index):
+        return f'b{self.run_id}{index % self.videos:06d}'
+
+    def client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(HTTP_HOST=CLIENT_HOST)
+        return client
+
+    def seed(self, origin, client_types):
+        for index in range(self.videos):
+            video_id = self.video_id(index)
+            info = synthetic_info(video_id, origin, self.size, duration=60)
+            for client_type in client_types:
+                metadata_cache.set(info_key(video_id, client_type), info)
+
+    def run_job(self, index):
+        """Submit one download, wait for it and fetch the file; returns its timings"""
+        client = self.client()
+        video_id = self.video_id(index)
+        started = time.perf_counter()
+
+        response = client.post('/api/download/', data=json.dumps({
+            'url': f'https://www.youtube.com/watch?v={video_id}',
+            'format': self.format_type,
+            # One device per job, so the per-device admission cap never applies
+            'device_id': f'{self.device_id}-{index}',
+        }), content_type='application/json')
+        submitted = time.perf_counter()
+        data = response.json()
+        if response.status_code != 200:
+            return {'error': data.get('error', response.status_code)}
+        request_id = data['request_id']
+
+        deadline = submitted + self.timeout
+        while True:
+            status = client.get(f'/api/status/{request_id}/').json()
+            if status['status'] in ('completed', 'failed') or time.perf_counter() > deadline:
+                break
+            time.sleep(self.poll_interval)
+        finished = time.perf_counter()
+        if status['status'] != 'completed':
+            return {'request_id': request_id, 'error': status.get('error', 'timed out')}
+
+        response = client.get('/api/download-file/?' + urlencode({'path': status['file_path']}))
+        fetched_bytes = sum(len(chunk) for chunk in response.streaming_content)
+        done = time.perf_counter()
+
+        return {
+            'request_id': request_id,
+            'bytes': fetched_bytes,
+            'submit': submitted - started,
+            'wait': finished - submitted,
+            'fetch': done - finished,
+            'total': done - started,
+        }
+
+    def run(self, client_types):
+        origin = MediaOrigin(self.size, self.origin_rate)
+        origin.start()
+        try:
+            self.seed(origin, client_types)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(self.concurrency, thread_name_prefix='bench') as pool:
+                results = list(pool.map(self.run_job, range(self.jobs)))
+            wall = time.perf_counter() - started
+        finally:
+            origin.stop()
+        return self.report(results, wall, origin.bytes_sent)
+
+    def report(self, results, wall, origin_bytes):
+        ok = [result for result in results if 'error' not in result]
+        timings = dict(
+            DownloadRequest.objects.filter(id__in=[result['request_id'] for result in ok])
+            .values_list('id', 'timings')
+        )
+        latency = {stage: summarize([result[stage] for result in ok]) for stage in CLIENT_STAGES}
+        for stage in STAGES:
+            latency[stage] = summarize([
+                timings[result['request_id']][stage]
+                for result in ok if stage in (timings.get(result['request_id']) or {})
+            ])
+
+        errors = {}
+        for result in results:
+            if 'error' in result:
+                errors[str(result['error'])] = errors.get(str(result['error']), 0) + 1
+
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'config': {
+                'engine': getattr(settings, 'DOWNLOAD_ENGINE', 'threads'),
+                'jobs': self.jobs,
+                'concurrency': self.concurrency,
+                'videos': self.videos,
+                'size': self.size,
+                'format': self.format_type,
+                'origin_rate': self.origin_rate,
+            },
+            'completed': len(ok),
+            'failed': len(results) - len(ok),
+            'errors': errors,
+            'wall_seconds': round(wall, 3),
+            'jobs_per_second': round(len(ok) / wall, 3) if wall else None,
+            'served_bytes_per_second': round(sum(result['bytes'] for result in ok) / wall) if wall else None,
+            'origin_bytes_per_second': round(origin_bytes / wall) if wall else None,
+            'latency': latency,
+            'rss_mb': peak_rss_mb(),
+        }
+
+
+def compare(baseline, current):
+    """Rows of (metric, baseline, current, change %) for a regression check"""
+    rows = []
+    for metric in ('jobs_per_second', 'served_bytes_per_second', 'origin_bytes_per_second'):
+        rows.append((metric, baseline.get(metric), current.get(metric)))
+    for stage, current_stats in current['latency'].items():
+        baseline_stats = baseline.get('latency', {}).get(stage, {})
+        for name in ('p50', 'p99'):
+            rows.append((f'{stage} {name}', baseline_stats.get(name), current_stats.get(name)))
+    for name, value in current['rss_mb'].items():
+        rows.append((f'rss {name} MB', baseline.get('rss_mb', {}).get(name), value))
+
+    table = []
+    for metric, before, after in rows:
+        change = None
+        if before and after is not None:
+            change = round((after - before) / before * 100, 1)
+        table.append((metric, before, after, change))
+    return table
@@ -0,0 +1,127 @@
+import hashlib
+import os
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .clips import clip_label, clip_of
+from .models import DownloadRequest, MediaArtifact
+
+# Quality profile each format is produced with. Part of the cache key, so a
+# change to the yt-dlp options for a format must bump its profile.
+QUALITY_PROFILES = {
+    'mp4': '720p',
+    'mp3': '192k',
+    # Stream copies keep whatever the source audio was
+    'm4a': 'copy',
+    'opus': 'copy',
+}
+
+
+def quality_for(format_type, clip=None):
+    """Quality profile a format is produced with, narrowed to a clip if one was asked for"""
+    quality = QUALITY_PROFILES.get(format_type, 'default')
+    if clip:
+        quality = f"{quality}@{clip_label(clip)}"
+    return quality
+
+
+def request_quality(download_request):
+    """Quality profile of the result a request asks for"""
+    return quality_for(download_request.format_choice, clip_of(download_request))
+
+
+def artifact_key(video_id, format_type, quality=None):
+    """Content address for a (video, format, quality) result"""
+    quality = quality or quality_for(format_type)
+    return hashlib.sha256(f"{video_id}|{format_type}|{quality}".encode()).hexdigest()
+
+
+def lookup(video_id, format_type, quality=None):
+    """Return the ready artifact for a video and format, or None"""
+    if not video_id:
+        return None
+
+    artifact = MediaArtifact.objects.filter(
+        cache_key=artifact_key(video_id, format_type, quality)
+    ).first()
+    if artifact is None:
+        return None
+
+    # The file may have been removed behind our back
+    if not os.path.exists(artifact.file_path):
+        DownloadRequest.objects.filter(file_path=artifact.file_path).update(file_exists=False)
+        artifact.delete()
+        return None
+
+    return artifact
+
+
+def attach(download_request, artifact):
+    """Complete a request by pointing it at an existing artifact"""
+    with transaction.atomic():
+        MediaArtifact.objects.filter(id=artifact.id).update(
+            ref_count=F('ref_count') + 1,
+            last_used_at=timezone.now(),
+        )
+        download_request.artifact = artifact
+        download_request.status = 'completed'
+        download_request.file_path = artifact.file_path
+        download_request.file_size = artifact.file_size
+        download_request.file_exists = True
+        download_request.video_title = artifact.video_title
+        download_request.video_thumbnail = artifact.video_thumbnail
+        download_request.video_duration = artifact.video_duration
+        download_request.save()
+    return download_request
+
+
+def store(download_request, video_id, info, filename):
+    """Register a freshly downloaded file and attach the request to it"""
+    if not video_id:
+        return None
+
+    format_type = download_request.format_choice
+    quality = request_quality(download_request)
+    try:
+        with transaction.atomic():
+            artifact = MediaArtifact.objects.create(
+                cache_key=artifact_key(video_id, format_type, quality),
+                video_id=video_id,
+                format_choice=format_type,
+                quality=quality,
+                file_path=filename,
+                file_size=os.path.getsize(filename),
+                video_title=info.get('title', 'Unknown Title'),
+                video_thumbnail=info.get('thumbnail', ''),
+                video_duration=info.get('duration', 0) or 0,
+            )
+    except IntegrityError:
+        # Another job finished the same video first, share its file
+        artifact = MediaArtifact.objects.get(cache_key=artifact_key(video_id, format_type, quality))
+        if artifact.file_path != filename and os.path.exists(filename):
+            os.remove(filename)
+
+    return attach(download_request, artifact)
+
+
+def release(download_request):
+    """Drop a request's reference; return True when its file is no longer used"""
+    artifact_id = download_request.artifact_id
+    if artifact_id is None:
+        if not download_request.file_path:
+            return False
+        # Not cached, the file belongs to this request alone unless another row points at it
+        return not DownloadRequest.objects.filter(file_path=download_request.file_path).exclude(
+            id=download_request.id
+        ).exists()
+
+    with transaction.atomic():
+        MediaArtifact.objects.filter(id=artifact_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        artifact = MediaArtifact.objects.select_for_update().get(id=artifact_id)
+        if artifact.ref_count > 0:
+            return False
+        artifact.delete()
+    return True
+
@@ -0,0 +1,60 @@
+import math
+
+
+def to_seconds(value):
+    """Seconds from a number or a '90' / '1:30' / '1h2m' string"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = float(value)
+    else:
+        from yt_dlp.utils import parse_duration
+        seconds = parse_duration(str(value))
+    if seconds is None or math.isnan(seconds):
+        raise ValueError(f"Invalid time: {value}")
+    return float(seconds)
+
+
+def parse_clip(start=None, end=None):
+    """(start, end) in seconds for a requested time range, or None for the whole video.
+
+    A missing end runs to the end of the video.
+    """
+    if start in (None, '') and end in (None, ''):
+        return None
+    start = to_seconds(start) if start not in (None, '') else 0.0
+    end = to_seconds(end) if end not in (None, '') else math.inf
+    if start < 0:
+        raise ValueError("Clip start cannot be negative")
+    if end <= start:
+        raise ValueError("Clip end must be after its start")
+    if start == 0 and end == math.inf:
+        return None
+    return start, end
+
+
+def clip_of(download_request):
+    """The time range a request asked for, or None"""
+    if download_request.clip_start is None and download_request.clip_end is None:
+        return None
+    start = download_request.clip_start or 0.0
+    end = download_request.clip_end if download_request.clip_end is not None else math.inf
+    return start, end
+
+
+def clip_label(clip):
+    """Compact text form used in cache keys and file names"""
+    start, end = clip
+    return f"{start:g}-{end:g}"
+
+
+def clip_ydl_params(clip):
+    """yt-dlp params that fetch only the clip.
+
+    Section downloads ask the server for just the fragments (DASH/HLS) or the
+    byte ranges ffmpeg seeks to. Cuts are left on keyframes so the streams are
+    copied, not re-encoded.
+    """
+    from yt_dlp.utils import download_range_func
+    return {
+        'download_ranges': download_range_func(None, [clip]),
+        'force_keyframes_at_cuts': False,
+    }
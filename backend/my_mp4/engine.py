@@ -0,0 +1,356 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import services, storage
+from .bandwidth import FormatGrant, bandwidth_budget
+from .clips import clip_of
+from .errors import TransientError, from_kind
+from .jobs import JobQueue, lane_for, queue_setting, recover_stale_jobs
+from .metacache import cached_raw_info
+from .logs import log_context
+from .metrics import StageClock
+from .ydl_pool import pool_setting
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cancelled child gets to exit before it is killed
+TERMINATE_TIMEOUT = 5
+
+# Children may print long JSON lines (info dicts); raise asyncio's 64 KiB default
+STREAM_LIMIT = 4 * 1024 * 1024
+
+
+async def run_sync(func, *args):
+    """Run blocking ORM/filesystem work off the event loop"""
+    def call():
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return await asyncio.to_thread(call)
+
+
+async def run_sync_to_end(func, *args):
+    """run_sync that, when cancelled, still waits for the thread to return.
+
+    The thread cannot be interrupted; it has to notice the job's cancelled
+    flag and stop on its own before the job may be cleaned up.
+    """
+    future = asyncio.ensure_future(run_sync(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        try:
+            await future
+        except Exception:
+            pass
+        raise
+
+
+class ProgressWriter:
+    """Forwards one job's progress events to blocking hooks off the event loop.
+
+    The progress store write (SQLite or Redis) and the observers run in a
+    thread, one batch at a time per job. 'downloading' ticks that arrive
+    while a batch is being written replace each other, so a slow store
+    delays progress instead of stalling every other job on the loop.
+    """
+
+    def __init__(self, hook):
+        self.hook = hook
+        self.pending = []
+        self.task = None
+
+    def put(self, event):
+        if event.get('status') == 'downloading' and self.pending and self.pending[-1].get('status') == 'downloading':
+            self.pending[-1] = event
+        else:
+            self.pending.append(event)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self):
+        try:
+            while self.pending:
+                events, self.pending = self.pending, []
+                await run_sync(self._write, events)
+        finally:
+            self.task = None
+
+    def _write(self, events):
+        for event in events:
+            try:
+                self.hook(event)
+            except Exception as e:
+                logger.warning("Progress update failed: %s", e)
+
+    async def flush(self, discard=False):
+        """Wait until queued events are written; with discard, drop the unwritten ones"""
+        if discard:
+            self.pending.clear()
+        if self.task is not None:
+            await asyncio.shield(self.task)
+
+
+class AsyncJobQueue(JobQueue):
+    """Job queue whose downloads are yt-dlp child processes supervised by one event loop.
+
+    Claiming, heartbeats and crash recovery are shared with JobQueue; what
+    changes is that a running job costs a coroutine instead of a thread,
+    and a job can be cancelled by terminating its child process. The price
+    is a fresh interpreter, yt-dlp import and YoutubeDL per attempt, with
+    none of the YDLPool's warm instances or keep-alive connections; only
+    the on-disk player cache (YTDLP_POOL['CACHE_DIR']) is shared.
+    """
+
+    def __init__(self, emulator, progress_hook, finish):
+        super().__init__(handler=None)
+        self.emulator = emulator
+        self.progress_hook = progress_hook
+        self.finish = finish
+        self.loop = None
+        self._tasks = {}
+
+    def start(self):
+        """Start the event loop thread, lane dispatchers and heartbeat once per process"""
+        # Held until the loop runs, so concurrent first submits never see it missing
+        with self._lock:
+            if self._started and self._pid == os.getpid():
+                return
+
+            try:
+                recover_stale_jobs()
+            except Exception as e:
+                logger.warning("Job recovery failed: %s", e)
+
+            self.loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            thread = threading.Thread(target=self._run_loop, args=(ready,), name="download-engine")
+            thread.daemon = True
+            thread.start()
+            ready.wait()
+
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name="download-heartbeat")
+            heartbeat.daemon = True
+            heartbeat.start()
+
+            self._started = True
+            self._pid = os.getpid()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self.loop)
+        # One per lane, so a lane finding nothing never clears another's wakeup
+        self._wakeups = {}
+        for lane, workers in queue_setting('LANES').items():
+            self._active[lane] = 0
+            self._wakeups[lane] = asyncio.Event()
+            self.loop.create_task(self._dispatch(lane, workers))
+        ready.set()
+        self.loop.run_forever()
+
+    def submit(self, download_request):
+        """Wake the dispatchers for a freshly queued request"""
+        if not services.enabled():
+            # Workers run elsewhere and pick it up on their next poll
+            return
+        self.start()
+        wakeup = self._wakeups.get(lane_for(download_request.format_choice))
+        if wakeup is not None:
+            self.loop.call_soon_threadsafe(wakeup.set)
+
+    def cancel(self, request_id):
+        """Stop a running job of this process; True if it was running here.
+
+        Cancelling the task terminates the yt-dlp child; the flag also stops
+        post-processing, which runs in a thread.
+        """
+        with self._lock:
+            task = self._tasks.get(request_id)
+            if task is None or self.loop is None or request_id not in self._running:
+                return False
+            if request_id in self._cancelled:
+                # Already stopping, never interrupt its clean-up
+                return True
+            self._cancelled.add(request_id)
+        self.loop.call_soon_threadsafe(task.cancel)
+        return True
+
+    async def _dispatch(self, lane, workers):
+        slots = asyncio.Semaphore(workers)
+        wakeup = self._wakeups[lane]
+        while True:
+            await slots.acquire()
+            # Cleared before claiming, so a submit during the claim is not lost
+            wakeup.clear()
+            try:
+                job = await run_sync(self.claim, lane)
+            except Exception as e:
+                logger.warning("Job claim failed: %s", e)
+                job = None
+
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), queue_setting('POLL_INTERVAL'))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run_job(lane, job))
+            self._tasks[job.id] = task
+            task.add_done_callback(lambda _t, job_id=job.id: (slots.release(), self._tasks.pop(job_id, None)))
+
+    async def _run_job(self, lane, job):
+        self._active[lane] += 1
+        self._running.add(job.id)
+        status = 'failed'
+        with log_context(request_id=job.id, video_id=self.emulator.extract_video_id(job.url)):
+            try:
+                status = await self._download(job)
+            except asyncio.CancelledError:
+                logger.info("Job cancelled")
+                status = 'cancelled'
+            except Exception:
+                logger.exception("Job crashed")
+            finally:
+                self._active[lane] -= 1
+                self._running.discard(job.id)
+                try:
+                    await run_sync(self.finish, job, status)
+                except Exception:
+                    logger.exception("Finishing job failed")
+                finally:
+                    with self._lock:
+                        self._cancelled.discard(job.id)
+
+    async def _download(self, job):
+        """Make one attempt in a child process with the job's next client emulation.
+
+        Returns the job's new status, like YouTubeClientEmulator.download_as_client.
+        """
+        emulator = self.emulator
+        url = emulator.single_video_url(job.url)
+        video_id = emulator.extract_video_id(url)
+        client_type, attempt = emulator.next_client(url, job)
+        if client_type is None:
+            await run_sync(emulator.fail_download, job, TransientError("All client emulations failed"))
+            return 'failed'
+
+        clock = StageClock(job.timings)
+        try:
+            return await self._attempt(job, url, video_id, client_type, attempt, clock)
+        finally:
+            clock.stop()
+
+    async def _attempt(self, job, url, video_id, client_type, attempt, clock):
+        emulator = self.emulator
+        await run_sync(emulator.start_attempt, job, attempt, client_type)
+        opts = emulator.create_authentic_ydl_opts(None, job.format_choice, client_type)
+        opts['outtmpl'] = storage.incoming_template(job.id)
+        # Player JS and signature solutions are shared with the in-process pool on disk
+        opts['cachedir'] = pool_setting('CACHE_DIR')
+        raw_info = cached_raw_info(video_id, client_type)
+        payload = {
+            'url': url,
+            'opts': opts,
+            'raw_info': raw_info,
+        }
+        clip = clip_of(job)
+        if clip:
+            payload['sections'] = [list(clip)]
+
+        # Connections from the host-wide budget, sized once the child has chosen the format
+        grant = FormatGrant(
+            bandwidth_budget, job.format_choice, clip, cancelled=lambda: self.is_cancelled(job.id),
+        )
+        try:
+            with grant:
+                result = await self._run_child(
+                    job, payload,
+                    observe=lambda d: (grant.observe(d), clock.observe(d)),
+                    # The wait for connections stops at the job's cancelled flag
+                    on_format=lambda info: run_sync_to_end(grant, info),
+                )
+        except Exception as e:
+            # e.g. no connection came free within BANDWIDTH['WAIT_TIMEOUT']
+            return await run_sync(emulator.attempt_failed, job, url, client_type, e)
+
+        if result.get('event') == 'done':
+            clock.switch('postprocess')
+            try:
+                # Post-processing stops at the job's cancelled flag, see JobQueue.cancel
+                await run_sync_to_end(
+                    emulator.complete_download,
+                    job, url, job.format_choice, result['info'], result['filename'], client_type, clock,
+                )
+                return 'completed'
+            except Exception as e:
+                error = e
+        else:
+            # The child classified its own error, only the kind crosses the pipe
+            error = from_kind(result.get('kind'), result.get('message', 'yt-dlp exited without a result'))
+
+        return await run_sync(emulator.attempt_failed, job, url, client_type, error)
+
+    async def _run_child(self, job, payload, observe=None, on_format=None):
+        """Run ytdlp_worker for one attempt, forwarding its progress events.
+
+        on_format is awaited with the chosen format's info and returns the
+        ydl params sent back to the child before it downloads.
+        """
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'my_mp4.ytdlp_worker',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=str(settings.BASE_DIR),
+            limit=STREAM_LIMIT,
+        )
+        def forward(event):
+            self.progress_hook(event, job.id)
+            if observe is not None:
+                observe(event)
+
+        result = {}
+        progress = ProgressWriter(forward)
+        try:
+            proc.stdin.write(json.dumps(payload).encode() + b'\n')
+            await proc.stdin.drain()
+
+            async for line in proc.stdout:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get('event') == 'format':
+                    params = await on_format(event['info']) if on_format is not None else {}
+                    proc.stdin.write(json.dumps(params).encode() + b'\n')
+                    await proc.stdin.drain()
+                elif event.get('event') == 'progress':
+                    progress.put(event)
+                else:
+                    result = event
+
+            await proc.wait()
+            # Observers have seen every finished file before the grant is released
+            await progress.flush()
+            return result
+        finally:
+            proc.stdin.close()
+            if proc.returncode is None:
+                # Cancelled: stop the child and reap it
+                proc.terminate()
+                try:
+                    await asyncio.wait_for(proc.wait(), TERMINATE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+                # A late tick must not overwrite the status the job ends with
+                await progress.flush(discard=True)
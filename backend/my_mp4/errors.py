@@ -0,0 +1,123 @@
+"""Why a download failed, and whether trying again can help.
+
+Kept free of Django so the yt-dlp child process (ytdlp_worker.py) can
+classify its own errors and report just the kind to the parent. yt-dlp
+itself is only imported once there is an error to classify.
+"""
+import errno
+import re
+
+PERMANENT = 'permanent'
+TRANSIENT = 'transient'
+POSTPROCESSING = 'postprocessing'
+DISK_FULL = 'disk_full'
+
+# YouTube/yt-dlp messages for videos no client emulation can fetch
+PERMANENT_MESSAGES = re.compile('|'.join([
+    r'Private video',
+    r'Video unavailable',
+    r'This video is (?:no longer available|unavailable)',
+    r'This video has been removed',
+    r'account associated with this video has been terminated',
+    r'not (?:made this video )?available in your country',
+    r'blocked it in your country',
+    r'copyright',
+    r'members-only|Join this channel',
+    r'This live event will begin|Premieres in',
+    r'Unsupported URL',
+    r'Incomplete YouTube ID',
+]), re.IGNORECASE)
+
+# Shown to users when the job fails
+MESSAGES = {
+    PERMANENT: 'This video is private, removed or not available in our region',
+    TRANSIENT: 'YouTube client emulation failed - try again in a few minutes',
+    POSTPROCESSING: 'Converting the download failed',
+    DISK_FULL: 'The server is out of storage, try again later',
+}
+
+
+class DownloadFailure(Exception):
+    """A classified download error"""
+    kind = TRANSIENT
+    # Whether another client emulation or a later attempt may succeed
+    retryable = True
+
+    @property
+    def user_message(self):
+        return MESSAGES[self.kind]
+
+
+class PermanentError(DownloadFailure):
+    """Deleted, private, region-locked or otherwise unfetchable video"""
+    kind = PERMANENT
+    retryable = False
+
+
+class TransientError(DownloadFailure):
+    """Network trouble, throttling, a client emulation being refused"""
+    kind = TRANSIENT
+
+
+class PostProcessingFailure(DownloadFailure):
+    """ffmpeg could not remux or transcode the download"""
+    kind = POSTPROCESSING
+    retryable = False
+
+
+class DiskFullError(DownloadFailure):
+    kind = DISK_FULL
+    retryable = False
+
+
+class JobCancelled(Exception):
+    """Raised inside a running attempt to abort it once its job was cancelled"""
+
+
+KINDS = {cls.kind: cls for cls in (PermanentError, TransientError, PostProcessingFailure, DiskFullError)}
+
+
+def root_cause(exc):
+    """Unwrap the DownloadError/ExtractorError chain yt-dlp reports through"""
+    from yt_dlp.utils import DownloadError, ExtractorError
+
+    seen = set()
+    while id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, DownloadError) and exc.exc_info and exc.exc_info[1] is not None:
+            exc = exc.exc_info[1]
+        elif isinstance(exc, ExtractorError) and isinstance(exc.cause, BaseException):
+            exc = exc.cause
+        else:
+            break
+    return exc
+
+
+def classify(exc):
+    """Map any exception raised by a download attempt to a DownloadFailure"""
+    if isinstance(exc, DownloadFailure):
+        return exc
+
+    from yt_dlp.utils import GeoRestrictedError, PostProcessingError, UnavailableVideoError, UnsupportedError
+
+    cause = root_cause(exc)
+    message = str(exc)
+
+    if isinstance(cause, OSError) and cause.errno == errno.ENOSPC or 'No space left on device' in message:
+        failure = DiskFullError(message)
+    elif isinstance(cause, PostProcessingError):
+        failure = PostProcessingFailure(message)
+    elif isinstance(cause, (GeoRestrictedError, UnavailableVideoError, UnsupportedError)):
+        failure = PermanentError(message)
+    elif PERMANENT_MESSAGES.search(message):
+        failure = PermanentError(message)
+    else:
+        failure = TransientError(message)
+
+    failure.__cause__ = exc
+    return failure
+
+
+def from_kind(kind, message):
+    """Rebuild a failure reported by the child process"""
+    return KINDS.get(kind, TransientError)(message)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+
+from .errors import MESSAGES as ERROR_MESSAGES
+from .models import DONE, DownloadRequest
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reads of the progress store
+TICK_INTERVAL = 0.5
+
+# Seconds between SSE comments that keep proxies from closing idle streams
+KEEPALIVE_INTERVAL = 15
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def job_snapshot(download_request):
+    """Terminal payload, the same shape check_status returns"""
+    data = {
+        'status': download_request.status,
+        'file_path': download_request.file_path,
+        'progress': 100 if download_request.status == 'completed' else 0,
+        'video_title': download_request.video_title,
+        'video_thumbnail': download_request.video_thumbnail,
+        'format': download_request.format_choice,
+    }
+    if download_request.status == 'failed':
+        data['error'] = ERROR_MESSAGES.get(download_request.error_kind, 'Download failed')
+        data['error_kind'] = download_request.error_kind
+    return data
+
+
+class ProgressBroadcaster:
+    """Fans progress records out to every SSE subscriber in one event loop.
+
+    A single task reads the progress store for all watched jobs once per tick,
+    so the cost grows with the number of active jobs, not with the number of
+    open connections.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self._subscribers = {}
+        self._last_seen = {}
+        self._task = None
+
+    def subscribe(self, request_id):
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(request_id, set()).add(queue)
+        if request_id in self._last_seen:
+            queue.put_nowait(self._last_seen[request_id])
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, request_id, queue):
+        queues = self._subscribers.get(request_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[request_id]
+                self._last_seen.pop(request_id, None)
+
+    async def _poll(self):
+        last_seen = self._last_seen
+        while self._subscribers:
+            request_ids = list(self._subscribers)
+            try:
+                records = await sync_to_async(self.tracker.store.get_many, thread_sensitive=False)(request_ids)
+            except Exception as e:
+                logger.warning("Progress poll failed: %s", e)
+                records = {}
+
+            for request_id in request_ids:
+                record = records.get(request_id)
+                if record is None or record == last_seen.get(request_id):
+                    continue
+                last_seen[request_id] = record
+                for queue in self._subscribers.get(request_id, ()):
+                    queue.put_nowait(record)
+
+            await asyncio.sleep(TICK_INTERVAL)
+
+
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_broadcaster(tracker):
+    """The broadcaster bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    broadcaster = _broadcasters.get(loop)
+    if broadcaster is None:
+        broadcaster = _broadcasters[loop] = ProgressBroadcaster(tracker)
+    return broadcaster
+
+
+async def job_events(tracker, request_id):
+    """Yield SSE frames for a job until it completes, fails or is cancelled.
+
+    Progress records come from the broadcaster. The row is re-read once per
+    poll: it says when the job is over, and which fetch a follower watches,
+    which changes when its leader is cancelled and hands over (flight.hand_over).
+    """
+    get_job = sync_to_async(DownloadRequest.objects.get)
+
+    download_request = await get_job(id=request_id)
+    if download_request.status in DONE:
+        yield format_event(download_request.status, job_snapshot(download_request))
+        return
+
+    # Followers watch the fetch they joined
+    watch_id = download_request.leader_id or request_id
+    broadcaster = get_broadcaster(tracker)
+    queue = broadcaster.subscribe(watch_id)
+    loop = asyncio.get_running_loop()
+    try:
+        yield format_event('progress', {'progress': 0, 'status': download_request.status})
+        last_sent = loop.time()
+        while True:
+            try:
+                records = [await asyncio.wait_for(queue.get(), TICK_INTERVAL)]
+            except asyncio.TimeoutError:
+                records = []
+            while not queue.empty():
+                records.append(queue.get_nowait())
+
+            for record in records:
+                # The end of the job is taken from the row, settled just after
+                if record.get('status') not in DONE:
+                    yield format_event('progress', {
+                        'progress': round(record.get('progress', 0), 1),
+                        'status': record.get('status', 'processing'),
+                    })
+                    last_sent = loop.time()
+
+            download_request = await get_job(id=request_id)
+            if download_request.status in DONE:
+                break
+            leader_id = download_request.leader_id or request_id
+            if leader_id != watch_id:
+                broadcaster.unsubscribe(watch_id, queue)
+                watch_id = leader_id
+                queue = broadcaster.subscribe(watch_id)
+
+            if loop.time() - last_sent >= KEEPALIVE_INTERVAL:
+                yield ": keepalive\n\n"
+                last_sent = loop.time()
+    finally:
+        broadcaster.unsubscribe(watch_id, queue)
+
+    yield format_event(download_request.status, job_snapshot(download_request))
@@ -0,0 +1,107 @@
+from django.db import IntegrityError, transaction
+
+from .models import DownloadRequest
+from . import cache
+
+# Statuses of a leader that is still fetching
+IN_FLIGHT = ('queued', 'processing')
+
+
+def flight_key(video_id, format_type, quality=None):
+    """Key shared by every in-flight request for the same video, format and clip"""
+    return cache.artifact_key(video_id, format_type, quality)
+
+
+def in_flight(video_id, format_type, quality=None):
+    """True if a fetch for this video, format and clip is already running"""
+    if not video_id:
+        return False
+    return DownloadRequest.objects.filter(flight_key=flight_key(video_id, format_type, quality), status__in=IN_FLIGHT).exists()
+
+
+def join_or_lead(download_request, video_id):
+    """Make a queued request lead the fetch for its video, or follow the current leader.
+
+    The leader is whichever row holds the unique flight_key, so the choice is
+    made by the database and holds across worker processes. Returns the
+    leader when the request became a follower, otherwise None; callers only
+    queue the request if it is still 'queued' afterwards.
+    """
+    if not video_id:
+        return None
+
+    quality = cache.request_quality(download_request)
+    key = flight_key(video_id, download_request.format_choice, quality)
+    download_request.video_id = video_id
+    try:
+        with transaction.atomic():
+            download_request.flight_key = key
+            download_request.save(update_fields=['video_id', 'flight_key'])
+        return None
+    except IntegrityError:
+        download_request.flight_key = None
+
+    leader = DownloadRequest.objects.filter(flight_key=key, status__in=IN_FLIGHT).first()
+    if leader is None:
+        # The previous flight is landing, reuse its file or fetch on our own
+        artifact = cache.lookup(video_id, download_request.format_choice, quality)
+        if artifact:
+            cache.attach(download_request, artifact)
+        return None
+
+    download_request.leader = leader
+    download_request.status = 'waiting'
+    download_request.save(update_fields=['video_id', 'leader', 'status'])
+    return leader
+
+
+def land(leader):
+    """Hand the leader's finished artifact to its followers and end the flight.
+
+    A cancelled leader hands the fetch itself to its oldest follower, which
+    is queued and returned; otherwise returns None.
+    """
+    leader.refresh_from_db()
+    if leader.status == 'cancelled':
+        return hand_over(leader)
+    artifact = leader.artifact
+    if artifact is not None:
+        for follower in leader.followers.filter(status='waiting'):
+            cache.attach(follower, artifact)
+    elif leader.status == 'completed':
+        leader.followers.filter(status='waiting').update(
+            status='completed',
+            file_path=leader.file_path,
+            file_size=leader.file_size,
+            file_exists=leader.file_exists,
+            video_title=leader.video_title,
+            video_thumbnail=leader.video_thumbnail,
+            video_duration=leader.video_duration,
+        )
+    else:
+        leader.followers.filter(status='waiting').update(status='failed', error_kind=leader.error_kind)
+
+    DownloadRequest.objects.filter(id=leader.id).update(flight_key=None)
+
+
+def hand_over(leader):
+    """Make the oldest waiting follower of a cancelled leader fetch for the rest"""
+    followers = leader.followers.filter(status='waiting')
+    heir = followers.order_by('created_at', 'id').first()
+    with transaction.atomic():
+        DownloadRequest.objects.filter(id=leader.id).update(flight_key=None)
+        if heir is None:
+            return None
+        followers.exclude(id=heir.id).update(leader=heir)
+        DownloadRequest.objects.filter(id=heir.id).update(status='queued', leader=None, flight_key=leader.flight_key)
+    heir.refresh_from_db()
+    return heir
+
+
+def sweep():
+    """Settle flights whose leader died or was deleted"""
+    for leader in DownloadRequest.objects.filter(flight_key__isnull=False).exclude(status__in=IN_FLIGHT):
+        land(leader)
+
+    # Followers whose leader row is gone fetch for themselves
+    return DownloadRequest.objects.filter(status='waiting', leader__isnull=True).update(status='queued')
@@ -0,0 +1,83 @@
+"""Batch and playlist downloads, run as one job group.
+
+Every video of a batch is an ordinary DownloadRequest, so the result cache,
+single-flight coalescing, retries and cancellation all apply unchanged. The
+group only adds a per-group parallelism cap, enforced when workers claim
+jobs, and one aggregated status for the whole batch.
+"""
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from django.db.models import Count, F
+
+from . import admission
+from .models import DONE, DownloadGroup, DownloadRequest
+
+GROUP_DEFAULTS = {
+    # Videos one batch or playlist may hold; longer playlists are cut off.
+    # Never more than admission lets queue at once, see max_items().
+    'MAX_ITEMS': 100,
+    # Jobs of one group that may run at once, unless the client asks for fewer
+    'MAX_PARALLEL': 3,
+}
+
+
+def group_setting(name):
+    """Read a DOWNLOAD_GROUPS setting, falling back to the defaults"""
+    return getattr(settings, 'DOWNLOAD_GROUPS', {}).get(name, GROUP_DEFAULTS[name])
+
+
+def max_items():
+    """Videos one batch may hold.
+
+    A batch is admitted whole, so one with more new fetches than
+    ADMISSION['MAX_QUEUED'] or ['MAX_ACTIVE'] could never get in, however
+    empty the queue.
+    """
+    return min(
+        group_setting('MAX_ITEMS'),
+        admission.admission_setting('MAX_QUEUED'),
+        admission.admission_setting('MAX_ACTIVE'),
+    )
+
+
+def playlist_id(url):
+    """The list= parameter of a YouTube URL, or None"""
+    values = parse_qs(urlparse(url).query).get('list')
+    return values[0] if values else None
+
+
+def saturated():
+    """IDs of groups already running as many jobs as they may"""
+    return (
+        DownloadGroup.objects.filter(requests__status='processing')
+        .annotate(running=Count('requests'))
+        .filter(running__gte=F('max_parallel'))
+        .values('id')
+    )
+
+
+def has_room(group_id):
+    """Lock a group for the rest of the transaction and check it may start another job.
+
+    saturated() keeps full groups out of the claim query; this settles two
+    workers claiming from the same group at once.
+    """
+    group = DownloadGroup.objects.select_for_update().get(id=group_id)
+    running = DownloadRequest.objects.filter(group_id=group_id, status='processing').count()
+    return running < group.max_parallel
+
+
+def group_status(counts):
+    """One status for the whole group from its members' status counts"""
+    total = sum(counts.values())
+    unfinished = total - sum(counts.get(status, 0) for status in DONE)
+    if unfinished:
+        return 'queued' if counts.get('queued', 0) == total else 'processing'
+    if counts.get('completed', 0) == total:
+        return 'completed'
+    if counts.get('cancelled', 0) == total:
+        return 'cancelled'
+    if counts.get('completed'):
+        return 'partial'
+    return 'failed'
@@ -0,0 +1,290 @@
+import fcntl
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import storage
+from .models import UNFINISHED, DownloadRequest, MediaArtifact
+
+logger = logging.getLogger(__name__)
+
+JANITOR_DEFAULTS = {
+    # Seconds between sweeps
+    'INTERVAL': 600,
+    # Start evicting once MEDIA_ROOT holds more than this many bytes...
+    'HIGH_WATERMARK': 10 * 1024 ** 3,
+    # ...and stop once it is back under this
+    'LOW_WATERMARK': 8 * 1024 ** 3,
+    # Files nobody touched for this long go regardless of usage (None to disable)
+    'MAX_AGE': 86400,
+    # Never touch files modified more recently than this, they may still be written
+    'GRACE_PERIOD': 600,
+    # Directory entries handled per step, and the pause between steps
+    'BATCH_SIZE': 500,
+    'BATCH_PAUSE': 0.05,
+}
+
+# yt-dlp leftovers of a download that is still running
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp')
+
+
+def janitor_setting(name):
+    """Read a MEDIA_JANITOR setting, falling back to the defaults"""
+    return getattr(settings, 'MEDIA_JANITOR', {}).get(name, JANITOR_DEFAULTS[name])
+
+
+def scan_media(root):
+    """Yield (path, stat) for every media file under root, walking with scandir"""
+    pending = [root]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path, entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class MediaJanitor:
+    """Keeps MEDIA_ROOT under its quota.
+
+    A sweep walks the directory in small batches, pausing between them so a
+    large tree never monopolises the disk, and looks up the database state of
+    each batch in one query. Files are then expired by age and, above the high
+    watermark, evicted least recently used first until usage drops below the
+    low watermark. Files belonging to queued or running jobs are never touched,
+    artifacts with a reference count are never evicted for space, and the
+    rows of removed files are updated in bulk.
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+        self.last_sweep = None
+        self.last_report = {}
+        self._started = False
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def media_root(self):
+        return str(self.root or settings.MEDIA_ROOT)
+
+    def start(self):
+        """Start the periodic sweep thread once per process"""
+        with self._lock:
+            if self._started and self._pid == os.getpid():
+                return
+            self._started = True
+            self._pid = os.getpid()
+
+        thread = threading.Thread(target=self._loop, name="media-janitor")
+        thread.daemon = True
+        thread.start()
+
+    def _loop(self):
+        while True:
+            close_old_connections()
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Media janitor sweep failed")
+            finally:
+                close_old_connections()
+            time.sleep(janitor_setting('INTERVAL'))
+
+    def sweep(self, dry_run=False):
+        """Run one sweep unless another process is already running one"""
+        root = self.media_root
+        if not os.path.isdir(root):
+            return {}
+
+        # One sweeper per host; the other workers skip this round
+        with open(os.path.join(root, '.janitor.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return {}
+            report = self._sweep(root, dry_run)
+
+        self.last_sweep = time.time()
+        self.last_report = report
+        if report['removed'] and not dry_run:
+            logger.info(
+                "Janitor removed %d files (%d bytes), %d bytes in use",
+                report['removed'], report['freed'], report['usage'],
+            )
+        return report
+
+    def _sweep(self, root, dry_run):
+        now = time.time()
+        grace = janitor_setting('GRACE_PERIOD')
+        max_age = janitor_setting('MAX_AGE')
+        pause = janitor_setting('BATCH_PAUSE')
+
+        usage = 0
+        seen = set()
+        candidates = []  # (last access, size, path, referenced)
+        for batch in batched(scan_media(root), janitor_setting('BATCH_SIZE')):
+            paths = [path for path, _ in batch]
+            seen.update(paths)
+            protected = set(DownloadRequest.objects.filter(
+                file_path__in=paths, status__in=UNFINISHED
+            ).values_list('file_path', flat=True))
+            handed_out = {
+                path: (last_used_at, ref_count)
+                for path, last_used_at, ref_count in MediaArtifact.objects.filter(
+                    file_path__in=paths
+                ).values_list('file_path', 'last_used_at', 'ref_count')
+            }
+
+            for path, st in batch:
+                usage += st.st_size
+                if path in protected or path.endswith(PARTIAL_SUFFIXES):
+                    continue
+                if now - st.st_mtime < grace:
+                    continue
+                last_access = max(st.st_atime, st.st_mtime)
+                last_used_at, ref_count = handed_out.get(path, (None, 0))
+                if last_used_at is not None:
+                    last_access = max(last_access, last_used_at.timestamp())
+                candidates.append((last_access, st.st_size, path, ref_count > 0))
+
+            time.sleep(pause)
+
+        # Oldest first: expired files, then LRU eviction down to the low watermark
+        candidates.sort()
+        doomed = []
+        planned = 0
+        high = janitor_setting('HIGH_WATERMARK')
+        low = janitor_setting('LOW_WATERMARK')
+        evicting = usage > high
+        for last_access, size, path, referenced in candidates:
+            expired = max_age is not None and now - last_access > max_age
+            # Quota pressure never evicts an artifact requests still refer to;
+            # those only go once nobody was handed them for MAX_AGE
+            evict = evicting and not referenced and usage - planned > low
+            if expired or evict:
+                doomed.append((path, size))
+                planned += size
+        if evicting and usage - planned > low:
+            logger.warning("MEDIA_ROOT stays above LOW_WATERMARK: the rest is in use or referenced")
+
+        removed = 0
+        freed = 0
+        started = timezone.now() - timedelta(seconds=time.time() - now)
+        for batch in batched(doomed, janitor_setting('BATCH_SIZE')):
+            paths = [path for path, _ in batch]
+            # Files handed out or claimed by a job since the scan stay
+            keep = set(MediaArtifact.objects.filter(
+                file_path__in=paths, last_used_at__gte=started
+            ).values_list('file_path', flat=True))
+            keep.update(DownloadRequest.objects.filter(
+                file_path__in=paths, status__in=UNFINISHED
+            ).values_list('file_path', flat=True))
+
+            gone = []
+            for path, size in batch:
+                if path in keep:
+                    continue
+                if not dry_run:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        logger.warning("Janitor could not remove %s: %s", path, e)
+                        continue
+                gone.append(path)
+                freed += size
+            if not dry_run:
+                self._forget(gone)
+            removed += len(gone)
+            time.sleep(pause)
+
+        stale_rows = 0 if dry_run else self._reconcile(root, seen)
+        abandoned = 0 if dry_run else self._clear_incoming(now - grace)
+
+        return {
+            'scanned': len(seen),
+            'usage': usage - freed,
+            'removed': removed,
+            'freed': freed,
+            'stale_rows': stale_rows,
+            'abandoned_jobs': abandoned,
+        }
+
+    def _forget(self, paths):
+        """Update the database for files that were removed"""
+        MediaArtifact.objects.filter(file_path__in=paths).delete()
+        DownloadRequest.objects.filter(file_path__in=paths).update(file_exists=False)
+
+    def _reconcile(self, root, seen):
+        """Flag rows and artifacts that still claim a file the sweep did not find"""
+        prefix = os.path.join(root, '')
+
+        # A job may have finished after the scan passed its directory, so
+        # re-check the (few) misses before believing them
+        def missing(rows):
+            return [
+                row_id for row_id, path in rows.iterator()
+                if path not in seen and not os.path.exists(path)
+            ]
+
+        stale_rows = missing(DownloadRequest.objects.filter(
+            status='completed', file_exists=True, file_path__startswith=prefix
+        ).values_list('id', 'file_path'))
+        for batch in batched(stale_rows, janitor_setting('BATCH_SIZE')):
+            DownloadRequest.objects.filter(id__in=batch).update(file_exists=False)
+
+        stale_artifacts = missing(MediaArtifact.objects.filter(
+            file_path__startswith=prefix
+        ).values_list('id', 'file_path'))
+        for batch in batched(stale_artifacts, janitor_setting('BATCH_SIZE')):
+            MediaArtifact.objects.filter(id__in=batch).delete()
+
+        return len(stale_rows)
+
+    def _clear_incoming(self, cutoff):
+        """Remove working directories left behind by jobs that are no longer running"""
+        jobs = {job_id: path for job_id, path, mtime in storage.incoming_jobs() if mtime < cutoff}
+        if not jobs:
+            return 0
+        running = set(DownloadRequest.objects.filter(
+            id__in=list(jobs), status__in=UNFINISHED
+        ).values_list('id', flat=True))
+        for job_id, path in jobs.items():
+            if job_id not in running:
+                shutil.rmtree(path, ignore_errors=True)
+        return len(jobs) - len(running)
+
+    def stats(self):
+        return {'last_sweep': self.last_sweep, **self.last_report}
+
+
+media_janitor = MediaJanitor()
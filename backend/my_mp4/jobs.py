@@ -0,0 +1,329 @@
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .errors import JobCancelled
+from .models import DownloadRequest
+from . import flight, groups, metrics, services
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEFAULTS = {
+    # Worker threads per lane. mp3 jobs spend most of their time in ffmpeg
+    # (CPU), mp4 jobs mostly wait on the network.
+    'LANES': {'mp4': 4, 'mp3': 2},
+    # How long an idle worker sleeps before checking the table again.
+    'POLL_INTERVAL': 2,
+    # How often running jobs are marked alive in the database.
+    'HEARTBEAT_INTERVAL': 15,
+    # A processing job whose heartbeat is older than this was orphaned.
+    'STALE_AFTER': 120,
+    # Give up on a job after this many claims.
+    'MAX_ATTEMPTS': 3,
+    # Seconds (low, high) a failed attempt waits in the queue before its
+    # next claim, doubled for every attempt already made.
+    'RETRY_DELAY': (3, 11),
+    # How often a worker looks for its running jobs being cancelled from
+    # another process.
+    'CANCEL_CHECK_INTERVAL': 2,
+    # Shortest job first: queued jobs are claimed in order of expected work,
+    # the expected download size at this many bytes per second...
+    'EXPECTED_THROUGHPUT': 1_250_000,
+    # ...less this many seconds of it for every second a job has waited, so
+    # a long job is never passed over for more than its cost / AGING_RATE.
+    'AGING_RATE': 1.0,
+}
+
+# Formats that run in a lane other than their own name
+FORMAT_LANES = {
+    'mp3': 'mp3',
+}
+
+
+def queue_setting(name):
+    """Read a DOWNLOAD_QUEUE setting, falling back to the defaults"""
+    return getattr(settings, 'DOWNLOAD_QUEUE', {}).get(name, QUEUE_DEFAULTS[name])
+
+
+def lane_for(format_type):
+    """Lane a format is processed in"""
+    return FORMAT_LANES.get(format_type, 'mp4')
+
+
+def lane_filter(lane):
+    """Q object selecting the formats that belong to a lane"""
+    if lane == 'mp4':
+        others = [fmt for fmt, fmt_lane in FORMAT_LANES.items() if fmt_lane != 'mp4']
+        return ~Q(format_choice__in=others)
+    return Q(format_choice__in=[fmt for fmt, fmt_lane in FORMAT_LANES.items() if fmt_lane == lane])
+
+
+def priority_for(expected_bytes, queued_at):
+    """Claim order of a queued job, lowest first: shortest job first, with aging.
+
+    A job waiting w seconds scores cost - AGING_RATE * w. The now-term is the
+    same for every job, so ranking by cost + AGING_RATE * queued_at gives the
+    same order and lets the score be stored once and indexed.
+    """
+    cost = (expected_bytes or 0) / queue_setting('EXPECTED_THROUGHPUT')
+    return cost + queue_setting('AGING_RATE') * queued_at.timestamp()
+
+
+def cancelled(job):
+    """True if the job was cancelled in the database; the instance is updated to match"""
+    if DownloadRequest.objects.filter(id=job.id, status='cancelled').exists():
+        job.status = 'cancelled'
+        return True
+    return False
+
+
+def retry_later(job):
+    """Put a job back in the queue for another attempt once its back-off has passed.
+
+    The worker is free again as soon as this returns; no thread or coroutine
+    sits out the delay.
+    """
+    low, high = queue_setting('RETRY_DELAY')
+    delay = random.uniform(low, high) * 2 ** max(job.attempts - 1, 0)
+    DownloadRequest.objects.filter(id=job.id, status='processing').update(
+        status='queued',
+        worker_id=None,
+        not_before=timezone.now() + timedelta(seconds=delay),
+    )
+    job.status = 'queued'
+    return delay
+
+
+def recover_stale_jobs():
+    """Re-queue jobs left in 'processing' by a dead worker"""
+    cutoff = timezone.now() - timedelta(seconds=queue_setting('STALE_AFTER'))
+    stale = DownloadRequest.objects.filter(status='processing').filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, created_at__lt=cutoff)
+    )
+
+    exhausted = stale.filter(attempts__gte=queue_setting('MAX_ATTEMPTS')).update(
+        status='failed', worker_id=None
+    )
+    requeued = stale.update(status='queued', worker_id=None)
+
+    # Settle followers of leaders that failed or disappeared
+    requeued += flight.sweep()
+
+    if exhausted or requeued:
+        logger.info("Recovered stale jobs: %d re-queued, %d failed", requeued, exhausted)
+    return requeued
+
+
+class JobQueue:
+    """Bounded worker pool that pulls queued DownloadRequests from the database.
+
+    Every process runs a fixed number of worker threads per lane, so a burst
+    of requests only grows the table, never the number of yt-dlp or ffmpeg
+    processes. Jobs are claimed with a conditional UPDATE, which keeps several
+    gunicorn workers from picking the same row.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Condition()
+        self._lock = threading.Lock()
+        self._started = False
+        self._active = {}
+        self._running = set()
+        self._cancelled = set()
+
+    def start(self):
+        """Start worker and heartbeat threads once per process"""
+        with self._lock:
+            if self._started and self._pid == os.getpid():
+                return
+            self._started = True
+            self._pid = os.getpid()
+            self.worker_id = f"{socket.gethostname()}:{self._pid}"
+
+        try:
+            recover_stale_jobs()
+        except Exception as e:
+            logger.warning("Job recovery failed: %s", e)
+
+        for lane, workers in queue_setting('LANES').items():
+            self._active[lane] = 0
+            for index in range(workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(lane,),
+                    name=f"download-{lane}-{index}",
+                )
+                thread.daemon = True
+                thread.start()
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="download-heartbeat")
+        heartbeat.daemon = True
+        heartbeat.start()
+
+    def submit(self, download_request):
+        """Wake a worker for a freshly queued request"""
+        if not services.enabled():
+            # Workers run elsewhere and pick it up on their next poll
+            return
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def cancel(self, request_id):
+        """Stop a job running in this process; True if it was running here.
+
+        Threads cannot be killed, so the attempt stops at its next progress
+        callback or, during post-processing, when ffmpeg is killed.
+        """
+        with self._lock:
+            if request_id not in self._running:
+                return False
+            self._cancelled.add(request_id)
+        return True
+
+    def is_cancelled(self, request_id):
+        return request_id in self._cancelled
+
+    def raise_if_cancelled(self, request_id):
+        if request_id in self._cancelled:
+            raise JobCancelled(f"Job {request_id} was cancelled")
+
+    def claim(self, lane):
+        """Atomically move the queued job of a lane with the lowest priority score to 'processing'"""
+        with transaction.atomic():
+            now = timezone.now()
+            full = set()
+            while True:
+                candidate = (
+                    DownloadRequest.objects.select_for_update(skip_locked=True)
+                    .filter(status='queued')
+                    .filter(Q(not_before__isnull=True) | Q(not_before__lte=now))
+                    .filter(lane_filter(lane))
+                    # Groups already at their parallelism cap wait
+                    .exclude(group__in=groups.saturated())
+                    .exclude(group__in=full)
+                    .order_by('priority', 'created_at')
+                    .values_list('id', 'group_id')
+                    .first()
+                )
+                if candidate is None:
+                    return None
+                candidate, group_id = candidate
+                if group_id is None or groups.has_room(group_id):
+                    break
+                # Filled up since saturated() was read; the rest of the lane may still run
+                full.add(group_id)
+
+            claimed = DownloadRequest.objects.filter(id=candidate, status='queued').update(
+                status='processing',
+                started_at=now,
+                heartbeat_at=now,
+                worker_id=self.worker_id,
+                attempts=F('attempts') + 1,
+            )
+            if not claimed:
+                return None
+
+        job = DownloadRequest.objects.get(id=candidate)
+        metrics.job_claimed(job)
+        return job
+
+    def run(self, lane, job):
+        """Run one claimed job and release its slot"""
+        with self._lock:
+            self._active[lane] = self._active.get(lane, 0) + 1
+            self._running.add(job.id)
+        try:
+            self.handler(job.url, job.format_choice, job)
+        except Exception as e:
+            logger.exception("Job %s crashed", job.id, extra={'request_id': job.id})
+            DownloadRequest.objects.filter(id=job.id, status='processing').update(status='failed')
+            flight.land(job)
+        finally:
+            with self._lock:
+                self._active[lane] -= 1
+                self._running.discard(job.id)
+                self._cancelled.discard(job.id)
+
+    def _worker_loop(self, lane):
+        while True:
+            close_old_connections()
+            try:
+                job = self.claim(lane)
+            except Exception as e:
+                logger.warning("Job claim failed: %s", e)
+                job = None
+
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(queue_setting('POLL_INTERVAL'))
+                continue
+
+            self.run(lane, job)
+
+    def touch(self, job_ids):
+        """Mark running jobs alive, so recover_stale_jobs leaves them to this worker"""
+        DownloadRequest.objects.filter(id__in=job_ids, status='processing').update(heartbeat_at=timezone.now())
+
+    def _heartbeat_loop(self):
+        last_beat = last_recovery = time.monotonic()
+        while True:
+            time.sleep(queue_setting('CANCEL_CHECK_INTERVAL'))
+            close_old_connections()
+            try:
+                with self._lock:
+                    running = [job_id for job_id in self._running if job_id not in self._cancelled]
+                if running:
+                    # Jobs cancelled through another process
+                    for job_id in DownloadRequest.objects.filter(id__in=running, status='cancelled').values_list('id', flat=True):
+                        logger.info("Stopping cancelled job", extra={'request_id': job_id})
+                        self.cancel(job_id)
+                if running and time.monotonic() - last_beat >= queue_setting('HEARTBEAT_INTERVAL'):
+                    self.touch(running)
+                    last_beat = time.monotonic()
+                if time.monotonic() - last_recovery > queue_setting('STALE_AFTER'):
+                    recover_stale_jobs()
+                    last_recovery = time.monotonic()
+            except Exception as e:
+                logger.warning("Heartbeat failed: %s", e)
+
+    def stats(self):
+        """Queue depth per lane plus this process's active workers"""
+        lanes = queue_setting('LANES')
+        counts = {
+            lane: {'workers': workers, 'active': self._active.get(lane, 0), 'queued': 0, 'processing': 0}
+            for lane, workers in lanes.items()
+        }
+
+        rows = (
+            DownloadRequest.objects.filter(status__in=['queued', 'processing'])
+            .values('format_choice', 'status')
+            .annotate(total=Count('id'))
+        )
+        for row in rows:
+            lane = counts.setdefault(
+                lane_for(row['format_choice']),
+                {'workers': 0, 'active': 0, 'queued': 0, 'processing': 0},
+            )
+            lane[row['status']] += row['total']
+
+        oldest = DownloadRequest.objects.filter(status='queued').aggregate(oldest=Min('created_at'))['oldest']
+
+        return {
+            'worker_id': self.worker_id,
+            'lanes': counts,
+            'queued': sum(lane['queued'] for lane in counts.values()),
+            'processing': sum(lane['processing'] for lane in counts.values()),
+            'oldest_queued_seconds': round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0,
+        }
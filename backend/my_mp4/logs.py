@@ -0,0 +1,135 @@
+"""Structured logging that stays off the download threads.
+
+Loggers hand records to a BackgroundHandler, which only queues them; a
+QueueListener thread formats them as JSON lines and writes them out. Job
+context (request ID, video ID, client) is attached with log_context() and
+picked up by every record logged inside it.
+
+Configured through Django's LOGGING setting, so this module is imported
+before the app registry is ready and must not touch models or settings at
+import time.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_context = contextvars.ContextVar('log_context', default={})
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields such as request_id and video_id to every record logged inside the block.
+
+    Context variables follow asyncio tasks and asyncio.to_thread, so this
+    works the same for the thread and the asyncio engine.
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, then context and extra fields"""
+
+    def format(self, record):
+        data = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _STANDARD_ATTRS and not name.startswith('_'):
+                data[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """Queues records for a writer thread; formatting and I/O happen there.
+
+    The formatter LOGGING assigns to this handler is used by the writer.
+    The listener is restarted in a forked child, where the parent's thread
+    does not exist.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.SimpleQueue()
+            self.listener = logging.handlers.QueueListener(self.queue, self.target)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve the message and traceback while their objects are still
+        # valid, and capture the job context of the calling thread or task
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        for name, value in _context.get().items():
+            record.__dict__.setdefault(name, value)
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        self.queue.put_nowait(record)
+
+    def close(self):
+        if self._pid == os.getpid():
+            self.listener.stop()
+            self._pid = None
+        super().close()
+
+
+class Sampler:
+    """Lets one event per key through every `interval` seconds.
+
+    Used for yt-dlp progress, which fires many times a second per job.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._last = {}
+
+    def due(self, key):
+        now = time.monotonic()
+        if now - self._last.get(key, 0) < self.interval:
+            return False
+        self._last[key] = now
+        return True
+
+    def forget(self, key):
+        self._last.pop(key, None)
@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_started
+
+from my_mp4 import services
+from my_mp4.bench import Benchmark, compare
+from my_mp4.models import DownloadRequest, MediaArtifact
+from my_mp4.views import youtube_client
+
+
+class Command(BaseCommand):
+    help = (
+        'Offline end-to-end download benchmark against a local media origin. '
+        'Runs the job workers in this process; use a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=4, help='Clients driving the API at once')
+        parser.add_argument('--videos', type=int, help='Distinct videos; fewer than --jobs exercises the caches')
+        parser.add_argument('--size', type=int, default=2 * 1024 ** 2, help='Bytes per synthetic video')
+        parser.add_argument('--format', default='mp4')
+        parser.add_argument('--origin-rate', type=int, help='Origin bytes/s per connection, unlimited by default')
+        parser.add_argument('--timeout', type=float, default=120, help='Seconds a job may take')
+        parser.add_argument('--output', help='Results file (default: bench-results/<timestamp>.json)')
+        parser.add_argument('--baseline', help='Earlier results file to compare against')
+        parser.add_argument('--force', action='store_true', help='Run even though other jobs are queued')
+
+    def handle(self, *args, **options):
+        busy = DownloadRequest.objects.filter(status__in=['queued', 'processing']).exists()
+        if busy and not options['force']:
+            raise CommandError('Other jobs are queued; the benchmark workers would run them too. Use --force.')
+
+        bench = Benchmark(
+            jobs=options['jobs'],
+            concurrency=options['concurrency'],
+            videos=options['videos'],
+            size=options['size'],
+            format_type=options['format'],
+            origin_rate=options['origin_rate'],
+            timeout=options['timeout'],
+        )
+
+        # Results go to a scratch MEDIA_ROOT, and the janitor stays off so it
+        # never sweeps the real one against it
+        request_started.disconnect(dispatch_uid=services.DISPATCH_UID)
+        media_root = settings.MEDIA_ROOT
+        settings.MEDIA_ROOT = tempfile.mkdtemp(prefix='bench-media-')
+        try:
+            client_types = youtube_client.client_order('https://www.youtube.com/watch?v=')
+            results = bench.run(client_types)
+        finally:
+            DownloadRequest.objects.filter(device_id__startswith=bench.device_id).delete()
+            MediaArtifact.objects.filter(video_id__startswith=f'b{bench.run_id}').delete()
+            shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+            settings.MEDIA_ROOT = media_root
+
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'bench-results', results['timestamp'].replace(':', '') + '.json'
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self.print_results(results)
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                self.print_comparison(json.load(f), results)
+        self.stdout.write(f"results saved to {output}")
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"{results['completed']} completed, {results['failed']} failed in {results['wall_seconds']} s: "
+            f"{results['jobs_per_second']} jobs/s, "
+            f"{(results['served_bytes_per_second'] or 0) / 1024 ** 2:.1f} MiB/s served, "
+            f"{(results['origin_bytes_per_second'] or 0) / 1024 ** 2:.1f} MiB/s from origin"
+        )
+        for error, count in results['errors'].items():
+            self.stdout.write(f"  {count} x {error}")
+        self.stdout.write(f"{'stage':<12} {'count':>6} {'p50 ms':>10} {'p99 ms':>10}")
+        for stage, stats in results['latency'].items():
+            if stats['count']:
+                self.stdout.write(
+                    f"{stage:<12} {stats['count']:>6} {stats['p50'] * 1000:>10.1f} {stats['p99'] * 1000:>10.1f}"
+                )
+        self.stdout.write(f"peak RSS: {results['rss_mb']['process']} MB process, "
+                          f"{results['rss_mb']['children']} MB largest child")
+
+    def print_comparison(self, baseline, results):
+        self.stdout.write(f"\nvs. baseline from {baseline.get('timestamp')}:")
+        for metric, before, after, change in compare(baseline, results):
+            if before is None and after is None:
+                continue
+            change = f"{change:+.1f}%" if change is not None else '-'
+            self.stdout.write(f"{metric:<28} {before!s:>14} {after!s:>14} {change:>9}")
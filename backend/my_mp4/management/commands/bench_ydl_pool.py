@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+import yt_dlp
+
+from my_mp4.views import youtube_client
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request YoutubeDL setup cost, fresh instance vs. pooled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--format', default='mp4')
+        parser.add_argument('--client', default='mobile')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        format_type = options['format']
+        client_type = options['client']
+
+        # Before: a new YoutubeDL per request, closed when the request ends
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with yt_dlp.YoutubeDL(youtube_client.create_authentic_ydl_opts(0, format_type, client_type)) as ydl:
+                ydl.get_info_extractor('Youtube')
+        fresh = (time.perf_counter() - start) / iterations
+
+        # After: a warm instance checked out of the pool
+        pool = youtube_client.ydl_pool
+        pool.clear()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with pool.acquire(client_type, format_type, progress_hook=lambda d: None) as ydl:
+                ydl.get_info_extractor('Youtube')
+        pooled = (time.perf_counter() - start) / iterations
+
+        self.stdout.write(f"fresh YoutubeDL:  {fresh * 1000:8.2f} ms/request")
+        self.stdout.write(f"pooled YoutubeDL: {pooled * 1000:8.2f} ms/request")
+        self.stdout.write(f"speedup:          {fresh / pooled:8.1f}x  ({pool.stats()})")
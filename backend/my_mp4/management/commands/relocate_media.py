@@ -0,0 +1,64 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from my_mp4 import storage
+from my_mp4.cache import quality_for
+from my_mp4.models import DownloadRequest, MediaArtifact
+from my_mp4.views import youtube_client
+
+
+class Command(BaseCommand):
+    help = 'Move media stored flat in MEDIA_ROOT into the sharded, ID-addressed layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would move')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = missing = skipped = 0
+
+        for old_path, (video_id, format_type, quality) in self.files().items():
+            if not video_id:
+                skipped += 1
+                self.stderr.write(f"no video id, left in place: {old_path}")
+                continue
+            if storage.is_sharded(old_path, video_id, format_type, quality):
+                continue
+
+            if not os.path.exists(old_path):
+                missing += 1
+                if not dry_run:
+                    DownloadRequest.objects.filter(file_path=old_path).update(file_exists=False)
+                continue
+
+            ext = os.path.splitext(old_path)[1].lstrip('.') or None
+            new_path = storage.final_path(video_id, format_type, ext, quality)
+            self.stdout.write(f"{old_path} -> {new_path}")
+            moved += 1
+            if dry_run:
+                continue
+
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(old_path, new_path)
+            with transaction.atomic():
+                DownloadRequest.objects.filter(file_path=old_path).update(file_path=new_path)
+                MediaArtifact.objects.filter(file_path=old_path).update(file_path=new_path)
+
+        verb = 'would move' if dry_run else 'moved'
+        self.stdout.write(f"{verb} {moved} files, {missing} missing, {skipped} without a video id")
+
+    def files(self):
+        """Every stored file with the video, format and quality it holds"""
+        files = {}
+        for path, video_id, format_type, quality in MediaArtifact.objects.values_list(
+            'file_path', 'video_id', 'format_choice', 'quality'
+        ):
+            files[path] = (video_id, format_type, quality)
+
+        rows = DownloadRequest.objects.filter(status='completed').exclude(file_path=None)
+        for path, video_id, url, format_type in rows.values_list('file_path', 'video_id', 'url', 'format_choice'):
+            if path not in files:
+                files[path] = (video_id or youtube_client.extract_video_id(url), format_type, quality_for(format_type))
+        return files
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from my_mp4.services import start_services
+
+
+class Command(BaseCommand):
+    help = 'Run the download job queue and media janitor in this process until interrupted'
+
+    def handle(self, *args, **options):
+        start_services()
+        self.stdout.write('Download workers and media janitor running, Ctrl-C to stop')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
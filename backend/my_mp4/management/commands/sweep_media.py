@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from my_mp4.janitor import media_janitor
+
+
+class Command(BaseCommand):
+    help = 'Run one media janitor sweep: expire old files and evict down to the low watermark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be removed')
+
+    def handle(self, *args, **options):
+        report = media_janitor.sweep(dry_run=options['dry_run'])
+        if not report:
+            self.stdout.write('Nothing to do (no MEDIA_ROOT, or another sweep is running)')
+            return
+        for key, value in report.items():
+            self.stdout.write(f"{key:>10}: {value}")
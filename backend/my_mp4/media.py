@@ -0,0 +1,398 @@
+import asyncio
+import mimetypes
+import os
+import re
+import sys
+import time
+import uuid
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+CONTENT_TYPES = {
+    '.mp4': 'video/mp4',
+    '.mp3': 'audio/mpeg',
+    '.m4a': 'audio/mp4',
+    '.webm': 'video/webm',
+    '.opus': 'audio/ogg',
+}
+
+# Refuse requests asking for more pieces than any player needs
+MAX_RANGES = 16
+
+# Earliest timestamp a ZIP entry can carry (1980-01-01)
+ZIP_EPOCH = 315532800
+
+# Bytes read per file chunk; also one thread hop per chunk under ASGI
+BLOCK_SIZE = 65536
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def media_path(file_path):
+    """Resolve a requested path, or None if it is missing or outside MEDIA_ROOT"""
+    if not file_path:
+        return None
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    resolved = os.path.realpath(file_path)
+    if os.path.commonpath([media_root, resolved]) != media_root:
+        return None
+    if not os.path.isfile(resolved):
+        return None
+    return resolved
+
+
+def content_type_for(file_path):
+    ext = os.path.splitext(file_path)[1].lower()
+    return CONTENT_TYPES.get(ext) or mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+
+
+def make_etag(stat):
+    return quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+
+
+def parse_ranges(header, size):
+    """Parse a Range header into (start, end) pairs, end inclusive.
+
+    Returns None when the header should be ignored and [] when no range
+    can be satisfied.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+
+    ranges = []
+    for spec in header[6:].split(','):
+        match = RANGE_RE.match(spec)
+        if not match:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+        elif last:
+            # Suffix range: the final N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    return coalesce(ranges)
+
+
+def coalesce(ranges):
+    """Merge overlapping and adjacent ranges, so no byte is sent twice (RFC 7233 4.1)"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def not_modified(request, etag, mtime):
+    """True if the client's cached copy is still current"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def range_applies(request, etag, mtime):
+    """Honour If-Range: only serve a range of the representation the client has"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+class FileRange:
+    """File object limited to one byte range.
+
+    read() stops at the end of the range, while fileno() and tell() expose the
+    real file so a WSGI server's file_wrapper (gunicorn) can os.sendfile() the
+    range straight from the page cache, bounded by Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def multipart_ranges(file_path, ranges, size, content_type, boundary, block_size=BLOCK_SIZE):
+    """Yield a multipart/byteranges body"""
+    with open(file_path, 'rb') as f:
+        for start, end in ranges:
+            yield (
+                f"--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode()
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(block_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+
+def offload_response(file_path, content_type):
+    """Let the front-end web server stream the file (X-Accel-Redirect / X-Sendfile)"""
+    mode = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if mode == 'x-accel-redirect':
+        relative = os.path.relpath(file_path, os.path.realpath(settings.MEDIA_ROOT))
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_OFFLOAD_PREFIX.rstrip('/') + '/' + relative.replace(os.sep, '/')
+        return response
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = file_path
+        return response
+    return None
+
+
+def serve_media(request, file_path, as_attachment=False, filename=None):
+    """Serve a file from MEDIA_ROOT with Range, conditional GET and sendfile support.
+
+    MEDIA_OFFLOAD hands the body to the front server; otherwise it streams
+    from the file a block at a time under either WSGI or ASGI (see for_server).
+    """
+    disposition = content_disposition_header(as_attachment, filename or os.path.basename(file_path))
+    content_type = content_type_for(file_path)
+
+    response = offload_response(file_path, content_type)
+    if response is not None:
+        # nginx/Apache handle ranges and validators themselves
+        response['Content-Disposition'] = disposition
+        return response
+
+    stat = os.stat(file_path)
+    size = stat.st_size
+    etag = make_etag(stat)
+
+    if not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        return response
+
+    ranges = None
+    if range_applies(request, etag, stat.st_mtime):
+        ranges = parse_ranges(request.META.get('HTTP_RANGE'), size)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif ranges and len(ranges) > 1:
+        boundary = uuid.uuid4().hex
+        response = StreamingHttpResponse(
+            multipart_ranges(file_path, ranges, size, content_type, boundary),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+    elif ranges:
+        start, end = ranges[0]
+        length = end - start + 1
+        response = FileResponse(FileRange(open(file_path, 'rb'), start, length), status=206)
+        response['Content-Type'] = content_type
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+
+    if isinstance(response, FileResponse):
+        response.block_size = BLOCK_SIZE
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Content-Disposition'] = disposition
+    return for_server(request, response)
+
+
+def under_asgi(request):
+    # Only an ASGI server has loaded the handler module, so don't import it here
+    asgi = sys.modules.get('django.core.handlers.asgi')
+    return asgi is not None and isinstance(request, asgi.ASGIRequest)
+
+
+async def iterate_in_thread(iterable):
+    """Advance a blocking iterator one item at a time in a worker thread"""
+    iterator = iter(iterable)
+    done = object()
+    try:
+        while True:
+            item = await sync_to_async(next, thread_sensitive=False)(iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=False)()
+
+
+def iterate_blocking(aiterable):
+    """Drive an async iterator from a sync server thread on a private event loop"""
+    loop = asyncio.new_event_loop()
+    iterator = aiterable.__aiter__()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(iterator, 'aclose', None)
+        if aclose is not None:
+            loop.run_until_complete(aclose())
+        loop.close()
+
+
+def for_server(request, response):
+    """Give a streaming response the kind of iterator its server streams as it goes.
+
+    Django's ASGI handler collects a sync iterator into a list before sending
+    the first byte, and the WSGI handler does the same with an async one, so
+    a large file or a ZIP export would sit in memory whole. Under ASGI each
+    chunk is read in a worker thread instead; under WSGI an async body runs
+    on a loop of its own in the request thread.
+    """
+    if not response.streaming:
+        return response
+    if under_asgi(request):
+        if not response.is_async:
+            response.streaming_content = iterate_in_thread(response.streaming_content)
+    elif response.is_async:
+        response.streaming_content = iterate_blocking(response.streaming_content)
+    return response
+
+
+class ZipSink:
+    """Write-only, unseekable file object that hands zipfile's output back in pieces"""
+
+    def __init__(self):
+        self.pieces = []
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.pieces)
+        self.pieces.clear()
+        return data
+
+
+def zip_stream(entries, block_size=BLOCK_SIZE):
+    """Yield a stored (uncompressed) ZIP of (name, file_path) entries while it is built.
+
+    zipfile writes into an unseekable sink, so each member is followed by a
+    data descriptor instead of having its header patched, and no more than
+    one block is held in memory at a time. Members near 4 GiB, offsets past
+    4 GiB and more than 65535 members get ZIP64 records. Files that vanished
+    since the listing are left out.
+    """
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, file_path in entries:
+            try:
+                f = open(file_path, 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                stat = os.fstat(f.fileno())
+                info = zipfile.ZipInfo(name, date_time=time.localtime(max(stat.st_mtime, ZIP_EPOCH))[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                # Known up front, so zipfile picks ZIP64 for the member only when it needs it
+                info.file_size = stat.st_size
+                with archive.open(info, 'w') as member:
+                    while True:
+                        data = f.read(block_size)
+                        if not data:
+                            break
+                        member.write(data)
+                        yield sink.drain()
+            # Data descriptor
+            yield sink.drain()
+    # Central directory
+    yield sink.drain()
+
+
+async def follow_growing_file(file_path, get_record, block_size=BLOCK_SIZE, poll_interval=0.25, idle_timeout=120):
+    """Yield a file's bytes while yt-dlp is still appending to it.
+
+    The file is opened once, so yt-dlp renaming the .part file on completion
+    does not disturb the reader. At EOF the generator waits for more data until
+    the job's progress record turns terminal. Reading only when the server asks
+    for the next chunk keeps a slow client from buffering the file in memory.
+    Reads and get_record() run in worker threads and the waits are
+    asyncio.sleep, so a watcher holds no thread while it idles.
+    """
+    f = await sync_to_async(open, thread_sensitive=False)(file_path, 'rb')
+    read = sync_to_async(f.read, thread_sensitive=False)
+    current_record = sync_to_async(get_record, thread_sensitive=False)
+    try:
+        idle_since = time.monotonic()
+        while True:
+            data = await read(block_size)
+            if data:
+                idle_since = time.monotonic()
+                yield data
+                continue
+
+            record = await current_record() or {}
+            if record.get('status') == 'completed':
+                # Drain whatever landed after our last read
+                while True:
+                    data = await read(block_size)
+                    if not data:
+                        return
+                    yield data
+            if record.get('status') in ('failed', 'cancelled'):
+                return
+            if time.monotonic() - idle_since > idle_timeout:
+                return
+            await asyncio.sleep(poll_interval)
+    finally:
+        f.close()
@@ -0,0 +1,220 @@
+import copy
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import metadata_lookups_total
+
+logger = logging.getLogger(__name__)
+
+METADATA_DEFAULTS = {
+    # Seconds an extracted info dict stays usable. YouTube's signed media URLs
+    # expire after a few hours, so keep this well below that.
+    'TTL': 1800,
+    'SEARCH_TTL': 600,
+    # Flat playlist listings, see groups.py
+    'PLAYLIST_TTL': 600,
+    # How long a video that failed permanently (private, removed, ...) is
+    # refused without asking YouTube again
+    'NEGATIVE_TTL': 3600,
+    # In-process LRU bound, in entries
+    'MAX_ENTRIES': 256,
+    # Optional alias in CACHES shared by every worker (e.g. Redis or memcached)
+    'SHARED_CACHE': None,
+}
+
+
+def metadata_setting(name):
+    """Read a METADATA_CACHE setting, falling back to the defaults"""
+    return getattr(settings, 'METADATA_CACHE', {}).get(name, METADATA_DEFAULTS[name])
+
+
+def info_key(video_id, profile):
+    # Media URLs are signed for the client that extracted them
+    return f"mp4:info:{profile}:{video_id}"
+
+
+def failure_key(video_id):
+    return f"mp4:failed:{video_id}"
+
+
+def playlist_key(list_id):
+    return f"mp4:playlist:{list_id}"
+
+
+def search_key(query):
+    normalized = re.sub(r'\s+', ' ', query).strip().lower()
+    return f"mp4:search:{normalized}"
+
+
+class MetadataCache:
+    """TTL + LRU cache for yt-dlp extraction results.
+
+    Lookups hit a bounded in-process OrderedDict first and fall back to an
+    optional shared Django cache, so one worker's extraction can serve a
+    request that lands on another.
+    """
+
+    def __init__(self, ttl=1800, max_entries=256, shared_alias=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared_alias = shared_alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    metadata_lookups_total.inc(result='hit')
+                    return copy.deepcopy(entry[1])
+                del self._entries[key]
+
+        value = None
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                logger.warning("Shared metadata cache read failed: %s", e)
+
+        if value is None:
+            self.misses += 1
+            metadata_lookups_total.inc(result='miss')
+            return None
+
+        self.hits += 1
+        metadata_lookups_total.inc(result='hit')
+        self._remember(key, value, self.ttl)
+        return copy.deepcopy(value)
+
+    def peek(self, key, name, default=None):
+        """One field of a cached dict, read in place rather than from a copy of the whole value"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1].get(name, default)
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                logger.warning("Shared metadata cache read failed: %s", e)
+                value = None
+            if value is not None:
+                # Already a private copy, unpickled for us
+                self._remember(key, value, self.ttl)
+                return value.get(name, default)
+        return default
+
+    def has(self, key):
+        """Presence check without copying the value"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return True
+        if self.shared is not None:
+            try:
+                return self.shared.has_key(key)
+            except Exception as e:
+                logger.warning("Shared metadata cache read failed: %s", e)
+        return False
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl or self.ttl
+        self._remember(key, value, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, ttl)
+            except Exception as e:
+                logger.warning("Shared metadata cache write failed: %s", e)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared is not None:
+            try:
+                self.shared.delete(key)
+            except Exception as e:
+                logger.warning("Shared metadata cache delete failed: %s", e)
+
+    def _remember(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+metadata_cache = MetadataCache(
+    ttl=metadata_setting('TTL'),
+    max_entries=metadata_setting('MAX_ENTRIES'),
+    shared_alias=metadata_setting('SHARED_CACHE'),
+)
+
+
+def extract_raw_info(ydl, url, video_id, profile):
+    """Unprocessed info dict for a video, from the cache when possible.
+
+    The result can be handed to ydl.process_ie_result() to select formats and
+    download without running the extractor again.
+    """
+    key = info_key(video_id, profile) if video_id else None
+    if key:
+        cached = metadata_cache.get(key)
+        if cached is not None:
+            return cached
+
+    info = ydl.extract_info(url, download=False, process=False)
+    if key and info and info.get('_type', 'video') == 'video':
+        metadata_cache.set(key, ydl.sanitize_info(copy.deepcopy(info)))
+    return info
+
+
+def cached_raw_info(video_id, profile):
+    """Cached unprocessed info for a video, or None"""
+    if not video_id:
+        return None
+    return metadata_cache.get(info_key(video_id, profile))
+
+
+def cached_duration(video_id, profile):
+    """A video's duration from its cached info, or None; the info dict is not copied"""
+    if not video_id:
+        return None
+    return metadata_cache.peek(info_key(video_id, profile), 'duration')
+
+
+def remember_failure(video_id, message):
+    """Refuse a permanently unavailable video for NEGATIVE_TTL seconds"""
+    if video_id:
+        metadata_cache.set(failure_key(video_id), message, metadata_setting('NEGATIVE_TTL'))
+
+
+def known_failure(video_id):
+    """The remembered permanent error for a video, or None"""
+    if not video_id:
+        return None
+    return metadata_cache.get(failure_key(video_id))
@@ -0,0 +1,195 @@
+"""Per-stage job timings and a Prometheus text-format /metrics registry.
+
+Counters and histograms are kept per process, like the other pool stats;
+Prometheus should scrape each worker process (or run a single one) and sum.
+Queue depth and pool gauges are read when the endpoint is scraped.
+"""
+import threading
+import time
+
+from django.utils import timezone
+
+from .models import DONE, DownloadRequest
+
+# Where a job spends its time, in order
+STAGES = ('queue', 'extract', 'download', 'postprocess', 'finalize')
+
+# Seconds, from a warm extraction up to a long transcode
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by labels"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series['buckets']):
+                    samples.append((f'{self.name}_bucket', key + (('le', _format_value(bound)),), count))
+                samples.append((f'{self.name}_sum', key, round(series['sum'], 3)))
+                samples.append((f'{self.name}_count', key, series['count']))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=STAGE_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, gauges=()):
+        """Exposition text for every metric, plus gauges given as (name, help, [(labels, value)])"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for name, help_text, samples in gauges:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(sorted(labels.items()))} {_format_value(value or 0)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram('my_mp4_job_stage_seconds', 'Time finished jobs spent in each stage')
+job_seconds = registry.histogram('my_mp4_job_seconds', 'Time from request to finished job')
+jobs_total = registry.counter('my_mp4_jobs_total', 'Finished jobs by status')
+failures_total = registry.counter('my_mp4_job_failures_total', 'Failed jobs by error class')
+retries_total = registry.counter('my_mp4_job_retries_total', 'Attempts re-queued for another client, by error class')
+downloaded_bytes_total = registry.counter('my_mp4_downloaded_bytes_total', 'Bytes fetched from YouTube')
+requests_total = registry.counter('my_mp4_requests_total', 'Download requests by how they were served')
+rejections_total = registry.counter('my_mp4_admission_rejections_total', 'Download requests turned away, by limit')
+metadata_lookups_total = registry.counter('my_mp4_metadata_cache_lookups_total', 'Metadata cache lookups, by result')
+
+
+def charge(timings, stage, seconds):
+    """Add seconds to a stage in a job's timings dict"""
+    timings[stage] = round(timings.get(stage, 0) + seconds, 3)
+
+
+class StageClock:
+    """Charges the wall time of one job attempt to the stage it is in.
+
+    yt-dlp extracts, downloads and post-processes in a single call, so its
+    progress events move the clock: the first 'downloading' ends extraction
+    and 'finished' starts post-processing.
+    """
+
+    def __init__(self, timings, stage='extract'):
+        self.timings = timings
+        self.stage = stage
+        self.since = time.monotonic()
+
+    def switch(self, stage):
+        now = time.monotonic()
+        if self.stage is not None:
+            charge(self.timings, self.stage, now - self.since)
+        self.stage = stage
+        self.since = now
+
+    def observe(self, d):
+        """Progress hook"""
+        status = d.get('status')
+        if status == 'downloading' and self.stage != 'download':
+            self.switch('download')
+        elif status == 'finished':
+            downloaded_bytes_total.inc(d.get('total_bytes') or d.get('downloaded_bytes') or 0)
+            self.switch('postprocess')
+
+    def stop(self):
+        self.switch(None)
+
+
+def job_claimed(job):
+    """Charge the time a claimed job sat in the queue, back-off included"""
+    queued_since = job.created_at
+    if job.not_before and job.not_before > queued_since:
+        queued_since = job.not_before
+    charge(job.timings, 'queue', max((job.started_at - queued_since).total_seconds(), 0))
+
+
+def job_finished(job, status):
+    """Store an attempt's timings; count and observe the job once it is done for good"""
+    DownloadRequest.objects.filter(id=job.id).update(timings=job.timings)
+    if status not in DONE:
+        return
+
+    jobs_total.inc(status=status)
+    if status == 'failed':
+        failures_total.inc(kind=job.error_kind or 'unknown')
+    for stage in STAGES:
+        if stage in job.timings:
+            stage_seconds.observe(job.timings[stage], stage=stage)
+    job_seconds.observe((timezone.now() - job.created_at).total_seconds(), status=status)
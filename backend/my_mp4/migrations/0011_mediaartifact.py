@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_mp4', '0010_downloadrequest_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaArtifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64, unique=True)),
+                ('video_id', models.CharField(max_length=20)),
+                ('format_choice', models.CharField(max_length=10)),
+                ('quality', models.CharField(max_length=20)),
+                ('file_path', models.CharField(max_length=500)),
+                ('file_size', models.BigIntegerField(default=0)),
+                ('video_title', models.CharField(blank=True, max_length=500, null=True)),
+                ('video_thumbnail', models.URLField(blank=True, max_length=500, null=True)),
+                ('video_duration', models.IntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='artifact',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='requests', to='my_mp4.mediaartifact'),
+        ),
+    ]
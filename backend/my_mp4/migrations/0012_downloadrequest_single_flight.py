@@ -0,0 +1,29 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_mp4', '0011_mediaartifact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='flight_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='leader',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='followers', to='my_mp4.downloadrequest'),
+        ),
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='video_id',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:15
+
+import os
+
+from django.db import migrations, models
+
+
+def backfill_file_state(apps, schema_editor):
+    # One last stat per existing row; afterwards the values are kept on completion
+    DownloadRequest = apps.get_model('my_mp4', 'DownloadRequest')
+    for row in DownloadRequest.objects.filter(status='completed').only('id', 'file_path').iterator():
+        if row.file_path and os.path.isfile(row.file_path):
+            DownloadRequest.objects.filter(id=row.id).update(
+                file_exists=True, file_size=os.path.getsize(row.file_path)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_mp4', '0012_downloadrequest_single_flight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='file_exists',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='file_size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='downloadrequest',
+            index=models.Index(fields=['device_id', 'status', '-created_at', '-id'], name='dl_device_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='downloadrequest',
+            index=models.Index(fields=['status', 'created_at'], name='dl_status_created_idx'),
+        ),
+        migrations.RunPython(backfill_file_state, migrations.RunPython.noop),
+    ]
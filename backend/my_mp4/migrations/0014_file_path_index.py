@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_mp4', '0013_downloadrequest_history'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='downloadrequest',
+            name='file_path',
+            field=models.CharField(blank=True, db_index=True, max_length=500, null=True),
+        ),
+        migrations.AlterField(
+            model_name='mediaartifact',
+            name='file_path',
+            field=models.CharField(db_index=True, max_length=500),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_mp4', '0015_downloadrequest_clip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='error_kind',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='not_before',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='tried_clients',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_mp4', '0016_downloadrequest_retry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
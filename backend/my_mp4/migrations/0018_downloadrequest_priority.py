@@ -0,0 +1,22 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_mp4', '0017_downloadrequest_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='priority',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='downloadrequest',
+            index=models.Index(fields=['status', 'priority'], name='dl_status_priority_idx'),
+        ),
+    ]
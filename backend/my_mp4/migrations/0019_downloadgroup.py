@@ -0,0 +1,31 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_mp4', '0018_downloadrequest_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=100)),
+                ('format_choice', models.CharField(default='mp4', max_length=10)),
+                ('source_url', models.URLField(blank=True, max_length=500, null=True)),
+                ('title', models.CharField(blank=True, max_length=500, null=True)),
+                ('max_parallel', models.PositiveIntegerField(default=3)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='requests', to='my_mp4.downloadgroup'),
+        ),
+    ]
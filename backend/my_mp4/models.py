@@ -1,16 +1,103 @@
 from django.db import models
 
+# Statuses of a request that is queued, running or following a leader
+UNFINISHED = ('queued', 'processing', 'waiting')
+
+# Statuses after which a request never changes again
+DONE = ('completed', 'failed', 'cancelled')
+
+class MediaArtifact(models.Model):
+    """A finished file in MEDIA_ROOT, shared by every request for the same video and format"""
+    cache_key = models.CharField(max_length=64, unique=True)
+    video_id = models.CharField(max_length=20)
+    format_choice = models.CharField(max_length=10)
+    quality = models.CharField(max_length=40)
+    file_path = models.CharField(max_length=500, db_index=True)
+    file_size = models.BigIntegerField(default=0)
+    video_title = models.CharField(max_length=500, blank=True, null=True)
+    video_thumbnail = models.URLField(max_length=500, blank=True, null=True)
+    video_duration = models.IntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.video_id} [{self.format_choice}/{self.quality}] x{self.ref_count}"
+
+class DownloadGroup(models.Model):
+    """A batch of URLs or an expanded playlist, downloaded as one job, see groups.py"""
+    device_id = models.CharField(max_length=100)
+    format_choice = models.CharField(max_length=10, default='mp4')
+    # The playlist the group was expanded from, if any
+    source_url = models.URLField(max_length=500, blank=True, null=True)
+    title = models.CharField(max_length=500, blank=True, null=True)
+    # Members that may run at once
+    max_parallel = models.PositiveIntegerField(default=3)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.title or 'batch'} [{self.format_choice}] x{self.max_parallel}"
+
 class DownloadRequest(models.Model):
     url = models.URLField(max_length=500)
     format_choice = models.CharField(max_length=10, default='mp4')
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, default='pending')
-    file_path = models.CharField(max_length=500, blank=True, null=True)
+    file_path = models.CharField(max_length=500, blank=True, null=True, db_index=True)
     video_title = models.CharField(max_length=500, blank=True, null=True)
     video_thumbnail = models.URLField(max_length=500, blank=True, null=True)
     video_duration = models.IntegerField(default=0)
     device_id = models.CharField(max_length=100, blank=True, null=True)  # New field
     user_agent = models.TextField(blank=True, null=True)  # New field
     
+    # Requested time range in seconds, see clips.py; None means the whole video
+    clip_start = models.FloatField(blank=True, null=True)
+    clip_end = models.FloatField(blank=True, null=True)
+    
+    # Stored at completion so history never has to stat the file
+    file_size = models.BigIntegerField(default=0)
+    file_exists = models.BooleanField(default=False)
+    
+    # Job queue bookkeeping
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    worker_id = models.CharField(max_length=100, blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Retries wait in the queue instead of in a worker, see errors.py
+    not_before = models.DateTimeField(blank=True, null=True)
+    tried_clients = models.CharField(max_length=50, blank=True, default='')
+    error_kind = models.CharField(max_length=20, blank=True, null=True)
+    # Seconds spent per stage, summed over attempts, see metrics.py
+    timings = models.JSONField(default=dict, blank=True)
+    # Claim order, lowest first: shortest job first with aging, see jobs.priority_for
+    priority = models.FloatField(default=0)
+    
+    # Single-flight coalescing, see flight.py
+    video_id = models.CharField(max_length=20, blank=True, null=True)
+    flight_key = models.CharField(max_length=64, blank=True, null=True, unique=True)
+    leader = models.ForeignKey(
+        'self', blank=True, null=True, on_delete=models.SET_NULL, related_name='followers'
+    )
+    
+    # Batch or playlist this request belongs to, see groups.py
+    group = models.ForeignKey(
+        DownloadGroup, blank=True, null=True, on_delete=models.CASCADE, related_name='requests'
+    )
+    
+    # Shared result file, see cache.py
+    artifact = models.ForeignKey(
+        MediaArtifact, blank=True, null=True, on_delete=models.SET_NULL, related_name='requests'
+    )
+    
+    class Meta:
+        indexes = [
+            # Device history, newest first (see get_download_history)
+            models.Index(fields=['device_id', 'status', '-created_at', '-id'], name='dl_device_history_idx'),
+            # Oldest queued job, see JobQueue.stats
+            models.Index(fields=['status', 'created_at'], name='dl_status_created_idx'),
+            # Job queue claims, lowest priority score first
+            models.Index(fields=['status', 'priority'], name='dl_status_priority_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.url} - {self.status}"
\ No newline at end of file
@@ -0,0 +1,322 @@
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_DEFAULTS = {
+    'BACKEND': 'my_mp4.progress.LocalMemoryProgressStore',
+    'OPTIONS': {},
+    # Seconds a record lives after its last write
+    'TTL': 3600,
+    # Hot-path throttling: skip writes closer than this in time and percent
+    'MIN_INTERVAL': 0.5,
+    'MIN_DELTA': 1.0,
+}
+
+
+def progress_setting(name):
+    """Read a DOWNLOAD_PROGRESS setting, falling back to the defaults"""
+    return getattr(settings, 'DOWNLOAD_PROGRESS', {}).get(name, PROGRESS_DEFAULTS[name])
+
+
+class BaseProgressStore:
+    """Where job progress records live.
+
+    A record is a small JSON-able dict such as {'progress': 42.0, 'status': 'processing'}.
+    Backends only need to store and fetch whole records by request ID.
+    """
+
+    def __init__(self, ttl=3600, **options):
+        self.ttl = ttl
+
+    def get(self, request_id):
+        return self.get_many([request_id]).get(request_id)
+
+    def get_many(self, request_ids):
+        raise NotImplementedError
+
+    def set(self, request_id, record):
+        raise NotImplementedError
+
+    def delete(self, request_id):
+        raise NotImplementedError
+
+
+class LocalMemoryProgressStore(BaseProgressStore):
+    """Per-process dict. Only correct with a single worker process."""
+
+    def __init__(self, ttl=3600, **options):
+        super().__init__(ttl)
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, request_ids):
+        now = time.time()
+        with self._lock:
+            found = {}
+            for request_id in request_ids:
+                entry = self._records.get(request_id)
+                if entry and entry[0] > now:
+                    found[request_id] = entry[1]
+            return found
+
+    def set(self, request_id, record):
+        with self._lock:
+            self._records[request_id] = (time.time() + self.ttl, record)
+            # Expire lazily so the dict cannot grow without bound
+            if len(self._records) > 10000:
+                now = time.time()
+                self._records = {k: v for k, v in self._records.items() if v[0] > now}
+
+    def delete(self, request_id):
+        with self._lock:
+            self._records.pop(request_id, None)
+
+
+class SQLiteProgressStore(BaseProgressStore):
+    """SQLite file in WAL mode, shared by every worker process on one host."""
+
+    def __init__(self, ttl=3600, path=None, **options):
+        super().__init__(ttl)
+        self.path = path or str(settings.BASE_DIR / 'progress.sqlite3')
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # Created on first use, not when the store is built at import time
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS progress '
+                '(request_id INTEGER PRIMARY KEY, record TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, request_ids):
+        request_ids = list(request_ids)
+        if not request_ids:
+            return {}
+        placeholders = ','.join('?' * len(request_ids))
+        rows = self._connect().execute(
+            f'SELECT request_id, record FROM progress WHERE request_id IN ({placeholders}) AND expires > ?',
+            [*request_ids, time.time()],
+        )
+        return {request_id: json.loads(record) for request_id, record in rows}
+
+    def set(self, request_id, record):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO progress (request_id, record, expires) VALUES (?, ?, ?)',
+            (request_id, json.dumps(record), time.time() + self.ttl),
+        )
+        # Occasionally drop expired rows
+        if request_id % 100 == 0:
+            conn.execute('DELETE FROM progress WHERE expires <= ?', (time.time(),))
+
+    def delete(self, request_id):
+        self._connect().execute('DELETE FROM progress WHERE request_id = ?', (request_id,))
+
+
+class RedisProgressStore(BaseProgressStore):
+    """Speaks the Redis protocol (RESP) directly, so any Redis-compatible server works.
+
+    One socket per thread; a broken connection is dropped and reopened on the
+    next call.
+    """
+
+    def __init__(self, ttl=3600, host='127.0.0.1', port=6379, db=0, prefix='mp4:progress:', timeout=2, **options):
+        super().__init__(ttl)
+        self.host = host
+        self.port = port
+        self.db = db
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _key(self, request_id):
+        return f"{self.prefix}{request_id}"
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = (sock, sock.makefile('rb'))
+            self._local.conn = conn
+            if self.db:
+                self._send(conn, 'SELECT', self.db)
+        return conn
+
+    def _send(self, conn, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        conn[0].sendall(b''.join(parts))
+        return self._read(conn[1])
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        kind, payload = line[:1], line[1:-2]
+        if kind in (b'+', b':'):
+            return payload
+        if kind == b'-':
+            raise RuntimeError(payload.decode())
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            return reader.read(length + 2)[:-2]
+        if kind == b'*':
+            return [self._read(reader) for _ in range(int(payload))]
+        raise RuntimeError(f'Unexpected reply: {line!r}')
+
+    def command(self, *args):
+        try:
+            return self._send(self._connect(), *args)
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn[0].close()
+            self._local.conn = None
+
+    def get_many(self, request_ids):
+        request_ids = list(request_ids)
+        if not request_ids:
+            return {}
+        values = self.command('MGET', *[self._key(request_id) for request_id in request_ids])
+        return {
+            request_id: json.loads(value)
+            for request_id, value in zip(request_ids, values)
+            if value is not None
+        }
+
+    def set(self, request_id, record):
+        self.command('SET', self._key(request_id), json.dumps(record), 'EX', self.ttl)
+
+    def delete(self, request_id):
+        self.command('DEL', self._key(request_id))
+
+
+class ProgressTracker:
+    """Front end used by the download code.
+
+    Coalesces the flood of yt-dlp progress callbacks: a write only reaches the
+    backend when the percentage moved by MIN_DELTA and MIN_INTERVAL passed, or
+    when the status or extra fields change. Everything else is dropped in memory.
+    """
+
+    def __init__(self, store, min_interval=0.5, min_delta=1.0):
+        self.store = store
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def update(self, request_id, progress=None, status=None, force=False, **extra):
+        """Record progress for a job, skipping writes that would change nothing useful"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(request_id)
+            if not force and last is not None and status == last[2] and extra == last[3]:
+                moved = progress is not None and abs(progress - last[1]) >= self.min_delta
+                if not moved or now - last[0] < self.min_interval:
+                    return False
+            self._last[request_id] = (now, progress, status, extra)
+
+        record = {'progress': progress or 0, 'updated': time.time()}
+        if status:
+            record['status'] = status
+        record.update(extra)
+        try:
+            self.store.set(request_id, record)
+        except Exception as e:
+            logger.warning("Progress write failed: %s", e)
+        return True
+
+    def finish(self, request_id, status, **extra):
+        """Write a terminal record and forget the throttle state"""
+        progress = 100 if status == 'completed' else 0
+        self.update(request_id, progress, status=status, force=True, **extra)
+        with self._lock:
+            self._last.pop(request_id, None)
+
+    def get(self, request_id):
+        """Progress percentage for a job, 0 if unknown"""
+        try:
+            record = self.store.get(request_id)
+        except Exception as e:
+            logger.warning("Progress read failed: %s", e)
+            record = None
+        return record.get('progress', 0) if record else 0
+
+    def record(self, request_id):
+        try:
+            return self.store.get(request_id)
+        except Exception as e:
+            logger.warning("Progress read failed: %s", e)
+            return None
+
+    def discard(self, request_id):
+        with self._lock:
+            self._last.pop(request_id, None)
+        try:
+            self.store.delete(request_id)
+        except Exception as e:
+            logger.warning("Progress delete failed: %s", e)
+
+
+    def configure(self, store, min_interval=0.5, min_delta=1.0):
+        """Switch to another store and forget the throttle state"""
+        with self._lock:
+            self.store = store
+            self.min_interval = min_interval
+            self.min_delta = min_delta
+            self._last.clear()
+
+
+def create_progress_store():
+    """Build the store configured in DOWNLOAD_PROGRESS"""
+    options = {key.lower(): value for key, value in progress_setting('OPTIONS').items()}
+    store_class = import_string(progress_setting('BACKEND'))
+    return store_class(ttl=progress_setting('TTL'), **options)
+
+
+def create_progress_tracker():
+    """Build the tracker configured in DOWNLOAD_PROGRESS.
+
+    The tracker is built at import time, so it follows later changes of the
+    setting (override_settings in tests) by rebuilding its store.
+    """
+    tracker = ProgressTracker(
+        create_progress_store(),
+        min_interval=progress_setting('MIN_INTERVAL'),
+        min_delta=progress_setting('MIN_DELTA'),
+    )
+
+    def reconfigure(setting, **kwargs):
+        if setting == 'DOWNLOAD_PROGRESS':
+            tracker.configure(
+                create_progress_store(),
+                min_interval=progress_setting('MIN_INTERVAL'),
+                min_delta=progress_setting('MIN_DELTA'),
+            )
+
+    setting_changed.connect(reconfigure, weak=False)
+    return tracker
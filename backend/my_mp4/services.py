@@ -0,0 +1,36 @@
+"""Background services of a process that serves downloads.
+
+Nothing in the app starts a thread at import time. MyMp4Config.ready()
+hooks start_services() to the first request a process handles, so web
+workers start them after the fork and management commands, migrations
+included, never do. `manage.py run_services` runs them in a process of
+their own.
+"""
+from django.conf import settings
+from django.core.signals import request_started
+
+DISPATCH_UID = 'my_mp4.services.start_on_first_request'
+
+
+def enabled():
+    """False when BACKGROUND_SERVICES leaves the workers to `manage.py run_services`"""
+    return getattr(settings, 'BACKGROUND_SERVICES', True)
+
+
+def start_services():
+    """Start the download job queue and the media janitor; safe to call repeatedly"""
+    from .janitor import media_janitor
+    from .views import job_queue
+
+    job_queue.start()
+    # Keep MEDIA_ROOT under its quota, see janitor.py
+    media_janitor.start()
+
+
+def start_on_first_request(sender, **kwargs):
+    request_started.disconnect(dispatch_uid=DISPATCH_UID)
+    start_services()
+
+
+def start_with_first_request():
+    request_started.connect(start_on_first_request, dispatch_uid=DISPATCH_UID)
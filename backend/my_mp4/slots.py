@@ -0,0 +1,65 @@
+import fcntl
+import os
+import time
+
+from .errors import JobCancelled
+
+
+class HostSlots:
+    """A counted resource shared by every worker process on this host.
+
+    Each slot is a lock file under lock_dir; holding an flock on it means
+    owning the slot. The kernel drops the lock if the holder dies, so slots
+    never leak across crashes.
+    """
+
+    def __init__(self, lock_dir, size, poll_interval=0.1):
+        # Callables, so settings overrides apply without rebuilding the object
+        self._lock_dir = lock_dir
+        self._size = size
+        self.poll_interval = poll_interval
+
+    @property
+    def size(self):
+        return self._size()
+
+    def try_acquire(self, count):
+        """Take up to `count` free slots without waiting"""
+        lock_dir = self._lock_dir()
+        os.makedirs(lock_dir, exist_ok=True)
+        held = []
+        for slot in range(self.size):
+            if len(held) >= count:
+                break
+            handle = open(os.path.join(lock_dir, f'slot-{slot}.lock'), 'w')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                held.append(handle)
+            except BlockingIOError:
+                handle.close()
+        return held
+
+    def acquire(self, minimum=1, maximum=1, cancelled=None, timeout=None):
+        """Block until at least `minimum` slots are free, then take up to `maximum`.
+
+        cancelled is polled while waiting; once it returns True, JobCancelled
+        is raised without holding any slot. After `timeout` seconds without
+        enough free slots, TimeoutError is raised.
+        """
+        minimum = min(minimum, self.size)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            held = self.try_acquire(maximum)
+            if len(held) >= minimum:
+                return held
+            self.release(held)
+            if cancelled is not None and cancelled():
+                raise JobCancelled("Cancelled while waiting for a slot")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"No slot free within {timeout}s")
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def release(held):
+        for handle in held:
+            handle.close()
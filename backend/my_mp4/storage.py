@@ -0,0 +1,95 @@
+import os
+import shutil
+
+from django.conf import settings
+
+from .cache import artifact_key, quality_for
+
+# Per-job working directories under MEDIA_ROOT. Hidden, so the janitor's
+# directory walk leaves files that are still being written alone.
+INCOMING_DIR = '.incoming'
+
+# Extension each format ends up with after post-processing
+FORMAT_EXTENSIONS = {
+    'mp4': 'mp4',
+    'mp3': 'mp3',
+    'm4a': 'm4a',
+    'opus': 'opus',
+}
+
+
+def media_root():
+    return str(settings.MEDIA_ROOT)
+
+
+def media_relpath(video_id, format_type, ext=None, quality=None):
+    """Location of a result relative to MEDIA_ROOT.
+
+    Two levels of hash-prefix shards keep every directory small, and the
+    name is derived from the video ID, format and quality profile, so
+    different videos with the same title can never collide.
+    """
+    quality = quality or quality_for(format_type)
+    key = artifact_key(video_id, format_type, quality)
+    ext = ext or FORMAT_EXTENSIONS.get(format_type, format_type)
+    return os.path.join(key[:2], key[2:4], f"{video_id}.{format_type}-{quality}.{ext}")
+
+
+def final_path(video_id, format_type, ext=None, quality=None):
+    return os.path.join(media_root(), media_relpath(video_id, format_type, ext, quality))
+
+
+def is_sharded(file_path, video_id, format_type, quality=None):
+    """True if a file already sits where the layout puts it"""
+    ext = os.path.splitext(file_path)[1].lstrip('.') or None
+    return os.path.abspath(file_path) == final_path(video_id, format_type, ext, quality)
+
+
+def incoming_dir(job_id):
+    return os.path.join(media_root(), INCOMING_DIR, str(job_id))
+
+
+def incoming_template(job_id=None):
+    """yt-dlp outtmpl that writes a job's files into its own working directory"""
+    if job_id is None:
+        return os.path.join(media_root(), INCOMING_DIR, '%(id)s.%(ext)s')
+    return os.path.join(incoming_dir(job_id), '%(id)s.%(ext)s')
+
+
+def commit(temp_path, video_id, format_type, quality=None):
+    """Atomically move a finished download to its final place and return that path.
+
+    The rename happens within MEDIA_ROOT, so readers either see the complete
+    file or nothing. An identical result moved there by another job is simply
+    replaced.
+    """
+    ext = os.path.splitext(temp_path)[1].lstrip('.') or None
+    target = final_path(video_id, format_type, ext, quality)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(temp_path, target)
+
+    # Drop the job's working directory and whatever yt-dlp left in it
+    job_dir = os.path.dirname(temp_path)
+    if os.path.dirname(job_dir) == os.path.join(media_root(), INCOMING_DIR):
+        shutil.rmtree(job_dir, ignore_errors=True)
+    return target
+
+
+def discard_incoming(job_id):
+    """Remove a job's working directory and the partial files in it"""
+    shutil.rmtree(incoming_dir(job_id), ignore_errors=True)
+
+
+def incoming_jobs():
+    """Yield (job id, directory, mtime) for every job working directory"""
+    root = os.path.join(media_root(), INCOMING_DIR)
+    try:
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False) and entry.name.isdigit():
+                    try:
+                        yield int(entry.name), entry.path, entry.stat(follow_symlinks=False).st_mtime
+                    except FileNotFoundError:
+                        continue
+    except FileNotFoundError:
+        return
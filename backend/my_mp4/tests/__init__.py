@@ -0,0 +1,21 @@
+from django.core.signals import request_started
+from django.test import override_settings
+
+from my_mp4 import services
+
+# Requests made by the tests must not start the job workers and the media
+# janitor against the test database, like bench_downloads
+request_started.disconnect(dispatch_uid=services.DISPATCH_UID)
+
+# Records of earlier runs, keyed by reused request IDs, must not leak in
+TEST_PROGRESS = {'BACKEND': 'my_mp4.progress.LocalMemoryProgressStore', 'OPTIONS': {}}
+
+
+class ProgressStoreMixin:
+    """A fresh in-memory progress store for each test, instead of the configured one"""
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(DOWNLOAD_PROGRESS=TEST_PROGRESS)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
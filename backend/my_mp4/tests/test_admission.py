@@ -0,0 +1,84 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from my_mp4 import admission
+from my_mp4.metacache import MetadataCache, info_key, metadata_cache
+from my_mp4.metrics import rejections_total
+from my_mp4.models import DownloadRequest
+
+from . import ProgressStoreMixin
+
+LIMITS = {'MAX_PER_DEVICE': 2, 'MAX_QUEUED': 3, 'MAX_ACTIVE': 10, 'MIN_FREE_BYTES': 0,
+          'RETRY_AFTER': 30, 'DISK_RETRY_AFTER': 600}
+
+
+class EstimatedBytesTests(SimpleTestCase):
+    def setUp(self):
+        self.key = info_key('admitvid001', 'mobile')
+        metadata_cache.set(self.key, {'id': 'admitvid001', 'duration': 120, 'formats': [{'url': 'x'}] * 50})
+        self.addCleanup(metadata_cache.delete, self.key)
+
+    def test_reads_duration_without_copying_info(self):
+        with mock.patch('my_mp4.metacache.copy.deepcopy', side_effect=AssertionError('copied')):
+            size = admission.estimated_bytes('admitvid001', 'mp4', client_types=('tv', 'mobile'))
+        self.assertEqual(size, admission.estimated_bytes(None, 'mp4', duration=120))
+
+    def test_falls_back_to_default_duration(self):
+        with override_settings(ADMISSION={'DEFAULT_DURATION': 300}):
+            self.assertEqual(
+                admission.estimated_bytes('unknownvid1', 'mp4', client_types=('mobile',)),
+                admission.estimated_bytes(None, 'mp4', duration=300),
+            )
+
+    def test_peek_does_not_count_as_lookup(self):
+        cache = MetadataCache()
+        cache.set('key', {'duration': 5})
+        self.assertEqual(cache.peek('key', 'duration'), 5)
+        self.assertIsNone(cache.peek('missing', 'duration'))
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+
+@override_settings(BACKGROUND_SERVICES=False, ADMISSION=LIMITS)
+class AdmissionTests(ProgressStoreMixin, TestCase):
+    def start_download(self, video_id, device_id):
+        return self.client.post(
+            '/api/download/',
+            json.dumps({'url': f'https://www.youtube.com/watch?v={video_id}', 'device_id': device_id}),
+            content_type='application/json',
+        )
+
+    def test_device_cap_is_429(self):
+        before = rejections_total.value(reason='device')
+        self.assertEqual(self.start_download('device00001', 'device-a').status_code, 200)
+        self.assertEqual(self.start_download('device00002', 'device-a').status_code, 200)
+        response = self.start_download('device00003', 'device-a')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response.json()['reason'], 'device')
+        self.assertEqual(rejections_total.value(reason='device'), before + 1)
+        # Other devices are not held back by it
+        self.assertEqual(self.start_download('device00003', 'device-b').status_code, 200)
+
+    def test_full_queue_is_503(self):
+        for index in range(3):
+            self.assertEqual(self.start_download(f'queue000{index:03d}', f'device-{index}').status_code, 200)
+        response = self.start_download('queue000099', 'device-new')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response.json()['reason'], 'queue')
+
+    def test_joining_a_running_fetch_skips_global_caps(self):
+        for index in range(3):
+            self.start_download(f'queue000{index:03d}', f'device-{index}')
+        response = self.start_download('queue000000', 'device-new')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(DownloadRequest.objects.filter(status='waiting').count(), 1)
+
+    def test_low_disk_is_503_with_long_retry(self):
+        with override_settings(ADMISSION=dict(LIMITS, MIN_FREE_BYTES=1 << 60)):
+            response = self.start_download('diskvid0001', 'device-a')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '600')
+        self.assertEqual(response.json()['reason'], 'disk')
@@ -0,0 +1,158 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from yt_dlp import YoutubeDL
+
+from my_mp4.audio import COPY_FORMATS, TranscodePool, audio_ydl_opts, choose_audio_format, parse_accept
+from my_mp4.jobs import JobCancelled
+from my_mp4.models import DownloadRequest
+
+from . import ProgressStoreMixin
+
+FORMATS = [
+    {'format_id': '18', 'ext': 'mp4', 'acodec': 'mp4a.40.2', 'vcodec': 'avc1.42001E', 'abr': 96},
+    {'format_id': '140', 'ext': 'm4a', 'acodec': 'mp4a.40.2', 'vcodec': 'none', 'abr': 128},
+    {'format_id': '251', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 160},
+    {'format_id': '600', 'ext': 'webm', 'acodec': 'vorbis', 'vcodec': 'none', 'abr': 192},
+]
+
+
+class CopyFormatTests(SimpleTestCase):
+    def select(self, format_type, formats):
+        selector = YoutubeDL({'quiet': True}).build_format_selector(audio_ydl_opts(format_type)['format'])
+        ctx = {'formats': [dict(f, url='https://example.com/') for f in formats],
+               'incomplete_formats': False, 'has_merged_format': False}
+        return [f['format_id'] for f in selector(ctx)]
+
+    def test_selects_the_stream_in_the_target_codec(self):
+        self.assertEqual(self.select('m4a', FORMATS), ['140'])
+        self.assertEqual(self.select('opus', FORMATS), ['251'])
+
+    def test_falls_back_to_the_best_audio_there_is(self):
+        # Encoded in the TranscodePool afterwards, see ConvertTests
+        for format_type in COPY_FORMATS:
+            with self.subTest(format_type=format_type):
+                other = [f for f in FORMATS if f['format_id'] in ('18', '600')]
+                self.assertEqual(self.select(format_type, other), ['600'])
+
+
+class TranscodeTestMixin:
+    def setUp(self):
+        super().setUp()
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.work_dir = work_dir.name
+        settings = override_settings(TRANSCODE={'WORKERS': 1, 'LOCK_DIR': os.path.join(self.work_dir, 'slots')})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class ConvertTests(TranscodeTestMixin, SimpleTestCase):
+    def convert(self, name, format_type, acodec):
+        """Run transcode with ffmpeg replaced by a copy; returns the path and the ffmpeg commands"""
+        source = os.path.join(self.work_dir, name)
+        with open(source, 'wb') as f:
+            f.write(b'audio')
+        commands = []
+
+        def run(command, cancelled):
+            commands.append(command)
+            with open(command[-1], 'wb') as f:
+                f.write(b'converted')
+
+        pool = TranscodePool()
+        with mock.patch.object(pool, '_run', side_effect=run):
+            path = pool.transcode(source, format_type, acodec=acodec)
+        self.assertTrue(os.path.exists(path))
+        return path, commands, pool.stats()['completed']
+
+    def test_codec_decides_between_remux_and_encode(self):
+        cases = [
+            # (downloaded file, format, its acodec, ffmpeg codec args or None, pool encodes)
+            ('a.m4a', 'm4a', 'mp4a.40.2', None, 0),
+            ('b.webm', 'opus', 'opus', ['-codec:a', 'copy'], 0),
+            ('c.webm', 'm4a', 'vorbis', ['-codec:a', 'aac'], 1),
+            ('d.m4a', 'opus', 'mp4a.40.2', ['-codec:a', 'libopus'], 1),
+            ('e.webm', 'mp3', 'opus', ['-codec:a', 'libmp3lame'], 1),
+            ('f.webm', 'opus', None, ['-codec:a', 'libopus'], 1),
+        ]
+        for name, format_type, acodec, codec_args, encodes in cases:
+            with self.subTest(name=name):
+                path, commands, completed = self.convert(name, format_type, acodec)
+                self.assertEqual(path, os.path.join(self.work_dir, f'{name[0]}.{format_type}'))
+                if codec_args is None:
+                    self.assertEqual(commands, [])
+                else:
+                    command = ' '.join(commands[0])
+                    self.assertIn(' '.join(codec_args), command)
+                    self.assertFalse(os.path.exists(os.path.join(self.work_dir, name)))
+                self.assertEqual(completed, encodes)
+
+
+class AcceptTests(SimpleTestCase):
+    def test_parse_accept(self):
+        self.assertEqual(parse_accept('audio/ogg'), ['audio/ogg'])
+        self.assertEqual(parse_accept('audio/mp4, audio/ogg'), ['audio/mp4', ' audio/ogg'])
+        self.assertEqual(parse_accept(['audio/ogg']), ['audio/ogg'])
+        self.assertEqual(parse_accept(None, 'audio/mp4,*/*'), ['audio/mp4', '*/*'])
+        for value in (5, {'audio/ogg': 1}, ['audio/ogg', 3]):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_accept(value)
+
+    def test_string_accept_is_one_mime_type(self):
+        self.assertEqual(choose_audio_format('audio', parse_accept('audio/ogg')), 'opus')
+
+
+@override_settings(BACKGROUND_SERVICES=False, ADMISSION={'MIN_FREE_BYTES': 0})
+class AcceptViewTests(ProgressStoreMixin, TestCase):
+    def start(self, path, **data):
+        return self.client.post(path, json.dumps(dict(data, device_id='accept-device')), content_type='application/json')
+
+    def test_accept_string_picks_the_copy_format(self):
+        response = self.start('/api/download/', url='https://www.youtube.com/watch?v=acceptvid01',
+                              format='audio', accept='audio/ogg')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(DownloadRequest.objects.get(id=response.json()['request_id']).format_choice, 'opus')
+
+    def test_bad_accept_is_400(self):
+        for path, data in (
+            ('/api/download/', {'url': 'https://www.youtube.com/watch?v=acceptvid01'}),
+            ('/api/batch/', {'urls': ['https://www.youtube.com/watch?v=acceptvid01']}),
+        ):
+            with self.subTest(path=path):
+                response = self.start(path, format='audio', accept=42, **data)
+                self.assertEqual(response.status_code, 400)
+
+
+class TranscodeCancelTests(TranscodeTestMixin, SimpleTestCase):
+    def test_cancel_while_waiting_for_a_slot(self):
+        pool = TranscodePool()
+        # Another worker process holds the only slot
+        held = pool.slots.try_acquire(pool.workers)
+        self.addCleanup(pool.slots.release, held)
+
+        cancelled = threading.Event()
+        outcome = []
+
+        def transcode():
+            try:
+                pool.transcode('/nonexistent/source.webm', 'mp3', cancelled=cancelled.is_set)
+            except Exception as e:
+                outcome.append(e)
+
+        worker = threading.Thread(target=transcode)
+        worker.start()
+        time.sleep(0.3)
+        self.assertEqual(pool.stats()['waiting'], 1)
+
+        cancelled.set()
+        worker.join(timeout=2)
+        self.assertFalse(worker.is_alive())
+        self.assertIsInstance(outcome[0], JobCancelled)
+        self.assertEqual((pool.stats()['waiting'], pool.stats()['running']), (0, 0))
@@ -0,0 +1,148 @@
+import tempfile
+import threading
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from my_mp4.bandwidth import BandwidthBudget, FormatGrant, format_demand
+from my_mp4.jobs import JobCancelled
+
+PROGRESSIVE = {'format_id': '18', 'protocol': 'https', 'filesize': 200 * 1024 ** 2}
+DASH_VIDEO = {'format_id': '136', 'protocol': 'http_dash_segments', 'fragments': [{'url': 'x'}],
+              'filesize': 150 * 1024 ** 2}
+DASH_AUDIO = {'format_id': '140', 'protocol': 'http_dash_segments', 'fragments': [{'url': 'x'}],
+              'filesize_approx': 10 * 1024 ** 2}
+
+
+class FormatDemandTests(SimpleTestCase):
+    def test_chosen_formats(self):
+        cases = [
+            (PROGRESSIVE, (200 * 1024 ** 2, False)),
+            (DASH_VIDEO, (150 * 1024 ** 2, True)),
+            ({'format_id': '96', 'protocol': 'm3u8_native'}, (None, True)),
+            ({'format_id': '136+140', 'requested_formats': [DASH_VIDEO, DASH_AUDIO]}, (160 * 1024 ** 2, True)),
+            ({'format_id': '136+140', 'requested_formats': [DASH_VIDEO, {'protocol': 'https'}]}, (None, True)),
+            # ffmpeg cuts clip sections itself
+            (dict(DASH_VIDEO, section_start=10, section_end=20), (150 * 1024 ** 2, False)),
+        ]
+        for info, demand in cases:
+            with self.subTest(format_id=info['format_id']):
+                self.assertEqual(format_demand(info), demand)
+
+
+class BudgetTestMixin:
+    LIMITS = {'MAX_CONNECTIONS': 4, 'MAX_PER_JOB': 3, 'BYTES_PER_CONNECTION': 32 * 1024 ** 2, 'UPLINK_BPS': None}
+
+    def setUp(self):
+        super().setUp()
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        settings = override_settings(BANDWIDTH=dict(self.LIMITS, LOCK_DIR=lock_dir.name))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.budget = BandwidthBudget()
+        self.budget.slots.poll_interval = 0.02
+
+    def assertFree(self, count):
+        held = self.budget.slots.try_acquire(self.LIMITS['MAX_CONNECTIONS'])
+        self.budget.slots.release(held)
+        self.assertEqual(len(held), count)
+
+
+class GrantSizeTests(BudgetTestMixin, SimpleTestCase):
+    def test_connections_wanted(self):
+        cases = [
+            (PROGRESSIVE, 1),
+            (DASH_VIDEO, 3),
+            (dict(DASH_VIDEO, filesize=40 * 1024 ** 2), 2),
+            ({'format_id': '96', 'protocol': 'm3u8_native', 'duration': None}, 1),
+        ]
+        for info, connections in cases:
+            with self.subTest(format_id=info['format_id']):
+                with FormatGrant(self.budget, 'mp4') as grant:
+                    params = grant(info)
+                    self.assertEqual(grant.connections, connections)
+                    self.assertEqual(params['concurrent_fragment_downloads'], connections)
+                    self.assertEqual(self.budget.stats()['connections'], connections)
+                self.assertEqual(self.budget.stats()['connections'], 0)
+
+    def test_unknown_size_falls_back_to_duration_estimate(self):
+        with FormatGrant(self.budget, 'mp4') as grant:
+            grant({'format_id': '137', 'protocol': 'http_dash_segments', 'duration': 60})
+            # 60 s at 2.5 Mbit/s is under one BYTES_PER_CONNECTION
+            self.assertEqual(grant.connections, 1)
+
+    def test_allocates_once_per_attempt(self):
+        with FormatGrant(self.budget, 'mp4') as grant:
+            grant(DASH_VIDEO)
+            grant(DASH_VIDEO)
+            stats = self.budget.stats()
+            self.assertEqual((stats['connections'], stats['jobs']), (3, 1))
+
+    def test_no_connection_before_the_format_is_chosen(self):
+        with FormatGrant(self.budget, 'mp4') as grant:
+            self.assertEqual(grant.connections, 0)
+            self.assertFree(4)
+
+
+class GrantReleaseTests(BudgetTestMixin, SimpleTestCase):
+    def test_released_when_the_attempt_fails(self):
+        with self.assertRaises(RuntimeError):
+            with FormatGrant(self.budget, 'mp4') as grant:
+                grant(DASH_VIDEO)
+                raise RuntimeError('download failed')
+        self.assertFree(4)
+        self.assertEqual(self.budget.stats()['jobs'], 0)
+
+    def test_cancelled_while_waiting_at_the_cap(self):
+        others = self.budget.slots.try_acquire(4)
+        self.addCleanup(self.budget.slots.release, others)
+        cancelled = threading.Event()
+        outcome = []
+
+        def allocate():
+            try:
+                with FormatGrant(self.budget, 'mp4', cancelled=cancelled.is_set) as grant:
+                    grant(PROGRESSIVE)
+            except JobCancelled as e:
+                outcome.append(e)
+
+        waiter = threading.Thread(target=allocate)
+        waiter.start()
+        time.sleep(0.1)
+        cancelled.set()
+        waiter.join(timeout=2)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(len(outcome), 1)
+        self.assertEqual(self.budget.stats()['jobs'], 0)
+
+
+class ContentionTests(BudgetTestMixin, SimpleTestCase):
+    def test_partial_grant_when_the_host_is_busy(self):
+        others = self.budget.slots.try_acquire(3)
+        self.addCleanup(self.budget.slots.release, others)
+        with FormatGrant(self.budget, 'mp4') as grant:
+            grant(DASH_VIDEO)
+            # Gets what is free rather than waiting for all it wanted
+            self.assertEqual(grant.connections, 1)
+
+    def test_waits_for_a_connection_at_the_cap(self):
+        first = FormatGrant(self.budget, 'mp4')
+        first(DASH_VIDEO)
+        second = FormatGrant(self.budget, 'mp4')
+        second(PROGRESSIVE)
+        self.assertEqual(self.budget.stats()['connections'], 4)
+
+        third = FormatGrant(self.budget, 'mp4')
+        waiter = threading.Thread(target=third, args=(PROGRESSIVE,))
+        waiter.start()
+        time.sleep(0.1)
+        self.assertTrue(waiter.is_alive())
+
+        second.release()
+        waiter.join(timeout=2)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(third.connections, 1)
+        first.release()
+        third.release()
+        self.assertEqual(self.budget.stats()['connections'], 0)
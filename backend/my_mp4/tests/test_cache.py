@@ -0,0 +1,103 @@
+import os
+import time
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from my_mp4 import cache
+from my_mp4.janitor import MediaJanitor
+from my_mp4.models import DownloadRequest, MediaArtifact
+
+from .test_media import MediaRootMixin
+
+VIDEO_ID = 'cachevid001'
+INFO = {'title': 'Cached', 'thumbnail': '', 'duration': 60}
+
+
+class ArtifactTestMixin(MediaRootMixin):
+    def request_row(self, device_id='device-a', **fields):
+        return DownloadRequest.objects.create(
+            url=f'https://www.youtube.com/watch?v={VIDEO_ID}', format_choice='mp4',
+            device_id=device_id, status='processing', **fields
+        )
+
+    def downloaded(self, name='cached.mp4', size=1000):
+        """A request that just finished downloading, with its artifact"""
+        file_path = self.make_file(name, size)
+        download_request = self.request_row()
+        cache.store(download_request, VIDEO_ID, INFO, file_path)
+        return download_request
+
+    def ref_count(self, download_request):
+        return MediaArtifact.objects.get(id=download_request.artifact_id).ref_count
+
+
+class RefCountTests(ArtifactTestMixin, TestCase):
+    def delete(self, download_request):
+        response = self.client.delete(
+            f'/api/downloads/delete/{download_request.id}/?device_id={download_request.device_id}'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_reuse_adds_a_reference(self):
+        first = self.downloaded()
+        self.assertEqual(self.ref_count(first), 1)
+
+        artifact = cache.lookup(VIDEO_ID, 'mp4')
+        second = cache.attach(self.request_row('device-b'), artifact)
+        self.assertEqual((second.status, second.file_path), ('completed', first.file_path))
+        self.assertEqual(self.ref_count(first), 2)
+
+    def test_deleting_one_user_keeps_the_file_for_the_others(self):
+        first = self.downloaded()
+        second = cache.attach(self.request_row('device-b'), cache.lookup(VIDEO_ID, 'mp4'))
+
+        self.delete(first)
+        self.assertTrue(os.path.exists(second.file_path))
+        self.assertEqual(self.ref_count(second), 1)
+
+        self.delete(second)
+        self.assertFalse(os.path.exists(second.file_path))
+        self.assertFalse(MediaArtifact.objects.exists())
+
+    def test_same_video_finished_twice_shares_one_file(self):
+        first = self.downloaded('first.mp4')
+        second = self.downloaded('second.mp4')
+        self.assertEqual(second.file_path, first.file_path)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'second.mp4')))
+        self.assertEqual(self.ref_count(first), 2)
+
+
+@override_settings(MEDIA_JANITOR={
+    'HIGH_WATERMARK': 1500, 'LOW_WATERMARK': 500, 'MAX_AGE': None, 'GRACE_PERIOD': 0,
+    'BATCH_SIZE': 500, 'BATCH_PAUSE': 0, 'INTERVAL': 600,
+})
+class JanitorReferenceTests(ArtifactTestMixin, TestCase):
+    def age(self, file_path, seconds):
+        past = time.time() - seconds
+        os.utime(file_path, (past, past))
+
+    def test_pressure_never_evicts_referenced_artifacts(self):
+        referenced = self.downloaded('referenced.mp4')
+        # Older than the orphan, so plain LRU would pick it first
+        self.age(referenced.file_path, 7200)
+        MediaArtifact.objects.update(last_used_at=timezone.now() - timedelta(hours=2))
+        orphan = self.make_file('orphan.mp4', 1000)
+        self.age(orphan, 3600)
+
+        report = MediaJanitor(self.media_root).sweep()
+        self.assertTrue(os.path.exists(referenced.file_path))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(report['removed'], 1)
+
+    def test_released_artifact_can_be_evicted(self):
+        download_request = self.downloaded('released.mp4', size=2000)
+        self.age(download_request.file_path, 7200)
+        MediaArtifact.objects.update(ref_count=0, last_used_at=timezone.now() - timedelta(hours=2))
+
+        MediaJanitor(self.media_root).sweep()
+        self.assertFalse(os.path.exists(download_request.file_path))
+        download_request.refresh_from_db()
+        self.assertFalse(download_request.file_exists)
+        self.assertFalse(MediaArtifact.objects.exists())
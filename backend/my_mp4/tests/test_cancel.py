@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.db import close_old_connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from my_mp4 import storage, views
+from my_mp4.bandwidth import bandwidth_budget
+from my_mp4.bench import MediaOrigin, synthetic_info
+from my_mp4.jobs import JobQueue, priority_for, queue_setting
+from my_mp4.metacache import info_key, metadata_cache
+from my_mp4.models import DownloadRequest
+
+from . import ProgressStoreMixin
+from .test_media import MediaRootMixin
+
+
+@override_settings(BACKGROUND_SERVICES=False, DOWNLOAD_QUEUE={'EXPECTED_THROUGHPUT': 1_000_000, 'AGING_RATE': 1.0})
+class ShortestJobFirstTests(ProgressStoreMixin, TestCase):
+    def queued(self, expected_bytes, queued_at):
+        return DownloadRequest.objects.create(
+            url='https://www.youtube.com/watch?v=abc', status='queued',
+            priority=priority_for(expected_bytes, queued_at),
+        )
+
+    def claim_order(self):
+        queue = JobQueue(handler=None)
+        order = []
+        while True:
+            job = queue.claim('mp4')
+            if job is None:
+                return order
+            order.append(job.id)
+
+    def test_short_jobs_first(self):
+        now = timezone.now()
+        long_job = self.queued(600_000_000, now)
+        short_job = self.queued(5_000_000, now + timedelta(seconds=1))
+        medium_job = self.queued(50_000_000, now + timedelta(seconds=2))
+        self.assertEqual(self.claim_order(), [short_job.id, medium_job.id, long_job.id])
+
+    def test_unknown_size_counts_as_free(self):
+        now = timezone.now()
+        sized = self.queued(5_000_000, now)
+        unsized = self.queued(None, now + timedelta(seconds=1))
+        self.assertEqual(self.claim_order(), [unsized.id, sized.id])
+
+    def test_aging_promotes_long_jobs(self):
+        # 600 s of expected work is passed over by short jobs for at most
+        # 600 s / AGING_RATE, then it outranks every newcomer
+        start = timezone.now()
+        long_job = self.queued(600_000_000, start)
+        cost_seconds = 600_000_000 / queue_setting('EXPECTED_THROUGHPUT')
+        early = self.queued(1_000_000, start + timedelta(seconds=cost_seconds - 10))
+        late = self.queued(1_000_000, start + timedelta(seconds=cost_seconds + 10))
+        self.assertEqual(self.claim_order(), [early.id, long_job.id, late.id])
+
+
+@override_settings(BACKGROUND_SERVICES=False, ADMISSION={'MIN_FREE_BYTES': 0})
+class CancelProcessingTests(MediaRootMixin, TransactionTestCase):
+    VIDEO_ID = 'cancelvid01'
+    DEVICE = 'cancel-device'
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(BANDWIDTH={'LOCK_DIR': os.path.join(self.media_root, '.slots')})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Slow enough that the download is still running when it is cancelled
+        self.origin = MediaOrigin(4_000_000, rate=200_000)
+        self.origin.start()
+        self.addCleanup(self.origin.stop)
+        info = synthetic_info(self.VIDEO_ID, self.origin, 4_000_000, 60)
+        for client_type in views.youtube_client.client_order('https://www.youtube.com/watch?v='):
+            metadata_cache.set(info_key(self.VIDEO_ID, client_type), info)
+
+        self.queue = JobQueue(views.download_video)
+        patcher = mock.patch.object(views, 'job_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_worker(self, job):
+        def work():
+            try:
+                self.queue.run('mp4', job)
+            finally:
+                close_old_connections()
+        worker = threading.Thread(target=work)
+        worker.start()
+        return worker
+
+    def wait_for(self, condition, timeout=20):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('Timed out')
+            time.sleep(0.05)
+
+    def test_cancel_stops_the_worker_and_cleans_up(self):
+        response = self.client.post(
+            '/api/download/',
+            json.dumps({'url': f'https://www.youtube.com/watch?v={self.VIDEO_ID}', 'device_id': self.DEVICE}),
+            content_type='application/json',
+        )
+        request_id = response.json()['request_id']
+        job = self.queue.claim('mp4')
+        self.assertEqual(job.id, request_id)
+
+        worker = self.run_worker(job)
+        incoming = storage.incoming_dir(request_id)
+        self.wait_for(lambda: os.path.isdir(incoming) and os.listdir(incoming))
+        # A progressive file is fetched over a single connection
+        self.assertEqual(bandwidth_budget.stats()['connections'], 1)
+
+        started = time.monotonic()
+        response = self.client.post(
+            f'/api/downloads/cancel/{request_id}/',
+            json.dumps({'device_id': self.DEVICE}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        worker.join(timeout=20)
+        self.assertFalse(worker.is_alive())
+        # Stopped at the next progress callback, long before the 20 s download would end
+        self.assertLess(time.monotonic() - started, 10)
+
+        self.assertEqual(DownloadRequest.objects.get(id=request_id).status, 'cancelled')
+        self.assertFalse(os.path.exists(incoming))
+        self.assertEqual(self.queue._running, set())
+        self.assertEqual(self.queue._cancelled, set())
+        self.assertEqual(bandwidth_budget.stats()['connections'], 0)
+        self.assertEqual(views.download_progress.record(request_id)['status'], 'cancelled')
@@ -0,0 +1,67 @@
+import math
+
+from django.test import SimpleTestCase
+
+from my_mp4.cache import artifact_key, quality_for, request_quality
+from my_mp4.clips import parse_clip
+from my_mp4.models import DownloadRequest
+
+
+class ParseClipTests(SimpleTestCase):
+    def test_ranges(self):
+        cases = [
+            ((None, None), None),
+            (('', ''), None),
+            ((0, None), None),
+            ((10, 20), (10.0, 20.0)),
+            (('1:30', '2:00'), (90.0, 120.0)),
+            (('1m', None), (60.0, math.inf)),
+            ((None, '45'), (0.0, 45.0)),
+            ((2.5, 3), (2.5, 3.0)),
+        ]
+        for (start, end), clip in cases:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(parse_clip(start, end), clip)
+
+    def test_invalid_ranges(self):
+        cases = [
+            ((-1, 5), 'Clip start cannot be negative'),
+            ((-1, None), 'Clip start cannot be negative'),
+            ((20, 10), 'Clip end must be after its start'),
+            ((10, 10), 'Clip end must be after its start'),
+            (('soon', None), 'Invalid time: soon'),
+            ((None, True), 'Invalid time: True'),
+        ]
+        for (start, end), message in cases:
+            with self.subTest(start=start, end=end):
+                with self.assertRaisesMessage(ValueError, message):
+                    parse_clip(start, end)
+
+
+class ClipCacheKeyTests(SimpleTestCase):
+    def test_quality_names_the_clip(self):
+        self.assertEqual(quality_for('mp4'), '720p')
+        self.assertEqual(quality_for('mp4', (10.0, 20.5)), '720p@10-20.5')
+        self.assertEqual(quality_for('mp3', (0.0, math.inf)), '192k@0-inf')
+
+    def test_clips_never_share_a_key_with_the_whole_video(self):
+        keys = {
+            artifact_key('vid', 'mp4'),
+            artifact_key('vid', 'mp4', quality_for('mp4', (10.0, 20.0))),
+            artifact_key('vid', 'mp4', quality_for('mp4', (10.0, 30.0))),
+            artifact_key('vid', 'mp3', quality_for('mp3', (10.0, 20.0))),
+        }
+        self.assertEqual(len(keys), 4)
+        self.assertEqual(artifact_key('vid', 'mp4', quality_for('mp4', (10, 20))),
+                         artifact_key('vid', 'mp4', quality_for('mp4', (10.0, 20.0))))
+
+    def test_request_quality_reads_the_stored_range(self):
+        cases = [
+            ({}, '720p'),
+            ({'clip_start': 10.0, 'clip_end': 20.0}, '720p@10-20'),
+            ({'clip_start': 10.0}, '720p@10-inf'),
+            ({'clip_end': 20.0}, '720p@0-20'),
+        ]
+        for fields, quality in cases:
+            with self.subTest(**fields):
+                self.assertEqual(request_quality(DownloadRequest(format_choice='mp4', **fields)), quality)
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, override_settings
+
+from my_mp4.bandwidth import BandwidthBudget, FormatGrant, format_demand
+from my_mp4.bench import MediaOrigin, synthetic_info
+from my_mp4.engine import AsyncJobQueue, ProgressWriter, run_sync_to_end
+
+
+@override_settings(BACKGROUND_SERVICES=False, DOWNLOAD_QUEUE={'LANES': {'mp4': 1, 'mp3': 1}, 'POLL_INTERVAL': 60})
+class DispatchWakeupTests(SimpleTestCase):
+    def test_submit_wakes_only_its_lane(self):
+        queue = AsyncJobQueue(emulator=None, progress_hook=None, finish=None)
+        claims = {'mp4': 0, 'mp3': 0}
+
+        def claim(lane):
+            claims[lane] += 1
+            return None
+
+        queue.claim = claim
+        queue.start = lambda: None
+
+        async def scenario():
+            queue.loop = asyncio.get_running_loop()
+            queue._wakeups = {'mp4': asyncio.Event(), 'mp3': asyncio.Event()}
+            dispatchers = [asyncio.create_task(queue._dispatch(lane, 1)) for lane in ('mp4', 'mp3')]
+            try:
+                while claims != {'mp4': 1, 'mp3': 1}:
+                    await asyncio.sleep(0.01)
+                # Both lanes are now idle until POLL_INTERVAL; an mp3 submit
+                # must reach the mp3 lane even though mp4 clears its own event
+                with override_settings(BACKGROUND_SERVICES=True):
+                    queue.submit(SimpleNamespace(format_choice='mp3'))
+                for _ in range(100):
+                    if claims['mp3'] == 2:
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                for dispatcher in dispatchers:
+                    dispatcher.cancel()
+            return dict(claims)
+
+        self.assertEqual(asyncio.run(scenario()), {'mp4': 1, 'mp3': 2})
+
+
+class ChildTestMixin:
+    def child_payload(self, size=500_000):
+        """A ytdlp_worker job downloading from a local origin"""
+        origin = MediaOrigin(size)
+        origin.start()
+        self.addCleanup(origin.stop)
+        target = tempfile.TemporaryDirectory()
+        self.addCleanup(target.cleanup)
+        return {
+            'url': 'https://www.youtube.com/watch?v=childvid001',
+            'opts': {'format': '18', 'outtmpl': os.path.join(target.name, '%(id)s.%(ext)s'), 'quiet': True},
+            'raw_info': synthetic_info('childvid001', origin, size, 10),
+        }
+
+
+class ChildProtocolTests(ChildTestMixin, SimpleTestCase):
+    def test_grant_is_asked_for_once_the_format_is_chosen(self):
+        payload = self.child_payload()
+        queue = AsyncJobQueue(emulator=None, progress_hook=lambda event, job_id: None, finish=None)
+        chosen, progress = [], []
+
+        async def on_format(info):
+            chosen.append(info)
+            return {'concurrent_fragment_downloads': 1}
+
+        result = asyncio.run(queue._run_child(
+            SimpleNamespace(id=1), payload, observe=progress.append, on_format=on_format,
+        ))
+        self.assertEqual(result['event'], 'done', result)
+        self.assertEqual(os.path.getsize(result['filename']), 500_000)
+        self.assertEqual(len(chosen), 1)
+        self.assertEqual(format_demand(chosen[0]), (500_000, False))
+        self.assertEqual(progress[-1]['status'], 'finished')
+
+
+class ProgressWriterTests(SimpleTestCase):
+    def test_slow_store_does_not_stall_the_loop(self):
+        written = []
+
+        def slow_hook(event):
+            time.sleep(0.05)
+            written.append(event)
+
+        async def scenario():
+            writer = ProgressWriter(slow_hook)
+            ticks = 0
+            started = time.monotonic()
+            for percent in range(1, 101):
+                writer.put({'status': 'downloading', '_percent_str': f'{percent}%'})
+                ticks += 1
+                await asyncio.sleep(0.001)
+            writer.put({'status': 'finished', 'total_bytes': 1})
+            loop_time = time.monotonic() - started
+            await writer.flush()
+            return loop_time
+
+        # 101 writes at 50 ms each would take over 5 s on the loop
+        self.assertLess(asyncio.run(scenario()), 1)
+        # Stale ticks are coalesced, the newest tick and the finish are always written
+        self.assertLess(len(written), 50)
+        self.assertEqual(written[-2]['_percent_str'], '100%')
+        self.assertEqual(written[-1]['status'], 'finished')
+
+    def test_discard_drops_unwritten_ticks(self):
+        written = []
+
+        async def scenario():
+            writer = ProgressWriter(lambda event: (time.sleep(0.05), written.append(event)))
+            writer.put({'status': 'downloading', '_percent_str': '1%'})
+            await asyncio.sleep(0)
+            writer.put({'status': 'downloading', '_percent_str': '2%'})
+            await writer.flush(discard=True)
+
+        asyncio.run(scenario())
+        self.assertEqual([event['_percent_str'] for event in written], ['1%'])
+
+
+class GrantWaitTests(ChildTestMixin, SimpleTestCase):
+    def setUp(self):
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        settings = override_settings(BANDWIDTH={'MAX_CONNECTIONS': 1, 'LOCK_DIR': lock_dir.name, 'WAIT_TIMEOUT': 30})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.budget = BandwidthBudget()
+        # Every connection is held by another process
+        held = self.budget.slots.try_acquire(1)
+        self.addCleanup(self.budget.slots.release, held)
+
+    def test_cancelled_job_stops_waiting_for_connections(self):
+        queue = AsyncJobQueue(emulator=None, progress_hook=lambda event, job_id: None, finish=None)
+        grant = FormatGrant(self.budget, 'mp4', cancelled=lambda: queue.is_cancelled(1))
+
+        async def scenario():
+            waiting = asyncio.Event()
+
+            async def allocate(info):
+                waiting.set()
+                return await run_sync_to_end(grant, info)
+
+            task = asyncio.create_task(
+                queue._run_child(SimpleNamespace(id=1), self.child_payload(), on_format=allocate)
+            )
+            await waiting.wait()
+            await asyncio.sleep(0.2)
+            queue._cancelled.add(1)
+            task.cancel()
+            started = time.monotonic()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return time.monotonic() - started
+
+        self.assertLess(asyncio.run(scenario()), 1)
+        self.assertEqual(self.budget.stats()['jobs'], 0)
+
+    def test_wait_is_bounded(self):
+        with override_settings(BANDWIDTH={'MAX_CONNECTIONS': 1, 'LOCK_DIR': self.budget.slots._lock_dir(),
+                                          'WAIT_TIMEOUT': 0.2}):
+            with self.assertRaises(TimeoutError):
+                FormatGrant(self.budget, 'mp4')({'format_id': '18', 'protocol': 'https'})
+        self.assertEqual(self.budget.stats()['jobs'], 0)
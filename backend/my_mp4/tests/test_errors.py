@@ -0,0 +1,81 @@
+import errno
+
+from django.test import SimpleTestCase
+from yt_dlp.utils import DownloadError, ExtractorError, GeoRestrictedError, PostProcessingError
+
+from my_mp4.errors import (
+    DISK_FULL, PERMANENT, POSTPROCESSING, TRANSIENT, PermanentError, TransientError, classify, from_kind,
+)
+
+
+def download_error(message, cause=None):
+    """A DownloadError as YoutubeDL.report_error raises it, wrapping the original exception"""
+    cause = cause or ExtractorError(message, expected=True)
+    return DownloadError(f'ERROR: {message}', (type(cause), cause, None))
+
+
+# (error yt-dlp reports, expected kind)
+CASES = [
+    # Nothing will fetch these
+    ("[youtube] dQw4w9WgXcQ: Private video. Sign in if you've been granted access to this video", PERMANENT),
+    ('[youtube] dQw4w9WgXcQ: Video unavailable. This video has been removed by the uploader', PERMANENT),
+    ('[youtube] dQw4w9WgXcQ: Video unavailable. This video is no longer available because the YouTube '
+     'account associated with this video has been terminated.', PERMANENT),
+    ('[youtube] dQw4w9WgXcQ: The uploader has not made this video available in your country', PERMANENT),
+    ('[youtube] dQw4w9WgXcQ: Video unavailable. This video contains content from SME, who has blocked '
+     'it in your country on copyright grounds', PERMANENT),
+    ('[youtube] dQw4w9WgXcQ: Join this channel to get access to members-only content like this video, '
+     'and other exclusive perks.', PERMANENT),
+    ('[youtube] dQw4w9WgXcQ: This live event will begin in 3 hours.', PERMANENT),
+    ('[youtube] dQw4w9WgXcQ: Premieres in 2 days', PERMANENT),
+    ('Unsupported URL: https://example.com/video', PERMANENT),
+    ('[youtube:truncated_id] dQw4w9: Incomplete YouTube ID dQw4w9. URL https://www.youtube.com/watch?v=dQw4w9 '
+     'looks truncated.', PERMANENT),
+    # Another client emulation or a later attempt may get through
+    ("[youtube] dQw4w9WgXcQ: Sign in to confirm you're not a bot. This helps protect our community.", TRANSIENT),
+    ('unable to download video data: HTTP Error 403: Forbidden', TRANSIENT),
+    ('[youtube] dQw4w9WgXcQ: Unable to download API page: HTTP Error 429: Too Many Requests', TRANSIENT),
+    ('[youtube] dQw4w9WgXcQ: Unable to download webpage: <urlopen error [Errno 110] Connection timed out>',
+     TRANSIENT),
+    ('Did not get any data blocks', TRANSIENT),
+    ('fragment 1 not found, unable to continue', TRANSIENT),
+    ('[youtube] dQw4w9WgXcQ: Requested format is not available. Use --list-formats for a list of available '
+     'formats', TRANSIENT),
+    ('The read operation timed out', TRANSIENT),
+]
+
+
+class ClassifyTests(SimpleTestCase):
+    def test_yt_dlp_messages(self):
+        for message, kind in CASES:
+            with self.subTest(message=message):
+                failure = classify(download_error(message))
+                self.assertEqual(failure.kind, kind)
+                self.assertEqual(failure.retryable, kind == TRANSIENT)
+
+    def test_typed_causes(self):
+        cases = [
+            (download_error('Conversion failed!', PostProcessingError('Conversion failed!')), POSTPROCESSING),
+            (download_error('geo', GeoRestrictedError('The uploader has not made this video available')), PERMANENT),
+            (OSError(errno.ENOSPC, 'No space left on device'), DISK_FULL),
+            (download_error('[Errno 28] No space left on device', OSError(errno.ENOSPC, 'No space')), DISK_FULL),
+            (ConnectionResetError(errno.ECONNRESET, 'Connection reset by peer'), TRANSIENT),
+            (ValueError('anything unexpected'), TRANSIENT),
+        ]
+        for exc, kind in cases:
+            with self.subTest(exc=exc):
+                self.assertEqual(classify(exc).kind, kind)
+
+    def test_cause_is_kept(self):
+        exc = download_error('Private video')
+        self.assertIs(classify(exc).__cause__, exc)
+
+    def test_classified_errors_pass_through(self):
+        failure = PermanentError('gone')
+        self.assertIs(classify(failure), failure)
+
+    def test_kind_round_trips_through_child(self):
+        for kind in (PERMANENT, TRANSIENT, POSTPROCESSING, DISK_FULL):
+            with self.subTest(kind=kind):
+                self.assertEqual(from_kind(kind, 'message').kind, kind)
+        self.assertIsInstance(from_kind(None, 'message'), TransientError)
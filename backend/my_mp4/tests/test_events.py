@@ -0,0 +1,138 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from my_mp4 import flight, views
+from my_mp4.events import job_events
+from my_mp4.models import DownloadRequest
+
+from . import ProgressStoreMixin
+
+URL = 'https://www.youtube.com/watch?v=eventsvid01'
+
+
+def parse(frame):
+    """(event, data) of an SSE frame, ('keepalive', None) for comments"""
+    if frame.startswith(':'):
+        return 'keepalive', None
+    event, data = frame.strip().split('\n')
+    return event[len('event: '):], json.loads(data[len('data: '):])
+
+
+def last_progress(events):
+    return events[-1][1]['progress'] if events else None
+
+
+def set_status(request_id, status):
+    return sync_to_async(DownloadRequest.objects.filter(id=request_id).update)(status=status)
+
+
+@override_settings(BACKGROUND_SERVICES=False)
+class JobEventsTests(ProgressStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Short ticks keep the tests quick; the logic does not depend on them
+        patcher = mock.patch('my_mp4.events.TICK_INTERVAL', 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.progress = views.download_progress
+
+    def request_row(self, status='processing', **fields):
+        return DownloadRequest.objects.create(url=URL, format_choice='mp4', status=status, **fields)
+
+    def stream(self, request_id, script):
+        """Run a job's event stream while script(events) drives the job; returns the parsed events"""
+        async def scenario():
+            events = []
+
+            async def consume():
+                async for frame in job_events(self.progress, request_id):
+                    events.append(parse(frame))
+
+            stream = asyncio.create_task(consume())
+            await script(events)
+            await asyncio.wait_for(stream, 5)
+            return events
+
+        return async_to_sync(scenario)()
+
+    async def wait_for(self, events, condition, timeout=2):
+        for _ in range(int(timeout / 0.01)):
+            if condition(events):
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f'Timed out, stream so far: {events}')
+
+    def test_progress_then_completion(self):
+        job = self.request_row()
+
+        async def script(events):
+            for percent in (20, 40):
+                self.progress.update(job.id, percent, status='processing', force=True)
+                await self.wait_for(events, lambda e: last_progress(e) == percent)
+            # The terminal record lands before the row is settled
+            self.progress.finish(job.id, 'completed')
+            await asyncio.sleep(0.3)
+            self.progress.update(job.id, 60, status='processing', force=True)
+            await self.wait_for(events, lambda e: last_progress(e) == 60)
+            await set_status(job.id, 'completed')
+
+        events = self.stream(job.id, script)
+        self.assertEqual([(event, data['progress']) for event, data in events], [
+            ('progress', 0), ('progress', 20), ('progress', 40), ('progress', 60), ('completed', 100),
+        ])
+
+    def test_finished_job_closes_at_once(self):
+        for status in ('completed', 'failed', 'cancelled'):
+            with self.subTest(status=status):
+                job = self.request_row(status)
+
+                async def script(events):
+                    pass
+
+                events = self.stream(job.id, script)
+                self.assertEqual([event for event, _ in events], [status])
+
+    def test_follower_watches_the_heir_after_a_hand_over(self):
+        leader = self.request_row(flight_key='events:mp4')
+        heir = self.request_row('waiting', leader=leader)
+        follower = self.request_row('waiting', leader=leader)
+
+        async def script(events):
+            self.progress.update(leader.id, 30, status='processing', force=True)
+            await self.wait_for(events, lambda e: last_progress(e) == 30)
+
+            # The leader is cancelled and the oldest follower fetches for the rest
+            await set_status(leader.id, 'cancelled')
+            self.progress.finish(leader.id, 'cancelled')
+            await sync_to_async(flight.hand_over)(leader)
+            self.progress.update(heir.id, 50, status='processing', force=True)
+            # Long before the keepalive re-check
+            await self.wait_for(events, lambda e: last_progress(e) == 50)
+
+            await set_status(heir.id, 'completed')
+            await set_status(follower.id, 'completed')
+
+        events = self.stream(follower.id, script)
+        self.assertEqual([(event, data['progress']) for event, data in events], [
+            ('progress', 0), ('progress', 30), ('progress', 50), ('completed', 100),
+        ])
+
+
+@override_settings(BACKGROUND_SERVICES=False)
+class StreamStatusTests(ProgressStoreMixin, TransactionTestCase):
+    # Under WSGI the stream runs on a loop of its own, whose ORM calls use
+    # another connection than the test
+    def test_wsgi_gets_a_sync_stream(self):
+        job = DownloadRequest.objects.create(url=URL, format_choice='mp4', status='completed')
+        response = self.client.get(f'/api/status/{job.id}/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertFalse(response.is_async)
+        frames = b''.join(response.streaming_content).decode()
+        self.assertEqual(parse(frames)[0], 'completed')
+
+    def test_unknown_job_is_404(self):
+        self.assertEqual(self.client.get('/api/status/999999/stream/').status_code, 404)
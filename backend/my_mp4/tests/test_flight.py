@@ -0,0 +1,76 @@
+import json
+
+from django.test import TestCase, override_settings
+
+from my_mp4 import cache, flight
+from my_mp4.jobs import recover_stale_jobs
+from my_mp4.models import DownloadRequest
+
+from . import ProgressStoreMixin
+
+URL = 'https://www.youtube.com/watch?v=flightvid01'
+VIDEO_ID = 'flightvid01'
+
+
+def request_row(status='queued', **fields):
+    return DownloadRequest.objects.create(url=URL, format_choice='mp4', status=status, **fields)
+
+
+@override_settings(BACKGROUND_SERVICES=False, ADMISSION={'MIN_FREE_BYTES': 0})
+class SingleFlightTests(ProgressStoreMixin, TestCase):
+    def start_download(self, device_id):
+        response = self.client.post(
+            '/api/download/',
+            json.dumps({'url': URL, 'format': 'mp4', 'device_id': device_id}),
+            content_type='application/json',
+        )
+        self.assertLess(response.status_code, 300, response.content)
+        return DownloadRequest.objects.get(id=response.json()['request_id'])
+
+    def test_same_video_shares_one_job(self):
+        first = self.start_download('device-a')
+        second = self.start_download('device-b')
+        self.assertEqual(first.status, 'queued')
+        self.assertEqual((second.status, second.leader_id), ('waiting', first.id))
+        self.assertEqual(DownloadRequest.objects.filter(status='queued').count(), 1)
+
+    def test_interleaved_requests_elect_one_leader(self):
+        # Both rows exist before either claims the key, as with two workers at once
+        first, second = request_row(), request_row()
+        self.assertIsNone(flight.join_or_lead(first, VIDEO_ID))
+        self.assertEqual(flight.join_or_lead(second, VIDEO_ID).id, first.id)
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.flight_key), ('waiting', None))
+
+    def test_failed_leader_releases_the_key(self):
+        leader = request_row()
+        flight.join_or_lead(leader, VIDEO_ID)
+        follower = request_row()
+        flight.join_or_lead(follower, VIDEO_ID)
+
+        DownloadRequest.objects.filter(id=leader.id).update(status='failed', error_kind='transient')
+        flight.land(leader)
+        follower.refresh_from_db()
+        self.assertEqual((follower.status, follower.error_kind), ('failed', 'transient'))
+
+        # A later request gets to try again as the new leader
+        retry = request_row()
+        self.assertIsNone(flight.join_or_lead(retry, VIDEO_ID))
+        retry.refresh_from_db()
+        self.assertEqual((retry.status, retry.flight_key), ('queued', leader.flight_key))
+
+    def test_crashed_leader_is_swept(self):
+        leader = request_row()
+        flight.join_or_lead(leader, VIDEO_ID)
+        follower = request_row()
+        flight.join_or_lead(follower, VIDEO_ID)
+        # The worker died and the leader ended without land()
+        DownloadRequest.objects.filter(id=leader.id).update(status='failed')
+
+        recover_stale_jobs()
+        leader.refresh_from_db()
+        self.assertIsNone(leader.flight_key)
+        self.assertFalse(flight.in_flight(VIDEO_ID, 'mp4', cache.request_quality(leader)))
+
+        follower.refresh_from_db()
+        self.assertEqual(follower.status, 'failed')
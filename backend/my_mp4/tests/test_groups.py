@@ -0,0 +1,56 @@
+import json
+
+from django.test import TestCase, override_settings
+
+from my_mp4 import groups
+from my_mp4.models import DownloadGroup, DownloadRequest
+
+from . import ProgressStoreMixin
+
+
+def video_urls(count):
+    return [f'https://www.youtube.com/watch?v=batch{index:06d}' for index in range(count)]
+
+
+@override_settings(
+    BACKGROUND_SERVICES=False,
+    DOWNLOAD_GROUPS={'MAX_ITEMS': 200, 'MAX_PARALLEL': 3},
+    ADMISSION={'MAX_QUEUED': 5, 'MAX_ACTIVE': 8, 'MIN_FREE_BYTES': 0},
+)
+class BatchLimitTests(ProgressStoreMixin, TestCase):
+    def start_batch(self, urls=None, **data):
+        return self.client.post(
+            '/api/batch/',
+            json.dumps(dict(data, urls=urls, device_id='batch-device', format='mp4')),
+            content_type='application/json',
+        )
+
+    def test_max_items_is_capped_by_admission(self):
+        self.assertEqual(groups.max_items(), 5)
+
+    def test_batch_over_the_limit_is_refused_up_front(self):
+        response = self.start_batch(video_urls(6))
+        # Not a 503: retrying later could never get it admitted
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['max_items'], 5)
+        self.assertNotIn('Retry-After', response)
+        self.assertFalse(DownloadGroup.objects.exists())
+
+    def test_batch_at_the_limit_fits_an_empty_queue(self):
+        response = self.start_batch(video_urls(5))
+        self.assertLess(response.status_code, 300, response.content)
+        self.assertEqual(DownloadRequest.objects.filter(status='queued').count(), 5)
+
+    def test_full_queue_still_gets_retry_after(self):
+        self.start_batch(video_urls(5))
+        response = self.start_batch([f'https://www.youtube.com/watch?v=other{index:06d}' for index in range(2)])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_malformed_urls_are_400(self):
+        for data in ({'urls': 'https://www.youtube.com/watch?v=batch000001'}, {'urls': [123]}, {'url': 123},
+                     {'url': ['https://www.youtube.com/playlist?list=PL0123456789']}):
+            with self.subTest(data=data):
+                response = self.start_batch(**data)
+                self.assertEqual(response.status_code, 400, response.content)
+        self.assertFalse(DownloadGroup.objects.exists())
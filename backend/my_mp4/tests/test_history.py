@@ -0,0 +1,88 @@
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from my_mp4.models import DownloadRequest
+
+from . import ProgressStoreMixin
+
+DEVICE = 'history-device'
+
+
+@override_settings(BACKGROUND_SERVICES=False)
+class HistoryCursorTests(ProgressStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # Three rows share a created_at, so only the id tells them apart
+        stamps = [now, now - timedelta(minutes=1), now - timedelta(minutes=1), now - timedelta(minutes=1),
+                  now - timedelta(minutes=2)]
+        self.ids = []
+        for index, stamp in enumerate(stamps):
+            row = DownloadRequest.objects.create(
+                url=f'https://www.youtube.com/watch?v=history{index:04d}', format_choice='mp4',
+                status='completed', device_id=DEVICE, file_path=f'/media/history{index}.mp4', file_exists=True,
+            )
+            DownloadRequest.objects.filter(id=row.id).update(created_at=stamp)
+            self.ids.append(row.id)
+        # Not listed: another device, unfinished, or gone from disk
+        DownloadRequest.objects.create(url='https://www.youtube.com/watch?v=elsewhere01', format_choice='mp4',
+                                       status='completed', device_id='other-device', file_exists=True)
+        DownloadRequest.objects.create(url='https://www.youtube.com/watch?v=unfinished1', format_choice='mp4',
+                                       status='processing', device_id=DEVICE)
+        DownloadRequest.objects.create(url='https://www.youtube.com/watch?v=deleted0001', format_choice='mp4',
+                                       status='completed', device_id=DEVICE, file_exists=False)
+
+    def page(self, **params):
+        response = self.client.get('/api/downloads/history/', dict(params, device_id=DEVICE))
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['id'] for row in response.json()], response.get('X-Next-Cursor')
+
+    def test_pages_cover_every_row_once_across_ties(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            ids, cursor = self.page(**params)
+            seen += ids
+            pages += 1
+            if not cursor:
+                break
+        # Newest first, ties newest id first
+        self.assertEqual(seen, [self.ids[0], self.ids[3], self.ids[2], self.ids[1], self.ids[4]])
+        self.assertEqual(pages, 3)
+
+    def test_split_inside_a_tie(self):
+        ids, cursor = self.page(limit=2)
+        self.assertEqual(ids, [self.ids[0], self.ids[3]])
+        ids, _ = self.page(limit=1, cursor=cursor)
+        self.assertEqual(ids, [self.ids[2]])
+
+    def test_last_page_has_no_cursor(self):
+        ids, cursor = self.page(limit=5)
+        self.assertEqual(len(ids), 5)
+        self.assertIsNone(cursor)
+
+        _, cursor = self.page(limit=4)
+        ids, cursor = self.page(limit=4, cursor=cursor)
+        self.assertEqual(ids, [self.ids[4]])
+        self.assertIsNone(cursor)
+
+    def test_malformed_cursor_is_400(self):
+        cursors = [
+            'not base64!',
+            'abc',
+            urlsafe_b64encode(b'\xff\xfe').decode(),
+            urlsafe_b64encode(b'no separator').decode(),
+            urlsafe_b64encode(b'yesterday|1').decode(),
+            urlsafe_b64encode(b'2026-01-01T00:00:00+00:00|one').decode(),
+            urlsafe_b64encode(b'2026-01-01T00:00:00+00:00|1|2').decode(),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/downloads/history/', {'device_id': DEVICE, 'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Invalid cursor')
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# Budget for `import my_mp4.views` after django.setup(), as measured by
+# `python -X importtime` (cumulative microseconds). Every gunicorn worker
+# and management command pays it, so it bounds cold starts.
+VIEWS_IMPORT_BUDGET_US = 150_000
+
+# Loaded on first use only
+LAZY_MODULES = ('yt_dlp', 'requests', 'urllib3')
+
+PROBE = """
+import sys, threading
+import django
+django.setup()
+before = {thread.name for thread in threading.enumerate()}
+import my_mp4.views
+print(','.join(name for name in %r if name in sys.modules))
+print(','.join(sorted({thread.name for thread in threading.enumerate()} - before)))
+""" % (LAZY_MODULES,)
+
+
+class ImportTimeTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE],
+            cwd=settings.BASE_DIR,
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        cls.loaded, cls.threads = result.stdout.splitlines()[-2:]
+        cls.cumulative = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            cls.cumulative[name.strip()] = int(cumulative_us)
+
+    def test_views_import_within_budget(self):
+        self.assertLess(self.cumulative['my_mp4.views'], VIEWS_IMPORT_BUDGET_US)
+
+    def test_heavy_dependencies_are_lazy(self):
+        self.assertEqual(self.loaded, '')
+
+    def test_import_starts_no_threads(self):
+        self.assertEqual(self.threads, '')
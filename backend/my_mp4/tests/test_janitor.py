@@ -0,0 +1,138 @@
+import os
+import time
+
+from django.test import TestCase, override_settings
+
+from my_mp4 import storage
+from my_mp4.janitor import MediaJanitor
+from my_mp4.models import DownloadRequest
+
+from .test_media import MediaRootMixin
+
+JANITOR = {
+    'HIGH_WATERMARK': 1500, 'LOW_WATERMARK': 500, 'MAX_AGE': None, 'GRACE_PERIOD': 60,
+    'BATCH_SIZE': 2, 'BATCH_PAUSE': 0, 'INTERVAL': 600,
+}
+
+
+class JanitorTestMixin(MediaRootMixin):
+    def aged_file(self, name, age, size=400):
+        file_path = self.make_file(name, size)
+        self.age(file_path, age)
+        return file_path
+
+    def age(self, path, seconds):
+        past = time.time() - seconds
+        os.utime(path, (past, past))
+
+    def row(self, file_path, status='completed'):
+        return DownloadRequest.objects.create(
+            url='https://www.youtube.com/watch?v=janitor0001', format_choice='mp4', status=status,
+            file_path=file_path, file_exists=status == 'completed',
+        )
+
+    def sweep(self, **kwargs):
+        return MediaJanitor(self.media_root).sweep(**kwargs)
+
+
+@override_settings(MEDIA_JANITOR=JANITOR)
+class WatermarkTests(JanitorTestMixin, TestCase):
+    def test_evicts_least_recently_used_down_to_the_low_watermark(self):
+        # 1600 bytes, over the high watermark
+        files = [self.aged_file(f'{hours}h.mp4', hours * 3600) for hours in (4, 3, 2, 1)]
+        rows = [self.row(file_path) for file_path in files]
+
+        report = self.sweep()
+        self.assertEqual([os.path.exists(path) for path in files], [False, False, False, True])
+        self.assertEqual((report['removed'], report['freed'], report['usage']), (3, 1200, 400))
+        self.assertEqual(
+            [DownloadRequest.objects.get(id=row.id).file_exists for row in rows], [False, False, False, True],
+        )
+
+    def test_reading_a_file_keeps_it(self):
+        files = [self.aged_file(f'{hours}h.mp4', hours * 3600) for hours in (4, 3, 2, 1)]
+        # The oldest was served a moment ago, so it is the most recently used
+        now = time.time()
+        os.utime(files[0], (now - 120, now - 4 * 3600))
+
+        self.sweep()
+        self.assertEqual([os.path.exists(path) for path in files], [True, False, False, False])
+
+    def test_under_the_high_watermark_nothing_goes(self):
+        files = [self.aged_file(f'{hours}h.mp4', hours * 3600) for hours in (4, 3, 2)]
+        self.assertEqual(self.sweep()['removed'], 0)
+        self.assertTrue(all(os.path.exists(path) for path in files))
+
+    def test_files_in_use_are_never_evicted(self):
+        active = self.aged_file('active.mp4', 5 * 3600)
+        self.row(active, status='processing')
+        partial = self.aged_file('partial.mp4.part', 5 * 3600)
+        fresh = self.aged_file('fresh.mp4', 10)
+        old = self.aged_file('old.mp4', 4 * 3600)
+
+        report = self.sweep()
+        self.assertEqual([os.path.exists(path) for path in (active, partial, fresh, old)], [True, True, True, False])
+        self.assertEqual(report['removed'], 1)
+
+    def test_dry_run_only_reports(self):
+        files = [self.aged_file(f'{hours}h.mp4', hours * 3600) for hours in (4, 3, 2, 1)]
+        report = self.sweep(dry_run=True)
+        self.assertEqual(report['removed'], 3)
+        self.assertTrue(all(os.path.exists(path) for path in files))
+
+
+@override_settings(MEDIA_JANITOR=dict(JANITOR, HIGH_WATERMARK=10 ** 9, LOW_WATERMARK=10 ** 9, MAX_AGE=3600))
+class AgeExpiryTests(JanitorTestMixin, TestCase):
+    def test_files_past_max_age_go_regardless_of_usage(self):
+        expired = self.aged_file('expired.mp4', 2 * 3600, size=10)
+        kept = self.aged_file('kept.mp4', 1800, size=10)
+        row = self.row(expired)
+
+        report = self.sweep()
+        self.assertFalse(os.path.exists(expired))
+        self.assertTrue(os.path.exists(kept))
+        self.assertEqual(report['removed'], 1)
+        row.refresh_from_db()
+        self.assertFalse(row.file_exists)
+
+    def test_vanished_files_are_flagged(self):
+        gone = self.aged_file('gone.mp4', 10, size=10)
+        row = self.row(gone)
+        os.remove(gone)
+
+        self.assertEqual(self.sweep()['stale_rows'], 1)
+        row.refresh_from_db()
+        self.assertFalse(row.file_exists)
+
+
+@override_settings(MEDIA_JANITOR=dict(JANITOR, HIGH_WATERMARK=10 ** 9, LOW_WATERMARK=10 ** 9))
+class AbandonedIncomingTests(JanitorTestMixin, TestCase):
+    def job_dir(self, job_id, age):
+        path = storage.incoming_dir(job_id)
+        os.makedirs(path)
+        with open(os.path.join(path, 'video.mp4.part'), 'wb') as f:
+            f.write(b'partial')
+        self.age(path, age)
+        return path
+
+    def test_working_directories_of_finished_jobs_are_removed(self):
+        failed = self.row(None, status='failed')
+        running = self.row(None, status='processing')
+        dirs = {
+            'failed': self.job_dir(failed.id, 3600),
+            'no row': self.job_dir(999999, 3600),
+            'running': self.job_dir(running.id, 3600),
+            # Within the grace period, the job may only just have started
+            'fresh': self.job_dir(999998, 10),
+        }
+
+        report = self.sweep()
+        self.assertEqual(report['abandoned_jobs'], 2)
+        self.assertEqual(
+            {name: os.path.exists(path) for name, path in dirs.items()},
+            {'failed': False, 'no row': False, 'running': True, 'fresh': True},
+        )
+
+    def test_partial_files_do_not_count_as_media(self):
+        self.job_dir(999999, 10)
+        self.assertEqual(self.sweep()['scanned'], 0)
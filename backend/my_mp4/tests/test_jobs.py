@@ -0,0 +1,120 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from my_mp4.jobs import JobQueue, recover_stale_jobs
+from my_mp4.models import DownloadGroup, DownloadRequest
+
+from . import ProgressStoreMixin
+
+
+def queued(format_choice='mp4', priority=0, **fields):
+    return DownloadRequest.objects.create(
+        url='https://www.youtube.com/watch?v=abc', format_choice=format_choice,
+        status='queued', priority=priority, **fields
+    )
+
+
+@override_settings(BACKGROUND_SERVICES=False)
+class ClaimTests(ProgressStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.queue = JobQueue(handler=None)
+
+    def test_claims_lowest_priority_first(self):
+        queued(priority=50)
+        first = queued(priority=10)
+        job = self.queue.claim('mp4')
+        self.assertEqual(job.id, first.id)
+        self.assertEqual((job.status, job.worker_id, job.attempts), ('processing', self.queue.worker_id, 1))
+        self.assertIsNotNone(job.heartbeat_at)
+
+    def test_job_is_claimed_once(self):
+        job = queued()
+        other = JobQueue(handler=None)
+        other.worker_id = 'elsewhere:1'
+        self.assertEqual(self.queue.claim('mp4').id, job.id)
+        self.assertIsNone(other.claim('mp4'))
+        job.refresh_from_db()
+        self.assertEqual(job.worker_id, self.queue.worker_id)
+
+    def test_claim_loses_race_for_the_row(self):
+        group = DownloadGroup.objects.create(max_parallel=3)
+        job = queued(group=group)
+
+        def claimed_elsewhere(group_id):
+            # Another worker's UPDATE lands between our SELECT and UPDATE
+            DownloadRequest.objects.filter(id=job.id).update(status='processing', worker_id='elsewhere:1')
+            return True
+
+        with mock.patch('my_mp4.jobs.groups.has_room', side_effect=claimed_elsewhere):
+            self.assertIsNone(self.queue.claim('mp4'))
+        job.refresh_from_db()
+        self.assertEqual((job.worker_id, job.attempts), ('elsewhere:1', 0))
+
+    def test_lanes_take_their_own_formats(self):
+        mp3 = queued('mp3')
+        self.assertIsNone(self.queue.claim('mp4'))
+        self.assertEqual(self.queue.claim('mp3').id, mp3.id)
+
+    def test_retry_delay_is_respected(self):
+        queued(not_before=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(self.queue.claim('mp4'))
+
+    def test_full_group_does_not_starve_the_lane(self):
+        group = DownloadGroup.objects.create(max_parallel=1)
+        queued(priority=1, group=group)
+        later = queued(priority=2)
+        # The group filled up after saturated() was read
+        with mock.patch('my_mp4.jobs.groups.has_room', side_effect=lambda group_id: group_id != group.id):
+            job = self.queue.claim('mp4')
+        self.assertEqual(job.id, later.id)
+
+    def test_saturated_group_waits(self):
+        group = DownloadGroup.objects.create(max_parallel=1)
+        running = queued(group=group)
+        running.status = 'processing'
+        running.save()
+        waiting = queued(priority=1, group=group)
+        self.assertIsNone(self.queue.claim('mp4'))
+        running.status = 'completed'
+        running.save()
+        self.assertEqual(self.queue.claim('mp4').id, waiting.id)
+
+
+@override_settings(BACKGROUND_SERVICES=False, DOWNLOAD_QUEUE={'STALE_AFTER': 120, 'MAX_ATTEMPTS': 3})
+class RecoveryTests(ProgressStoreMixin, TestCase):
+    def processing(self, heartbeat_age, attempts=1):
+        return DownloadRequest.objects.create(
+            url='https://www.youtube.com/watch?v=abc', status='processing', worker_id='dead:1',
+            attempts=attempts, heartbeat_at=timezone.now() - timedelta(seconds=heartbeat_age),
+        )
+
+    def test_expired_heartbeat_is_requeued(self):
+        job = self.processing(heartbeat_age=300)
+        self.assertEqual(recover_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id), ('queued', None))
+        # Claimable again by a live worker
+        self.assertEqual(JobQueue(handler=None).claim('mp4').id, job.id)
+
+    def test_live_heartbeat_is_left_alone(self):
+        job = self.processing(heartbeat_age=10)
+        self.assertEqual(recover_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id), ('processing', 'dead:1'))
+
+    def test_exhausted_job_fails(self):
+        job = self.processing(heartbeat_age=300, attempts=3)
+        recover_stale_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_heartbeat_keeps_a_slow_job(self):
+        job = self.processing(heartbeat_age=300)
+        JobQueue(handler=None).touch([job.id])
+        self.assertEqual(recover_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'processing')
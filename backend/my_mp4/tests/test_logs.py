@@ -0,0 +1,91 @@
+import asyncio
+import io
+import json
+import logging
+import threading
+
+from django.test import SimpleTestCase
+
+from my_mp4.logs import BackgroundHandler, JsonFormatter, log_context
+
+
+class BackgroundHandlerTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stream = io.StringIO()
+        self.handler = BackgroundHandler(self.stream)
+        self.handler.setFormatter(JsonFormatter())
+        self.addCleanup(self.handler.close)
+        self.logger = logging.getLogger(f'my_mp4.tests.logs.{self._testMethodName}')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def lines(self):
+        """Stop the writer thread and parse what it wrote"""
+        self.handler.close()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_context_fields_are_emitted(self):
+        with log_context(request_id=7, video_id='logsvid0001'):
+            self.logger.info("Downloading %s", 'logsvid0001', extra={'client': 'web'})
+        self.logger.warning("Outside any job")
+
+        inside, outside = self.lines()
+        self.assertEqual(inside['msg'], 'Downloading logsvid0001')
+        self.assertEqual(inside['level'], 'INFO')
+        self.assertEqual(
+            (inside['request_id'], inside['video_id'], inside['client']), (7, 'logsvid0001', 'web'),
+        )
+        self.assertNotIn('request_id', outside)
+
+    def test_records_from_other_threads_keep_their_own_context(self):
+        start = threading.Barrier(4)
+
+        def job(request_id):
+            with log_context(request_id=request_id):
+                start.wait(timeout=5)
+                for step in range(20):
+                    self.logger.info("step %d of job %d", step, request_id)
+
+        threads = [threading.Thread(target=job, args=(request_id,)) for request_id in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        lines = self.lines()
+        self.assertEqual(len(lines), 80)
+        for line in lines:
+            self.assertEqual(line['msg'].rsplit(' ', 1)[1], str(line['request_id']))
+
+    def test_context_follows_asyncio_tasks(self):
+        async def job(request_id):
+            with log_context(request_id=request_id):
+                await asyncio.sleep(0)
+                await asyncio.to_thread(self.logger.info, "from a worker thread")
+
+        async def main():
+            await asyncio.gather(job(1), job(2))
+
+        asyncio.run(main())
+        self.assertEqual(sorted(line['request_id'] for line in self.lines()), [1, 2])
+
+    def test_message_and_traceback_are_resolved_when_logged(self):
+        formats = ['mp4']
+        self.logger.info("formats %s", formats)
+        # Changed before the writer thread gets to the record
+        formats.append('mp3')
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            self.logger.exception("Job failed")
+
+        logged, failed = self.lines()
+        self.assertEqual(logged['msg'], "formats ['mp4']")
+        self.assertIn('ValueError: boom', failed['exc'])
+
+    def test_unserializable_extra_is_stringified(self):
+        self.logger.info("odd extra", extra={'path': object()})
+        self.assertTrue(self.lines()[0]['path'].startswith('<object object'))
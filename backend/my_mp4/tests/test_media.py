@@ -0,0 +1,323 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import tracemalloc
+import unittest
+import zipfile
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from my_mp4 import views
+from my_mp4.media import follow_growing_file, parse_ranges, serve_media, zip_stream
+from my_mp4.models import DownloadRequest
+from my_mp4.views import download_zip
+
+from . import ProgressStoreMixin
+
+
+class MediaRootMixin(ProgressStoreMixin):
+    """A throwaway MEDIA_ROOT for the duration of each test"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, BACKGROUND_SERVICES=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_file(self, name, size):
+        file_path = os.path.join(self.media_root, name)
+        with open(file_path, 'wb') as f:
+            # Distinct blocks so a misplaced chunk shows up in the CRC check
+            for offset in range(0, size, 1 << 20):
+                f.write(os.urandom(min(1 << 20, size - offset)))
+        return file_path
+
+
+class ZipExportTests(MediaRootMixin, TestCase):
+    DEVICE = 'zip-device'
+
+    def setUp(self):
+        super().setUp()
+        self.big = self.make_file('big.mp4', 24 << 20)
+        self.small = self.make_file('small.mp3', 100_000)
+        self.rows = [
+            DownloadRequest.objects.create(
+                url='https://www.youtube.com/watch?v=abc', device_id=self.DEVICE, status='completed',
+                file_exists=True, file_path=file_path, video_title=title,
+            )
+            for file_path, title in ((self.big, 'Big one'), (self.small, 'Small/one'))
+        ]
+        self.query = {'device_id': self.DEVICE, 'ids': ','.join(str(row.id) for row in self.rows)}
+
+    def write_archive(self, chunks):
+        archive_path = os.path.join(self.media_root, 'out.zip')
+        with open(archive_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return archive_path
+
+    def assert_valid_archive(self, archive_path, names):
+        with zipfile.ZipFile(archive_path) as archive:
+            self.assertEqual(archive.namelist(), names)
+            self.assertIsNone(archive.testzip())
+
+    def test_asgi_streams_without_buffering(self):
+        request = AsyncRequestFactory().get('/api/downloads/zip/', self.query)
+        response = download_zip(request)
+        self.assertEqual(response.status_code, 200)
+        # A sync iterator would be collected into a list by the ASGI handler
+        self.assertTrue(response.is_async)
+
+        archive_path = os.path.join(self.media_root, 'out.zip')
+
+        async def consume():
+            with open(archive_path, 'wb') as f:
+                async for chunk in response:
+                    f.write(chunk)
+
+        tracemalloc.start()
+        try:
+            async_to_sync(consume)()
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # A few blocks in flight, nowhere near the 24 MiB member
+        self.assertLess(peak, 4 << 20)
+        self.assert_valid_archive(archive_path, ['Big one.mp4', 'Small_one.mp3'])
+
+    def test_wsgi_streams_sync_iterator(self):
+        request = RequestFactory().get('/api/downloads/zip/', self.query)
+        response = download_zip(request)
+        self.assertFalse(response.is_async)
+        archive_path = self.write_archive(response.streaming_content)
+        self.assert_valid_archive(archive_path, ['Big one.mp4', 'Small_one.mp3'])
+
+    @unittest.skipUnless(shutil.which('unzip'), 'unzip is not installed')
+    def test_unzip_accepts_archive(self):
+        response = download_zip(RequestFactory().get('/api/downloads/zip/', self.query))
+        archive_path = self.write_archive(response.streaming_content)
+        result = subprocess.run(['unzip', '-t', archive_path], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+    def test_vanished_files_are_skipped(self):
+        missing = os.path.join(self.media_root, 'gone.mp4')
+        entries = [('a.mp4', self.small), ('gone.mp4', missing), ('b.mp3', self.small)]
+        archive_path = self.write_archive(zip_stream(entries))
+        self.assert_valid_archive(archive_path, ['a.mp4', 'b.mp3'])
+
+    def test_missing_rows_are_skipped(self):
+        os.remove(self.small)
+        response = download_zip(RequestFactory().get('/api/downloads/zip/', self.query))
+        archive_path = self.write_archive(response.streaming_content)
+        self.assert_valid_archive(archive_path, ['Big one.mp4'])
+
+    def test_other_devices_get_nothing(self):
+        query = dict(self.query, device_id='someone-else')
+        response = download_zip(RequestFactory().get('/api/downloads/zip/', query))
+        self.assertEqual(response.status_code, 404)
+
+
+class FollowGrowingFileTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.part_path = os.path.join(self.media_root, 'video.mp4.part')
+        with open(self.part_path, 'wb') as f:
+            f.write(b'a' * 1000)
+        self.record = {'status': 'processing', 'tmpfilename': self.part_path, 'filename': 'video.mp4'}
+
+    async def test_follows_appends_until_completed(self):
+        chunks = follow_growing_file(self.part_path, lambda: self.record, block_size=400, poll_interval=0.01)
+        received = [await chunks.__anext__() for _ in range(3)]
+        # At EOF the generator polls instead of ending
+        with open(self.part_path, 'ab') as f:
+            f.write(b'b' * 500)
+        self.record['status'] = 'completed'
+        received += [chunk async for chunk in chunks]
+        self.assertEqual(b''.join(received), b'a' * 1000 + b'b' * 500)
+
+    async def test_stops_when_job_fails(self):
+        self.record['status'] = 'failed'
+        received = [chunk async for chunk in follow_growing_file(self.part_path, lambda: self.record)]
+        self.assertEqual(b''.join(received), b'a' * 1000)
+
+    def stream(self, factory, status):
+        download_request = DownloadRequest.objects.create(
+            url='https://www.youtube.com/watch?v=abc', format_choice='mp4', status=status,
+        )
+        request = factory.get(f'/api/stream/{download_request.id}/')
+        with mock.patch.object(views.download_progress, 'record', return_value=self.record):
+            response = async_to_sync(views.stream_file)(request, download_request.id)
+        self.record['status'] = 'completed'
+        return response
+
+    def test_asgi_gets_async_body(self):
+        response = self.stream(AsyncRequestFactory(), 'processing')
+        self.assertTrue(response.is_async)
+
+        async def consume():
+            return b''.join([chunk async for chunk in response])
+
+        with mock.patch.object(views.download_progress, 'record', return_value=self.record):
+            self.assertEqual(async_to_sync(consume)(), b'a' * 1000)
+
+    def test_wsgi_gets_sync_body(self):
+        response = self.stream(RequestFactory(), 'processing')
+        self.assertFalse(response.is_async)
+        with mock.patch.object(views.download_progress, 'record', return_value=self.record):
+            self.assertEqual(b''.join(response.streaming_content), b'a' * 1000)
+
+    def test_failed_job_is_refused(self):
+        response = self.stream(AsyncRequestFactory(), 'failed')
+        self.assertEqual(response.status_code, 409)
+
+
+class ServeMediaTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.file_path = self.make_file('video.mp4', 1000)
+        with open(self.file_path, 'rb') as f:
+            self.content = f.read()
+
+    def serve(self, factory=None, **headers):
+        request = (factory or RequestFactory()).get('/api/play/', headers=headers)
+        return serve_media(request, self.file_path)
+
+    def test_asgi_streams_file_in_blocks(self):
+        big = self.make_file('big.mp4', 24 << 20)
+        response = serve_media(AsyncRequestFactory().get('/api/play/'), big)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Length'], str(24 << 20))
+
+        async def consume():
+            size = 0
+            async for chunk in response:
+                size += len(chunk)
+            return size
+
+        tracemalloc.start()
+        try:
+            size = async_to_sync(consume)()
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        response.close()
+        self.assertEqual(size, 24 << 20)
+        self.assertLess(peak, 4 << 20)
+
+    def test_asgi_range(self):
+        response = self.serve(AsyncRequestFactory(), Range='bytes=10-19')
+
+        async def consume():
+            return b''.join([chunk async for chunk in response])
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(async_to_sync(consume)(), self.content[10:20])
+        response.close()
+
+    def test_full_file(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        response.close()
+
+    def test_single_range(self):
+        response = self.serve(Range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1000')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        response.close()
+
+    def test_suffix_range(self):
+        response = self.serve(Range='bytes=-300')
+        self.assertEqual(response['Content-Range'], 'bytes 700-999/1000')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-300:])
+        response.close()
+
+    def test_open_range_past_the_end_is_clamped(self):
+        response = self.serve(Range='bytes=900-5000')
+        self.assertEqual(response['Content-Range'], 'bytes 900-999/1000')
+        response.close()
+
+    def test_unsatisfiable_range(self):
+        response = self.serve(Range='bytes=1000-1100')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1000')
+
+    def test_multipart_byteranges(self):
+        response = self.serve(Range='bytes=0-9,500-509')
+        self.assertEqual(response.status_code, 206)
+        content_type = response['Content-Type']
+        self.assertTrue(content_type.startswith('multipart/byteranges; boundary='))
+        boundary = content_type.split('boundary=')[1]
+        body = b''.join(response.streaming_content)
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(parts[-1], b'--\r\n')
+        self.assertIn(b'Content-Range: bytes 0-9/1000\r\n\r\n' + self.content[:10] + b'\r\n', parts[1])
+        self.assertIn(b'Content-Range: bytes 500-509/1000\r\n\r\n' + self.content[500:510] + b'\r\n', parts[2])
+
+    def test_overlapping_ranges_are_coalesced(self):
+        response = self.serve(Range='bytes=0-99,50-149,150-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 0-199/1000')
+        self.assertEqual(b''.join(response.streaming_content), self.content[:200])
+        response.close()
+
+    def test_malformed_range_is_ignored(self):
+        for header in ('bytes=10-5', 'bytes=abc', 'items=0-10', 'bytes=' + ','.join(['0-0'] * 17)):
+            with self.subTest(header=header):
+                response = self.serve(Range=header)
+                self.assertEqual(response.status_code, 200)
+                response.close()
+
+    def test_if_range_etag_mismatch_sends_whole_file(self):
+        response = self.serve(Range='bytes=0-9', **{'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        response.close()
+
+    def test_if_range_current_etag_sends_range(self):
+        etag = self.serve()['ETag']
+        response = self.serve(Range='bytes=0-9', **{'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        response.close()
+
+    def test_if_none_match(self):
+        etag = self.serve()['ETag']
+        response = self.serve(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+
+class ParseRangesTests(SimpleTestCase):
+    def test_ranges(self):
+        cases = [
+            ('bytes=0-99', [(0, 99)]),
+            ('bytes=-100', [(900, 999)]),
+            ('bytes=-5000', [(0, 999)]),
+            ('bytes=990-', [(990, 999)]),
+            ('bytes=0-0,-1', [(0, 0), (999, 999)]),
+            ('bytes=500-599,0-99', [(0, 99), (500, 599)]),
+            ('bytes=0-99,100-199', [(0, 199)]),
+            ('bytes=0-499,100-199', [(0, 499)]),
+            ('bytes=1000-', []),
+            ('bytes=-0', []),
+            ('bytes=1000-1001,2000-', []),
+            ('bytes=5-1', None),
+            ('bytes=-', None),
+            ('bytes=0-1;x', None),
+            ('', None),
+            ('chunks=0-1', None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(parse_ranges(header, 1000), expected)
+
+    def test_unsatisfiable_parts_are_dropped(self):
+        self.assertEqual(parse_ranges('bytes=0-9,2000-2009', 1000), [(0, 9)])
@@ -0,0 +1,129 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from yt_dlp import YoutubeDL
+
+from my_mp4 import metacache
+from my_mp4.metacache import MetadataCache, extract_raw_info, info_key
+
+VIDEO_ID = 'metavid0001'
+URL = f'https://www.youtube.com/watch?v={VIDEO_ID}'
+RAW_INFO = {
+    'id': VIDEO_ID, 'title': 'Cached metadata', 'duration': 60, 'extractor': 'youtube', 'extractor_key': 'Youtube',
+    'webpage_url': URL,
+    'formats': [
+        {'format_id': '18', 'ext': 'mp4', 'url': 'https://example.com/18.mp4', 'vcodec': 'avc1', 'acodec': 'mp4a',
+         'height': 360},
+        {'format_id': '22', 'ext': 'mp4', 'url': 'https://example.com/22.mp4', 'vcodec': 'avc1', 'acodec': 'mp4a',
+         'height': 720},
+    ],
+}
+
+
+class ClockMixin:
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch('my_mp4.metacache.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ExpiryTests(ClockMixin, SimpleTestCase):
+    def test_entry_expires_after_its_ttl(self):
+        cache = MetadataCache(ttl=30)
+        cache.set('key', {'duration': 5})
+        self.now += 29
+        self.assertEqual(cache.get('key'), {'duration': 5})
+        self.assertTrue(cache.has('key'))
+        self.now += 1
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.has('key'))
+        self.assertIsNone(cache.peek('key', 'duration'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_per_entry_ttl(self):
+        cache = MetadataCache(ttl=30)
+        cache.set('short', 'x', ttl=5)
+        cache.set('long', 'y')
+        self.now += 10
+        self.assertIsNone(cache.get('short'))
+        self.assertEqual(cache.get('long'), 'y')
+
+    def test_hits_are_copies(self):
+        cache = MetadataCache()
+        cache.set('key', {'formats': [1, 2]})
+        cache.get('key')['formats'].append(3)
+        self.assertEqual(cache.get('key'), {'formats': [1, 2]})
+
+
+class EvictionTests(ClockMixin, SimpleTestCase):
+    def test_least_recently_used_goes_first(self):
+        cache = MetadataCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # A read makes 'a' the most recent, so 'b' is evicted
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_rewrite_refreshes_position(self):
+        cache = MetadataCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 10)
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b')), (10, None))
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'metacache-default'},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'metacache-shared'},
+    })
+    def test_evicted_entry_comes_back_from_the_shared_cache(self):
+        cache = MetadataCache(max_entries=1, shared_alias='shared')
+        self.addCleanup(cache.shared.clear)
+        cache.set('a', {'duration': 1})
+        cache.set('b', {'duration': 2})
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.get('a'), {'duration': 1})
+        self.assertEqual(cache.stats()['misses'], 0)
+
+
+class ProcessCachedInfoTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        cache = MetadataCache()
+        patcher = mock.patch.object(metacache, 'metadata_cache', cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_job_skips_extraction(self):
+        ydl = YoutubeDL({'quiet': True, 'format': 'best'})
+        with mock.patch.object(ydl, 'extract_info', return_value=dict(RAW_INFO)) as extract:
+            first = extract_raw_info(ydl, URL, VIDEO_ID, 'web')
+            second = extract_raw_info(ydl, URL, VIDEO_ID, 'web')
+        extract.assert_called_once_with(URL, download=False, process=False)
+        self.assertEqual(second['formats'], first['formats'])
+
+        # Format selection runs on the cached dict as it would on a fresh one
+        info = ydl.process_ie_result(second, download=False)
+        self.assertEqual(info['format_id'], '22')
+        self.assertEqual(info['url'], 'https://example.com/22.mp4')
+        # and leaves the cached copy unprocessed for the next job
+        self.assertNotIn('requested_formats', metacache.cached_raw_info(VIDEO_ID, 'web'))
+        self.assertNotIn('format_id', metacache.cached_raw_info(VIDEO_ID, 'web'))
+
+    def test_profiles_are_cached_apart(self):
+        ydl = YoutubeDL({'quiet': True})
+        with mock.patch.object(ydl, 'extract_info', return_value=dict(RAW_INFO)) as extract:
+            extract_raw_info(ydl, URL, VIDEO_ID, 'web')
+            extract_raw_info(ydl, URL, VIDEO_ID, 'android')
+        self.assertEqual(extract.call_count, 2)
+        self.assertIsNotNone(metacache.metadata_cache.get(info_key(VIDEO_ID, 'android')))
+
+    def test_playlists_are_not_cached_as_videos(self):
+        ydl = YoutubeDL({'quiet': True})
+        with mock.patch.object(ydl, 'extract_info', return_value={'_type': 'playlist', 'entries': []}):
+            extract_raw_info(ydl, URL, VIDEO_ID, 'web')
+        self.assertIsNone(metacache.cached_raw_info(VIDEO_ID, 'web'))
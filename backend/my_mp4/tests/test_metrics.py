@@ -0,0 +1,23 @@
+from django.test import TestCase, override_settings
+
+from my_mp4.metacache import MetadataCache
+from my_mp4.metrics import metadata_lookups_total
+
+from . import ProgressStoreMixin
+
+
+@override_settings(BACKGROUND_SERVICES=False)
+class MetadataLookupMetricTests(ProgressStoreMixin, TestCase):
+    def test_lookups_are_a_counter(self):
+        cache = MetadataCache()
+        cache.set('key', {'duration': 5})
+        hits, misses = metadata_lookups_total.value(result='hit'), metadata_lookups_total.value(result='miss')
+        cache.get('key')
+        cache.get('missing')
+        self.assertEqual(metadata_lookups_total.value(result='hit'), hits + 1)
+        self.assertEqual(metadata_lookups_total.value(result='miss'), misses + 1)
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE my_mp4_metadata_cache_lookups_total counter', body)
+        self.assertIn(f'my_mp4_metadata_cache_lookups_total{{result="hit"}} {hits + 1}', body)
+        self.assertNotIn('my_mp4_metadata_cache_lookups ', body)
@@ -0,0 +1,214 @@
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from my_mp4 import views
+from my_mp4.progress import LocalMemoryProgressStore, ProgressTracker, RedisProgressStore, SQLiteProgressStore
+
+from . import ProgressStoreMixin
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    """Just enough of a Redis server: SELECT, SET, MGET, DEL, and errors for the rest"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.server.commands.append([arg.decode() for arg in args])
+            if self.server.drop_next:
+                # Server restarts or idle timeouts look like this to the client
+                self.server.drop_next = False
+                return
+            self.wfile.write(self.reply(args[0].upper(), args[1:]))
+
+    def reply(self, name, args):
+        data = self.server.data
+        if name == b'SELECT':
+            return b'+OK\r\n'
+        if name == b'SET':
+            data[args[0]] = args[1]
+            return b'+OK\r\n'
+        if name == b'MGET':
+            values = [data.get(key) for key in args]
+            return b'*%d\r\n' % len(values) + b''.join(
+                b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value) for value in values
+            )
+        if name == b'DEL':
+            return b':%d\r\n' % (data.pop(args[0], None) is not None)
+        return b'-ERR unknown command\r\n'
+
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RESPHandler)
+        self.data = {}
+        self.commands = []
+        self.drop_next = False
+
+
+class RedisProgressStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.server = RESPServer()
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.store = RedisProgressStore(ttl=60, port=self.server.server_address[1], db=2)
+        self.addCleanup(self.store.close)
+
+    def test_set_and_get_round_trip(self):
+        self.store.set(7, {'progress': 42.5, 'status': 'processing'})
+        self.assertEqual(self.store.get(7), {'progress': 42.5, 'status': 'processing'})
+        self.assertIn(['SET', 'mp4:progress:7', '{"progress": 42.5, "status": "processing"}', 'EX', '60'],
+                      self.server.commands)
+
+    def test_selects_db_on_connect(self):
+        self.store.get(1)
+        self.assertEqual(self.server.commands[0], ['SELECT', '2'])
+
+    def test_missing_keys_are_nil(self):
+        self.store.set(1, {'progress': 1})
+        self.assertEqual(self.store.get_many([1, 2, 3]), {1: {'progress': 1}})
+        self.assertIsNone(self.store.get(2))
+
+    def test_delete(self):
+        self.store.set(1, {'progress': 1})
+        self.store.delete(1)
+        self.assertIsNone(self.store.get(1))
+
+    def test_error_reply_raises_and_keeps_connection(self):
+        self.store.get(1)
+        with self.assertRaisesMessage(RuntimeError, 'ERR unknown command'):
+            self.store.command('FLUSHALL')
+        self.store.set(1, {'progress': 5})
+        self.assertEqual(self.store.get(1), {'progress': 5})
+        # One SELECT: the connection survived the error
+        self.assertEqual([command[0] for command in self.server.commands].count('SELECT'), 1)
+
+    def test_reconnects_after_connection_drops(self):
+        self.store.set(1, {'progress': 5})
+        self.server.drop_next = True
+        with self.assertRaises(ConnectionError):
+            self.store.get(1)
+        self.assertEqual(self.store.get(1), {'progress': 5})
+        self.assertEqual([command[0] for command in self.server.commands].count('SELECT'), 2)
+
+
+class SQLiteProgressStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'progress.sqlite3')
+        self.store = SQLiteProgressStore(ttl=60, path=self.path)
+
+    def test_round_trip_and_delete(self):
+        self.store.set(3, {'progress': 10, 'status': 'processing'})
+        self.assertEqual(self.store.get_many([3, 4]), {3: {'progress': 10, 'status': 'processing'}})
+        self.store.delete(3)
+        self.assertIsNone(self.store.get(3))
+
+    def test_uses_wal(self):
+        self.store.set(1, {'progress': 1})
+        mode = self.store._connect().execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_shared_between_threads_and_stores(self):
+        # Other threads get their own connection; other processes their own store
+        other = SQLiteProgressStore(ttl=60, path=self.path)
+        thread = threading.Thread(target=self.store.set, args=(5, {'progress': 50}))
+        thread.start()
+        thread.join()
+        self.assertEqual(other.get(5), {'progress': 50})
+
+    def test_expired_records_are_hidden(self):
+        store = SQLiteProgressStore(ttl=-1, path=self.path)
+        store.set(1, {'progress': 1})
+        self.assertIsNone(store.get(1))
+
+
+class RecordingStore:
+    def __init__(self):
+        self.writes = []
+
+    def set(self, request_id, record):
+        self.writes.append((request_id, record))
+
+    def get(self, request_id):
+        for written_id, record in reversed(self.writes):
+            if written_id == request_id:
+                return record
+        return None
+
+    def delete(self, request_id):
+        pass
+
+
+class ProgressTrackerTests(SimpleTestCase):
+    def setUp(self):
+        self.store = RecordingStore()
+        self.tracker = ProgressTracker(self.store, min_interval=0.5, min_delta=1.0)
+        self.clock = 1000.0
+        patcher = mock.patch('my_mp4.progress.time.monotonic', lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def progress_written(self):
+        return [record['progress'] for _request_id, record in self.store.writes]
+
+    def test_throttles_small_and_fast_updates(self):
+        self.assertTrue(self.tracker.update(1, 10.0, status='processing'))
+        # Too soon
+        self.clock += 0.1
+        self.assertFalse(self.tracker.update(1, 20.0, status='processing'))
+        # Late enough but hardly moved
+        self.clock += 1
+        self.assertFalse(self.tracker.update(1, 10.5, status='processing'))
+        self.assertTrue(self.tracker.update(1, 12.0, status='processing'))
+        self.assertEqual(self.progress_written(), [10.0, 12.0])
+
+    def test_status_and_extra_changes_always_written(self):
+        self.tracker.update(1, 10.0, status='processing')
+        self.assertTrue(self.tracker.update(1, 10.0, status='postprocessing'))
+        self.assertTrue(self.tracker.update(1, 10.0, status='postprocessing', stage='merge'))
+        self.assertEqual(len(self.store.writes), 3)
+
+    def test_finish_flushes_through_the_throttle(self):
+        self.tracker.update(1, 10.0, status='processing')
+        self.tracker.update(1, 10.2, status='processing')
+        self.tracker.finish(1, 'completed', file_size=123)
+        request_id, record = self.store.writes[-1]
+        self.assertEqual((record['progress'], record['status'], record['file_size']), (100, 'completed', 123))
+        # Throttle state is forgotten, so a retried job writes at once
+        self.assertTrue(self.tracker.update(1, 0.5, status='processing'))
+
+    def test_store_errors_are_swallowed(self):
+        self.store.set = mock.Mock(side_effect=ConnectionError('down'))
+        self.store.get = mock.Mock(side_effect=ConnectionError('down'))
+        with self.assertLogs('my_mp4.progress', 'WARNING'):
+            self.assertTrue(self.tracker.update(1, 10.0, status='processing'))
+            self.assertEqual(self.tracker.get(1), 0)
+
+
+class TestStoreTests(ProgressStoreMixin, SimpleTestCase):
+    def test_tests_get_a_fresh_store(self):
+        self.assertIsInstance(views.download_progress.store, LocalMemoryProgressStore)
+        self.assertIsNone(views.download_progress.record(1))
+        views.download_progress.finish(1, 'completed')
+        self.assertEqual(views.download_progress.record(1)['status'], 'completed')
+
+    def test_records_do_not_leak_between_tests(self):
+        # Same request ID as the test above
+        self.assertIsNone(views.download_progress.record(1))
@@ -0,0 +1,158 @@
+import io
+import os
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from my_mp4 import storage
+from my_mp4.cache import artifact_key, quality_for
+from my_mp4.models import DownloadRequest, MediaArtifact
+
+from .test_media import MediaRootMixin
+
+VIDEO_ID = 'storevid001'
+
+
+class IncomingMixin(MediaRootMixin):
+    def incoming_file(self, job_id, name, data=b'media'):
+        """A file yt-dlp wrote into a job's working directory"""
+        job_dir = storage.incoming_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        file_path = os.path.join(job_dir, name)
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        return file_path
+
+
+class LayoutTests(IncomingMixin, TestCase):
+    def test_path_is_sharded_by_the_artifact_key(self):
+        key = artifact_key(VIDEO_ID, 'mp4', quality_for('mp4'))
+        self.assertEqual(
+            storage.media_relpath(VIDEO_ID, 'mp4'),
+            os.path.join(key[:2], key[2:4], f'{VIDEO_ID}.mp4-720p.mp4'),
+        )
+
+    def test_clips_and_formats_get_their_own_files(self):
+        paths = {
+            storage.final_path(VIDEO_ID, 'mp4'),
+            storage.final_path(VIDEO_ID, 'mp3'),
+            storage.final_path(VIDEO_ID, 'mp4', quality=quality_for('mp4', (10.0, 20.0))),
+            storage.final_path('storevid002', 'mp4'),
+        }
+        self.assertEqual(len(paths), 4)
+
+
+class CommitTests(IncomingMixin, TestCase):
+    def test_moves_into_the_shard_and_drops_the_job_directory(self):
+        temp_path = self.incoming_file(7, f'{VIDEO_ID}.mp4')
+        self.incoming_file(7, f'{VIDEO_ID}.f137.mp4.part')
+        other = self.incoming_file(8, f'{VIDEO_ID}.mp4.part')
+
+        target = storage.commit(temp_path, VIDEO_ID, 'mp4')
+        self.assertEqual(target, storage.final_path(VIDEO_ID, 'mp4'))
+        self.assertTrue(storage.is_sharded(target, VIDEO_ID, 'mp4'))
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b'media')
+        self.assertFalse(os.path.exists(storage.incoming_dir(7)))
+        # Another job's working directory is left alone
+        self.assertTrue(os.path.exists(other))
+
+    def test_extension_comes_from_the_file(self):
+        temp_path = self.incoming_file(7, f'{VIDEO_ID}.webm')
+        target = storage.commit(temp_path, VIDEO_ID, 'opus')
+        self.assertTrue(target.endswith(f'{VIDEO_ID}.opus-copy.webm'))
+
+    def test_identical_result_is_replaced(self):
+        first = storage.commit(self.incoming_file(7, f'{VIDEO_ID}.mp4', b'first'), VIDEO_ID, 'mp4')
+        second = storage.commit(self.incoming_file(8, f'{VIDEO_ID}.mp4', b'second'), VIDEO_ID, 'mp4')
+        self.assertEqual(first, second)
+        with open(second, 'rb') as f:
+            self.assertEqual(f.read(), b'second')
+
+    def test_file_outside_incoming_keeps_its_directory(self):
+        os.makedirs(os.path.join(self.media_root, 'downloads'))
+        kept = self.make_file(os.path.join('downloads', 'other.mp4'), 10)
+        temp_path = self.make_file(os.path.join('downloads', 'flat.mp4'), 10)
+        storage.commit(temp_path, VIDEO_ID, 'mp4')
+        self.assertTrue(os.path.exists(kept))
+
+    def test_discard_incoming(self):
+        self.incoming_file(7, f'{VIDEO_ID}.mp4.part')
+        storage.discard_incoming(7)
+        self.assertFalse(os.path.exists(storage.incoming_dir(7)))
+        # Nothing there is fine too
+        storage.discard_incoming(7)
+
+    def test_incoming_jobs_lists_job_directories_only(self):
+        self.assertEqual(list(storage.incoming_jobs()), [])
+        self.incoming_file(7, 'a.part')
+        self.incoming_file(12, 'b.part')
+        self.incoming_file('notajob', 'c.part')
+        self.assertEqual(sorted(job_id for job_id, _, _ in storage.incoming_jobs()), [7, 12])
+
+
+class RelocateMediaTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.flat = self.make_file(f'{VIDEO_ID}.mp4', 100)
+        self.artifact = MediaArtifact.objects.create(
+            cache_key=artifact_key(VIDEO_ID, 'mp4', '720p'), video_id=VIDEO_ID, format_choice='mp4',
+            quality='720p', file_path=self.flat, ref_count=1,
+        )
+        self.row = DownloadRequest.objects.create(
+            url=f'https://www.youtube.com/watch?v={VIDEO_ID}', format_choice='mp4', status='completed',
+            file_path=self.flat, file_exists=True, artifact=self.artifact,
+        )
+        # A completed row without an artifact, from before the cache
+        self.legacy_flat = self.make_file('Some title.mp3', 100)
+        self.legacy = DownloadRequest.objects.create(
+            url='https://www.youtube.com/watch?v=storevid002', format_choice='mp3', status='completed',
+            file_path=self.legacy_flat, file_exists=True,
+        )
+
+    def relocate(self, *args):
+        out = io.StringIO()
+        call_command('relocate_media', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_moves_flat_files_and_their_rows(self):
+        output = self.relocate()
+        self.assertIn('moved 2 files', output)
+
+        new_path = storage.final_path(VIDEO_ID, 'mp4')
+        self.assertTrue(os.path.exists(new_path))
+        self.assertFalse(os.path.exists(self.flat))
+        self.artifact.refresh_from_db()
+        self.row.refresh_from_db()
+        self.assertEqual((self.artifact.file_path, self.row.file_path), (new_path, new_path))
+
+        self.legacy.refresh_from_db()
+        self.assertEqual(self.legacy.file_path, storage.final_path('storevid002', 'mp3'))
+        self.assertTrue(os.path.exists(self.legacy.file_path))
+
+    def test_second_run_changes_nothing(self):
+        self.relocate()
+        layout = sorted(os.path.join(root, name) for root, _, names in os.walk(self.media_root) for name in names)
+        rows = list(DownloadRequest.objects.order_by('id').values_list('file_path', 'file_exists'))
+
+        output = self.relocate()
+        self.assertIn('moved 0 files, 0 missing', output)
+        self.assertEqual(
+            sorted(os.path.join(root, name) for root, _, names in os.walk(self.media_root) for name in names),
+            layout,
+        )
+        self.assertEqual(list(DownloadRequest.objects.order_by('id').values_list('file_path', 'file_exists')), rows)
+
+    def test_dry_run_moves_nothing(self):
+        output = self.relocate('--dry-run')
+        self.assertIn('would move 2 files', output)
+        self.assertTrue(os.path.exists(self.flat))
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.file_path, self.flat)
+
+    def test_missing_file_is_marked(self):
+        os.remove(self.legacy_flat)
+        output = self.relocate()
+        self.assertIn('moved 1 files, 1 missing', output)
+        self.legacy.refresh_from_db()
+        self.assertFalse(self.legacy.file_exists)
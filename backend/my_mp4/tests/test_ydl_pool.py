@@ -0,0 +1,136 @@
+import tempfile
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from my_mp4.ydl_pool import YDLPool
+
+
+def client_opts(profile, format_type):
+    return {
+        'quiet': True,
+        'format': 'best' if format_type == 'mp4' else 'bestaudio',
+        'http_headers': {'User-Agent': f'{profile}-agent'},
+    }
+
+
+class PoolTestMixin:
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        pool_settings = override_settings(YTDLP_POOL={'MAX_IDLE': 2, 'MAX_AGE': 3600, 'CACHE_DIR': cache_dir.name})
+        pool_settings.enable()
+        self.addCleanup(pool_settings.disable)
+        self.pool = YDLPool(client_opts)
+        self.addCleanup(self.pool.clear)
+
+
+class CheckoutTests(PoolTestMixin, SimpleTestCase):
+    def test_returned_instance_is_reused(self):
+        with self.pool.acquire('web', 'mp4') as first:
+            pass
+        with self.pool.acquire('web', 'mp4') as second:
+            pass
+        self.assertIs(second, first)
+        self.assertEqual(self.pool.stats(), {'created': 1, 'reused': 1, 'idle': {'web/mp4': 1}})
+
+    def test_one_job_per_instance(self):
+        with self.pool.acquire('web', 'mp4') as first, self.pool.acquire('web', 'mp4') as second:
+            self.assertIsNot(first, second)
+        self.assertEqual(self.pool.stats()['idle'], {'web/mp4': 2})
+
+    def test_concurrent_jobs_never_share(self):
+        held = []
+        barrier = threading.Barrier(3)
+
+        def job():
+            with self.pool.acquire('web', 'mp4') as ydl:
+                held.append(ydl)
+                barrier.wait(timeout=5)
+
+        threads = [threading.Thread(target=job) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(len({id(ydl) for ydl in held}), 3)
+        # Only MAX_IDLE of them are kept
+        self.assertEqual(self.pool.stats()['idle'], {'web/mp4': 2})
+
+    def test_expired_instance_is_rebuilt(self):
+        with self.pool.acquire('web', 'mp4') as first:
+            pass
+        with self.settings(YTDLP_POOL=dict(settings.YTDLP_POOL, MAX_AGE=0)), \
+                mock.patch('yt_dlp.YoutubeDL.YoutubeDL.close') as close:
+            with self.pool.acquire('web', 'mp4') as second:
+                pass
+        self.assertIsNot(second, first)
+        close.assert_called()
+        self.assertEqual(self.pool.stats()['created'], 2)
+
+
+class IsolationTests(PoolTestMixin, SimpleTestCase):
+    def test_instances_are_kept_per_client_and_format(self):
+        with self.pool.acquire('web', 'mp4') as web:
+            pass
+        with self.pool.acquire('android', 'mp4') as android:
+            pass
+        with self.pool.acquire('web', 'mp3') as web_audio:
+            pass
+        self.assertEqual(len({id(web), id(android), id(web_audio)}), 3)
+        self.assertEqual(web.params['http_headers']['User-Agent'], 'web-agent')
+        self.assertEqual(android.params['http_headers']['User-Agent'], 'android-agent')
+        self.assertEqual(web_audio.params['format'], 'bestaudio')
+
+    def test_overrides_last_one_job(self):
+        with self.pool.acquire('web', 'mp4', overrides={'ratelimit': 1000, 'format': 'worst'}) as ydl:
+            self.assertEqual((ydl.params['ratelimit'], ydl.params['format']), (1000, 'worst'))
+        with self.pool.acquire('web', 'mp4') as reused:
+            self.assertIs(reused, ydl)
+            self.assertNotIn('ratelimit', reused.params)
+            self.assertEqual(reused.params['format'], 'best')
+
+    def test_hooks_only_see_their_own_job(self):
+        seen = []
+        with self.pool.acquire('web', 'mp4', progress_hook=seen.append) as ydl:
+            ydl.params['progress_hooks'][0]({'status': 'downloading'})
+        # Back in the pool, nobody is listening
+        ydl.params['progress_hooks'][0]({'status': 'downloading', 'late': True})
+
+        other = []
+        with self.pool.acquire('web', 'mp4', progress_hook=other.append) as reused:
+            reused.params['progress_hooks'][0]({'status': 'finished'})
+        self.assertEqual(seen, [{'status': 'downloading'}])
+        self.assertEqual(other, [{'status': 'finished'}])
+
+
+class BrokenInstanceTests(PoolTestMixin, SimpleTestCase):
+    def test_instance_of_a_failed_job_is_discarded(self):
+        with self.assertRaises(RuntimeError):
+            with self.pool.acquire('web', 'mp4') as broken:
+                broken.params['cookiefile'] = '/nonexistent'
+                raise RuntimeError('download failed')
+        self.assertEqual(self.pool.stats()['idle'], {'web/mp4': 0})
+
+        with self.pool.acquire('web', 'mp4') as fresh:
+            self.assertIsNot(fresh, broken)
+            self.assertNotIn('cookiefile', fresh.params)
+        self.assertEqual(self.pool.stats()['created'], 2)
+
+    def test_discarded_instance_is_closed(self):
+        with mock.patch('yt_dlp.YoutubeDL.YoutubeDL.close') as close:
+            with self.assertRaises(RuntimeError):
+                with self.pool.acquire('web', 'mp4'):
+                    raise RuntimeError('download failed')
+        close.assert_called_once()
+
+    def test_clear_closes_idle_instances(self):
+        with self.pool.acquire('web', 'mp4'), self.pool.acquire('android', 'mp4'):
+            pass
+        with mock.patch('yt_dlp.YoutubeDL.YoutubeDL.close') as close:
+            self.pool.clear()
+        self.assertEqual(close.call_count, 2)
+        self.assertEqual(self.pool.stats()['idle'], {})
@@ -4,10 +4,18 @@ from . import views
 urlpatterns = [
     path('download/', views.start_download, name='start_download'),
     path('status/<int:request_id>/', views.check_status, name='check_status'),
+    path('status/<int:request_id>/stream/', views.stream_status, name='stream_status'),
+    path('batch/', views.start_batch, name='start_batch'),
+    path('batch/<int:group_id>/', views.batch_status, name='batch_status'),
+    path('batch/<int:group_id>/cancel/', views.cancel_batch, name='cancel_batch'),
     path('download-file/', views.download_file, name='download_file'),
+    path('downloads/zip/', views.download_zip, name='download_zip'),
+    path('stream/<int:request_id>/', views.stream_file, name='stream_file'),
     path('play-file/', views.play_file, name='play_file'),
     path('video-info/', views.get_video_info, name='get_video_info'),
     path('downloads/history/', views.get_download_history, name='get_download_history'),
     path('downloads/delete/<int:download_id>/', views.delete_download, name='delete_download'),
+    path('downloads/cancel/<int:download_id>/', views.cancel_download, name='cancel_download'),
     path('search/', views.search_youtube, name='search_youtube'),  # New search endpoint
+    path('queue/', views.queue_status, name='queue_status'),
 ]
\ No newline at end of file
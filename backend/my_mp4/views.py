@@ -1,32 +1,71 @@
 import os
-import yt_dlp
+import logging
 import random
 import time
-import requests
-from django.http import JsonResponse, FileResponse
-from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
-from django.conf import settings
-from .models import DownloadRequest
 import json
-import threading
+import asyncio
 import re
-import urllib3
 import hashlib
-import uuid
+import math
+import binascii
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseNotAllowed
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from .models import DONE, UNFINISHED, DownloadGroup, DownloadRequest
+from .jobs import JobCancelled, JobQueue, cancelled, priority_for, queue_setting, retry_later
+from .engine import AsyncJobQueue
+from . import admission, cache, flight, groups, storage
+from .logs import Sampler, log_context
+from .metrics import StageClock, job_finished, registry, requests_total, retries_total, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .progress import create_progress_tracker
+from .events import job_events
+from .media import for_server, media_path, serve_media, follow_growing_file, zip_stream
+from .ydl_pool import YDLPool
+from .bandwidth import FormatGrant, bandwidth_budget
+from .clips import parse_clip, clip_of, clip_ydl_params
+from .audio import AUDIO_FORMATS, audio_ydl_opts, choose_audio_format, parse_accept, transcode_pool
+from .metacache import metadata_cache, extract_raw_info, cached_raw_info, info_key, playlist_key, search_key, metadata_setting, known_failure, remember_failure
+from .errors import PERMANENT, TRANSIENT, MESSAGES as ERROR_MESSAGES, TransientError, classify
+
+logger = logging.getLogger(__name__)
+# Per-job progress lines, sampled; silence with a level in LOGGING
+progress_logger = logging.getLogger('my_mp4.views.progress')
+progress_sampler = Sampler(getattr(settings, 'LOG_PROGRESS_INTERVAL', 10))
+
+# Seconds stream_file waits for a queued job to start writing
+LIVE_START_TIMEOUT = 30
+
+# Formats start_download accepts; 'audio' lets the server pick (see audio.py)
+DOWNLOAD_FORMATS = ('mp4', *AUDIO_FORMATS, 'audio')
 
-# Disable warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# Download history page sizes (?limit=)
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 500
 
-# Global dictionaries
-download_progress = {}
+# Downloads one ZIP export may hold (?ids=)
+ZIP_MAX_ITEMS = 500
+
+# Characters that cannot appear in a file name inside a ZIP on common systems
+UNSAFE_NAME_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+# Job progress, shared across worker processes through DOWNLOAD_PROGRESS
+download_progress = create_progress_tracker()
 
 class YouTubeClientEmulator:
     def __init__(self):
-        self.session = requests.Session()
         self.android_id = self.generate_android_id()
         self.device_id = self.generate_device_id()
         self.visitor_id = self.generate_visitor_data()
+        self.ydl_pool = YDLPool(self.create_pooled_ydl_opts)
         
     def generate_android_id(self):
         """Generate realistic Android ID"""
@@ -87,12 +126,10 @@ class YouTubeClientEmulator:
     def create_authentic_ydl_opts(self, download_request_id, format_type, client_type="mobile"):
         """Create yt-dlp options that perfectly mimic official YouTube clients"""
         
-        media_dir = settings.MEDIA_ROOT
-        
         # Base options for authentic behavior
         ydl_opts = {
-            'outtmpl': os.path.join(media_dir, '%(title).100s.%(ext)s'),
-            'progress_hooks': [lambda d: progress_hook(d, download_request_id)],
+            # Written to a per-job directory, then moved into the sharded layout
+            'outtmpl': storage.incoming_template(download_request_id),
             'noplaylist': True,
             
             # Gentle settings that don't trigger alarms
@@ -159,104 +196,271 @@ class YouTubeClientEmulator:
             })
         
         # Format-specific options
-        if format_type == 'mp3':
-            ydl_opts.update({
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-            })
+        if format_type in AUDIO_FORMATS:
+            # Downloaded untouched, then remuxed or encoded in transcode_pool
+            ydl_opts.update(audio_ydl_opts(format_type))
         else:  # mp4
             ydl_opts.update({
                 'format': 'best[height<=720][ext=mp4]/best[ext=mp4]/best',
             })
         
+        # Pooled instances get their per-job hook from YDLPool instead
+        if download_request_id is not None:
+            ydl_opts['progress_hooks'] = [lambda d: progress_hook(d, download_request_id)]
+        
         return ydl_opts
 
-    def download_as_client(self, url, format_type, download_request, max_attempts=3):
-        """Download video by perfectly mimicking official YouTube clients"""
-        
+    def create_info_ydl_opts(self):
+        """Options for metadata lookups, using the mobile client"""
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+            'extractor_args': {
+                'youtube': {
+                    'player_client': ['android'],
+                }
+            },
+            'http_headers': self.get_mobile_headers(),
+            'no_check_certificate': False,
+            'ignoreerrors': False,
+            'extractor_retries': 2,
+        }
+        return ydl_opts
+
+    def create_search_ydl_opts(self):
+        """Options for flat YouTube searches, using the web client"""
+        ydl_opts = {
+            'quiet': True,
+            'extract_flat': True,
+            'default_search': 'ytsearch10',
+            'noplaylist': True,
+            'extractor_args': {
+                'youtube': {
+                    'player_client': ['web'],
+                }
+            },
+            'http_headers': self.get_web_headers(),
+            'no_check_certificate': False,
+            'ignoreerrors': True,
+        }
+        return ydl_opts
+
+    def create_playlist_ydl_opts(self):
+        """Options for flat playlist listings, using the web client"""
+        ydl_opts = {
+            'quiet': True,
+            'extract_flat': 'in_playlist',
+            'playlistend': groups.max_items(),
+            'extractor_args': {
+                'youtube': {
+                    'player_client': ['web'],
+                }
+            },
+            'http_headers': self.get_web_headers(),
+            'no_check_certificate': False,
+            'ignoreerrors': True,
+        }
+        return ydl_opts
+
+    def create_pooled_ydl_opts(self, client_type, kind):
+        """Options for a pooled YoutubeDL; kind is a download format, 'info', 'search' or 'playlist'"""
+        if kind == 'info':
+            return self.create_info_ydl_opts()
+        if kind == 'search':
+            return self.create_search_ydl_opts()
+        if kind == 'playlist':
+            return self.create_playlist_ydl_opts()
+        return self.create_authentic_ydl_opts(None, kind, client_type)
+
+    def client_order(self, url):
+        """Client emulations to try, in order"""
         client_types = ["mobile", "web", "tv"]
         random.shuffle(client_types)  # Randomize client order
         
-        for attempt, client_type in enumerate(client_types):
-            try:
-                print(f"🎭 Attempt {attempt + 1}: Mimicking YouTube {client_type.upper()} client")
-                
-                media_dir = settings.MEDIA_ROOT
-                os.makedirs(media_dir, exist_ok=True)
-                
-                download_progress[download_request.id] = 0
-                
-                # Natural delay between attempts
-                if attempt > 0:
-                    delay = random.uniform(2, 8)  # Natural human delay
-                    print(f"⏳ Natural delay: {delay:.1f}s")
-                    time.sleep(delay)
-                
-                # Convert playlist URLs if needed
-                if self.is_playlist_url(url):
-                    video_id = self.extract_video_id(url)
-                    if video_id:
-                        url = f"https://www.youtube.com/watch?v={video_id}"
-                        print(f"🔀 Converted to single video: {url}")
+        # Start with a client whose metadata is already cached
+        video_id = self.extract_video_id(url)
+        cached_clients = [c for c in client_types if video_id and metadata_cache.has(info_key(video_id, c))]
+        return cached_clients[:1] + [c for c in client_types if c not in cached_clients[:1]]
+
+    def single_video_url(self, url):
+        """Convert playlist URLs to the single video they point at"""
+        if self.is_playlist_url(url):
+            video_id = self.extract_video_id(url)
+            if video_id:
+                url = f"https://www.youtube.com/watch?v={video_id}"
+                logger.info("Converted playlist URL to single video %s", url)
+        return url
+
+    def next_client(self, url, download_request):
+        """Client emulation for the job's next attempt: the first one it has not tried yet"""
+        tried = [c for c in download_request.tried_clients.split(',') if c]
+        remaining = [c for c in self.client_order(url) if c not in tried]
+        return (remaining[0] if remaining else None), len(tried)
+
+    def start_attempt(self, download_request, attempt, client_type):
+        """Announce an attempt, remember its client and reset the job's progress"""
+        logger.info("Attempt %d: mimicking YouTube %s client", attempt + 1, client_type.upper(), extra={'client': client_type})
+        tried = [c for c in download_request.tried_clients.split(',') if c]
+        download_request.tried_clients = ','.join(tried + [client_type])
+        DownloadRequest.objects.filter(id=download_request.id).update(tried_clients=download_request.tried_clients)
+        download_progress.update(download_request.id, 0, status='processing', force=True)
+
+    def complete_download(self, download_request, url, format_type, info, filename, client_type, clock=None):
+        """Verify the downloaded file and mark the request completed"""
+        if format_type in AUDIO_FORMATS:
+            # Remuxed when the stream already has the codec, else encoded in
+            # the host-wide, core-bounded ffmpeg pool
+            filename = transcode_pool.transcode(
+                filename, format_type, cancelled=lambda: job_queue.is_cancelled(download_request.id),
+                acodec=info.get('acodec'),
+            )
+        
+        if clock:
+            clock.switch('finalize')
+        
+        # Verify file exists
+        if not os.path.exists(filename):
+            raise Exception(f"Downloaded file not found: {filename}")
+        
+        if os.path.getsize(filename) == 0:
+            raise Exception(f"Empty file: {filename}")
+        
+        job_queue.raise_if_cancelled(download_request.id)
+        
+        # Success - move it into place and share it through the result cache
+        video_id = info.get('id') or self.extract_video_id(url)
+        clip = clip_of(download_request)
+        if clip and info.get('duration'):
+            info = dict(info, duration=int(min(clip[1], info['duration']) - clip[0]))
+        if video_id:
+            filename = storage.commit(filename, video_id, format_type, cache.request_quality(download_request))
+        if not cache.store(download_request, video_id, info, filename):
+            download_request.status = 'completed'
+            download_request.file_path = filename
+            download_request.file_size = os.path.getsize(filename)
+            download_request.file_exists = True
+            download_request.video_title = info.get('title', 'Unknown Title')
+            download_request.video_thumbnail = info.get('thumbnail', '')
+            download_request.video_duration = info.get('duration', 0)
+            download_request.save()
+        
+        download_progress.finish(download_request.id, 'completed')
+        logger.info("Download succeeded as %s client: %s", client_type.upper(), download_request.video_title, extra={'client': client_type})
+
+    def attempt_failed(self, download_request, url, client_type, error):
+        """Classify a failed attempt, then fail the job or queue its next attempt.
+        
+        Returns the job's new status: 'failed', or 'queued' when another
+        client will be tried once the back-off has passed.
+        """
+        if cancelled(download_request):
+            # The error is the cancellation itself, e.g. an aborted ffmpeg
+            return 'cancelled'
+        
+        failure = classify(error)
+        logger.warning(
+            "%s client failed (%s): %s", client_type.upper(), failure.kind, failure,
+            extra={'client': client_type, 'error_kind': failure.kind},
+        )
+        
+        video_id = self.extract_video_id(url)
+        if failure.kind == PERMANENT:
+            # Every client would get the same answer, refuse the video for a while
+            remember_failure(video_id, failure.user_message)
+        elif video_id:
+            # Cached media URLs may have expired, extract afresh next time
+            metadata_cache.delete(info_key(video_id, client_type))
+        
+        next_client, _ = self.next_client(url, download_request)
+        if failure.retryable and next_client and download_request.attempts < queue_setting('MAX_ATTEMPTS'):
+            # Wait in the queue, not in this worker
+            delay = retry_later(download_request)
+            retries_total.inc(kind=failure.kind)
+            logger.info("Trying another client in %.1fs", delay)
+            return 'queued'
+        
+        self.fail_download(download_request, failure)
+        return 'failed'
+
+    def fail_download(self, download_request, failure):
+        """Mark the request failed for good"""
+        download_request.status = 'failed'
+        download_request.error_kind = failure.kind
+        download_request.save()
+        download_progress.finish(download_request.id, 'failed')
+        logger.error("Download failed (%s): %s", failure.kind, failure, extra={'error_kind': failure.kind})
+
+    def download_as_client(self, url, format_type, download_request):
+        """Make one download attempt by perfectly mimicking an official YouTube client.
+        
+        Returns the job's new status: 'completed', 'failed', or 'queued' when
+        a retry with the next client has been scheduled.
+        """
+        video_id = self.extract_video_id(url)
+        client_type, attempt = self.next_client(url, download_request)
+        if client_type is None:
+            self.fail_download(download_request, TransientError("All client emulations failed"))
+            return 'failed'
+        
+        clock = StageClock(download_request.timings)
+        try:
+            self.start_attempt(download_request, attempt, client_type)
+            
+            url = self.single_video_url(url)
+            
+            # Reuse a cached extraction (e.g. from get_video_info) instead of re-running it
+            raw_info = cached_raw_info(video_id, client_type)
+            
+            overrides = {'outtmpl': {'default': storage.incoming_template(download_request.id)}}
+            clip = clip_of(download_request)
+            if clip:
+                overrides.update(clip_ydl_params(clip))
+            
+            # Connections from the host-wide budget, sized once yt-dlp has chosen the format
+            grant = FormatGrant(
+                bandwidth_budget, format_type, clip,
+                cancelled=lambda: job_queue.is_cancelled(download_request.id),
+            )
+            
+            # Warm YoutubeDL with authentic client options
+            # Raising from the hook is how a cancelled job leaves yt-dlp in this engine
+            job_hook = lambda d: (
+                job_queue.raise_if_cancelled(download_request.id),
+                progress_hook(d, download_request.id), grant.observe(d), clock.observe(d),
+            )
+            
+            with grant, self.ydl_pool.acquire(
+                client_type, format_type, progress_hook=job_hook, overrides=overrides, format_hook=grant,
+            ) as ydl:
+                logger.debug(
+                    "Client %s, User-Agent %s",
+                    client_type.upper(), ydl.params['http_headers']['User-Agent'],
+                )
                 
-                # Get authentic client options
-                ydl_opts = self.create_authentic_ydl_opts(download_request.id, format_type, client_type)
+                if raw_info is not None:
+                    logger.debug("Using cached metadata for %s", video_id)
+                    info = ydl.process_ie_result(raw_info, download=True)
+                else:
+                    info = ydl.extract_info(url, download=True)
                 
-                print(f"   Client: {client_type.upper()}")
-                print(f"   User-Agent: {ydl_opts['http_headers']['User-Agent'][:40]}...")
+                if 'entries' in info:
+                    info = info['entries'][0]
                 
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    
-                    if 'entries' in info:
-                        info = info['entries'][0]
-                    
-                    filename = ydl.prepare_filename(info)
-                    
-                    if format_type == 'mp3':
-                        base_name = filename.rsplit('.', 1)[0]
-                        filename = base_name + '.mp3'
-                    
-                    # Verify file exists
-                    if not os.path.exists(filename):
-                        raise Exception(f"Downloaded file not found: {filename}")
-                    
-                    if os.path.getsize(filename) == 0:
-                        raise Exception(f"Empty file: {filename}")
-                    
-                    # Success - update database
-                    download_request.status = 'completed'
-                    download_request.file_path = filename
-                    download_request.video_title = info.get('title', 'Unknown Title')
-                    download_request.video_thumbnail = info.get('thumbnail', '')
-                    download_request.video_duration = info.get('duration', 0)
-                    download_request.save()
-                    
-                    download_progress[download_request.id] = 100
-                    print(f"✅ SUCCESS as {client_type.upper()} client: {download_request.video_title}")
-                    return True
-                    
-            except Exception as e:
-                error_msg = str(e)
-                print(f"❌ {client_type.upper()} client failed: {error_msg}")
+                filename = ydl.prepare_filename(info)
                 
-                # Don't retry immediately - wait a bit
-                time.sleep(random.uniform(1, 3))
+                # Post-processing does not need the connections
+                grant.release()
+                clock.switch('postprocess')
+                self.complete_download(download_request, url, format_type, info, filename, client_type, clock)
+                return 'completed'
                 
-                if attempt == len(client_types) - 1:
-                    download_request.status = 'failed'
-                    download_request.error_message = f"All client emulations failed: {error_msg}"
-                    download_request.save()
-                    if download_request.id in download_progress:
-                        del download_progress[download_request.id]
-                    print(f"💔 All YouTube client emulations failed")
-                    return False
-        
-        return False
+        except JobCancelled:
+            return 'cancelled'
+        except Exception as e:
+            return self.attempt_failed(download_request, url, client_type, e)
+        finally:
+            clock.stop()
 
     def extract_video_id(self, url):
         """Extract video ID from URL"""
@@ -277,6 +481,27 @@ class YouTubeClientEmulator:
         """Check if URL is a playlist"""
         return 'list=' in url and 'watch?v=' not in url
 
+    def expand_playlist(self, url):
+        """Title and videos of a playlist from one flat extraction, cached for PLAYLIST_TTL"""
+        list_id = groups.playlist_id(url)
+        cached = metadata_cache.get(playlist_key(list_id))
+        if cached is not None:
+            return cached
+        
+        with self.ydl_pool.acquire('web', 'playlist') as ydl:
+            info = ydl.extract_info(f"https://www.youtube.com/playlist?list={list_id}", download=False)
+        
+        # Private and deleted entries come back without an ID
+        playlist = {
+            'title': info.get('title'),
+            'entries': [
+                {'id': entry['id'], 'title': entry.get('title'), 'duration': entry.get('duration')}
+                for entry in info.get('entries') or [] if entry and entry.get('id')
+            ],
+        }
+        metadata_cache.set(playlist_key(list_id), playlist, metadata_setting('PLAYLIST_TTL'))
+        return playlist
+
 # Initialize YouTube client emulator
 youtube_client = YouTubeClientEmulator()
 
@@ -308,30 +533,106 @@ def progress_hook(d, download_request_id):
                 pass
         
         if percent > 0:
-            download_progress[download_request_id] = min(percent, 99)
-            # Natural progress updates
-            if percent % 10 == 0:  # Only log every 10% to avoid spam
-                print(f"📥 Progress: {percent:.1f}%")
+            # The partial file is recorded so stream_file can serve it while it grows
+            download_progress.update(
+                download_request_id, min(percent, 99), status='processing',
+                tmpfilename=d.get('tmpfilename'), filename=d.get('filename')
+            )
+            # Sampled, progress fires many times a second
+            if progress_sampler.due(download_request_id):
+                progress_logger.info("Progress %.1f%%", percent, extra={'request_id': download_request_id})
     
     elif d['status'] == 'finished':
-        download_progress[download_request_id] = 100
-        print(f"✅ Download complete!")
+        download_progress.update(
+            download_request_id, 100, status='processing', force=True,
+            tmpfilename=d.get('tmpfilename'), filename=d.get('filename')
+        )
+        progress_sampler.forget(download_request_id)
+        progress_logger.info("Download finished", extra={'request_id': download_request_id})
 
 def download_video(url, format_type, download_request):
     """Main download function using YouTube client emulation"""
-    print(f"🎭 Starting YouTube client emulation for: {url}")
+    with log_context(request_id=download_request.id, video_id=youtube_client.extract_video_id(url)):
+        logger.info("Starting YouTube client emulation for %s", url)
+        
+        status = 'failed'
+        try:
+            status = youtube_client.download_as_client(url, format_type, download_request)
+        finally:
+            finish_download(download_request, status)
+
+def finish_download(download_request, status):
+    """Record the outcome of a job attempt and settle requests that joined it"""
+    if status != 'completed' and cancelled(download_request):
+        status = 'cancelled'
     
-    success = youtube_client.download_as_client(url, format_type, download_request)
+    if status == 'queued':
+        # Another attempt is scheduled, followers keep waiting for it
+        job_finished(download_request, status)
+        return
     
-    if not success:
-        print("💡 Tip: Try again later - YouTube might be rate limiting")
-        download_request.status = 'failed'
-        download_request.error_message = 'YouTube client emulation failed - try again in a few minutes'
-        download_request.save()
+    try:
+        if status == 'cancelled':
+            # Free the partial files now rather than at the janitor's next sweep
+            storage.discard_incoming(download_request.id)
+            download_progress.finish(download_request.id, 'cancelled')
+            logger.info("Download cancelled")
+        elif status != 'completed' and download_request.status != 'failed':
+            logger.info("Tip: Try again later - YouTube might be rate limiting")
+            download_request.status = 'failed'
+            download_request.error_kind = download_request.error_kind or TRANSIENT
+            download_request.save()
+        job_finished(download_request, status)
+    finally:
+        # Hand the result to requests that joined this fetch
+        if download_request.flight_key:
+            heir = flight.land(download_request)
+            if heir is not None:
+                job_queue.submit(heir)
 
-@csrf_exempt
-@require_http_methods(["POST"])
-def start_download(request):
+def cancel_job(download_request):
+    """Cancel a request that has not finished; False if it already had.
+    
+    Queued and waiting requests are settled right here. A running job is
+    stopped by the process running it: at once if that is this one,
+    otherwise within CANCEL_CHECK_INTERVAL.
+    """
+    while True:
+        previous = download_request.status
+        if previous not in UNFINISHED:
+            return False
+        if DownloadRequest.objects.filter(id=download_request.id, status=previous).update(status='cancelled'):
+            break
+        download_request.refresh_from_db()
+    
+    download_request.status = 'cancelled'
+    with log_context(request_id=download_request.id, video_id=download_request.video_id):
+        if previous == 'processing':
+            job_queue.cancel(download_request.id)
+        else:
+            finish_download(download_request, 'cancelled')
+    return True
+
+# Bounded worker pool that runs queued downloads
+if getattr(settings, 'DOWNLOAD_ENGINE', 'threads') == 'asyncio':
+    job_queue = AsyncJobQueue(youtube_client, progress_hook, finish_download)
+else:
+    job_queue = JobQueue(download_video)
+
+def async_view(methods, csrf_exempt=False):
+    """require_http_methods/csrf_exempt for async views; the stock decorators are sync-only here"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            return await view(request, *args, **kwargs)
+        wrapper.csrf_exempt = csrf_exempt
+        return wrapper
+    return decorator
+
+@async_view(["POST"], csrf_exempt=True)
+async def start_download(request):
     try:
         data = json.loads(request.body)
         url = data.get('url')
@@ -344,44 +645,278 @@ def start_download(request):
         if not device_id:
             return JsonResponse({'error': 'Device ID is required'}, status=400)
         
+        if format_type not in DOWNLOAD_FORMATS:
+            return JsonResponse({'error': f'Unsupported format: {format_type}'}, status=400)
+        
+        # 'audio' picks a stream-copy format when the client can play it
+        try:
+            accepted = parse_accept(data.get('accept'), request.META.get('HTTP_ACCEPT', ''))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        format_type = choose_audio_format(format_type, accepted)
+        
+        # Optional time range, only that part is fetched
+        try:
+            clip = parse_clip(data.get('start'), data.get('end'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
         # Enhanced URL validation
+        if not isinstance(url, str):
+            return JsonResponse({'error': 'url must be a YouTube URL'}, status=400)
         if 'youtube.com' not in url and 'youtu.be' not in url:
             return JsonResponse({'error': 'Only YouTube URLs are supported'}, status=400)
         
         # Check for playlist
         if youtube_client.is_playlist_url(url) and not youtube_client.extract_video_id(url):
-            return JsonResponse({'error': 'Please select a specific video from the playlist'}, status=400)
+            return JsonResponse({'error': 'Please select a specific video, or download the whole playlist through /api/batch/'}, status=400)
         
-        download_request = DownloadRequest.objects.create(
-            url=url,
-            format_choice=format_type,
-            status='processing',
-            device_id=device_id,
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        return await sync_to_async(enqueue_download)(url, format_type, device_id, user_agent, clip)
         
-        # Start download with client emulation
-        thread = threading.Thread(
-            target=download_video,
-            args=(url, format_type, download_request)
-        )
-        thread.daemon = True
-        thread.start()
+    except Exception as e:
+        return JsonResponse({'error': f'Download startup failed: {str(e)}'}, status=500)
+
+def create_request(url, format_type, device_id, user_agent, clip=None, **fields):
+    """Insert the DownloadRequest for one video; clip is (start, end) as parse_clip returns it"""
+    clip_start, clip_end = clip if clip else (None, None)
+    if clip_end == math.inf:
+        clip_end = None
+    return DownloadRequest.objects.create(
+        url=url,
+        format_choice=format_type,
+        device_id=device_id,
+        user_agent=user_agent,
+        clip_start=clip_start,
+        clip_end=clip_end,
+        **fields
+    )
+
+def serve_from_cache(download_request, artifact):
+    """Complete a new request with a finished file"""
+    cache.attach(download_request, artifact)
+    download_progress.finish(download_request.id, 'completed')
+    requests_total.inc(served='cache')
+
+def join_or_queue(download_request, video_id):
+    """Join a running fetch of the same video, or lead a new one; returns the leader joined"""
+    leader = flight.join_or_lead(download_request, video_id)
+    requests_total.inc(served='joined' if leader is not None else 'queued')
+    return leader
+
+def enqueue_download(url, format_type, device_id, user_agent, clip=None):
+    """Create a DownloadRequest that is served from cache, joins a running fetch, or is queued"""
+    # Reuse a finished file for the same video, format and clip
+    video_id = youtube_client.extract_video_id(url)
+    
+    # Private, removed and region-locked videos fail fast for a while
+    failure = known_failure(video_id)
+    if failure:
+        requests_total.inc(served='rejected')
+        return JsonResponse({'error': failure, 'error_kind': PERMANENT}, status=422)
+    
+    quality = cache.quality_for(format_type, clip)
+    artifact = cache.lookup(video_id, format_type, quality)
+    if artifact:
+        download_request = create_request(url, format_type, device_id, user_agent, clip, status='processing')
+        serve_from_cache(download_request, artifact)
         
         return JsonResponse({
-            'message': 'Download started using YouTube client emulation',
+            'message': 'Download served from cache',
             'request_id': download_request.id,
+            'status': download_request.status,
+            'cached': True,
+            'format': format_type,
             'method': 'YouTube Client Emulation'
         })
+    
+    # Turn requests away cleanly rather than overload every user at once.
+    # Joining a running fetch costs no worker or disk, so only the device cap applies.
+    expected = admission.estimated_bytes(video_id, format_type, clip, youtube_client.client_order(url))
+    rejection = admission.check_device(device_id)
+    if rejection is None and not flight.in_flight(video_id, format_type, quality):
+        rejection = admission.check_fetch(expected)
+    if rejection:
+        return rejected_response(rejection)
+    
+    download_request = create_request(
+        url, format_type, device_id, user_agent, clip,
+        status='queued',
+        # Short jobs are claimed first, see jobs.priority_for
+        priority=priority_for(expected, timezone.now()),
+    )
+    leader = join_or_queue(download_request, video_id)
+    
+    # Hand the job to the bounded worker pool
+    if download_request.status == 'queued':
+        job_queue.submit(download_request)
+    
+    return JsonResponse({
+        'message': 'Download queued using YouTube client emulation',
+        'request_id': download_request.id,
+        'status': download_request.status,
+        'shared': leader is not None,
+        'format': format_type,
+        'method': 'YouTube Client Emulation'
+    })
+
+@async_view(["POST"], csrf_exempt=True)
+async def start_batch(request):
+    """Download a list of URLs, or every video of a playlist, as one job group"""
+    try:
+        data = json.loads(request.body)
+        urls = data.get('urls')
+        playlist_url = data.get('url')
+        format_type = data.get('format', 'mp4')
+        device_id = data.get('device_id')
+        
+        if not urls and not playlist_url:
+            return JsonResponse({'error': 'A list of URLs or a playlist URL is required'}, status=400)
+        
+        if not device_id:
+            return JsonResponse({'error': 'Device ID is required'}, status=400)
+        
+        if format_type not in DOWNLOAD_FORMATS:
+            return JsonResponse({'error': f'Unsupported format: {format_type}'}, status=400)
+        
+        try:
+            accepted = parse_accept(data.get('accept'), request.META.get('HTTP_ACCEPT', ''))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        format_type = choose_audio_format(format_type, accepted)
+        
+        if urls:
+            if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+                return JsonResponse({'error': 'urls must be a list of YouTube video URLs'}, status=400)
+            if len(urls) > groups.max_items():
+                return JsonResponse(
+                    {'error': f'At most {groups.max_items()} URLs per batch', 'max_items': groups.max_items()},
+                    status=413
+                )
+            for url in urls:
+                if ('youtube.com' not in url and 'youtu.be' not in url) or not youtube_client.extract_video_id(url):
+                    return JsonResponse({'error': f'Not a YouTube video URL: {url}'}, status=400)
+            playlist_url = None
+        elif not isinstance(playlist_url, str):
+            return JsonResponse({'error': 'url must be a YouTube playlist URL'}, status=400)
+        elif 'youtube.com' not in playlist_url or not groups.playlist_id(playlist_url):
+            return JsonResponse({'error': 'Not a YouTube playlist URL'}, status=400)
+        
+        # Members of the group that may download at once
+        try:
+            parallel = int(data.get('parallel') or groups.group_setting('MAX_PARALLEL'))
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'Invalid parallel'}, status=400)
+        parallel = min(max(parallel, 1), groups.group_setting('MAX_PARALLEL'))
+        
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        return await sync_to_async(enqueue_batch)(urls, playlist_url, format_type, device_id, user_agent, parallel)
         
     except Exception as e:
-        return JsonResponse({'error': f'Download startup failed: {str(e)}'}, status=500)
+        return JsonResponse({'error': f'Batch startup failed: {str(e)}'}, status=500)
 
-@require_http_methods(["GET"])
-def check_status(request, request_id):
+def enqueue_batch(urls, playlist_url, format_type, device_id, user_agent, parallel):
+    """Create a DownloadGroup with one request per video, each served from cache, joined or queued"""
+    title = None
+    if playlist_url:
+        try:
+            playlist = youtube_client.expand_playlist(playlist_url)
+        except Exception as e:
+            return JsonResponse({'error': f'Playlist lookup failed: {str(e)}'}, status=500)
+        title = playlist['title']
+        items = [
+            (f"https://www.youtube.com/watch?v={entry['id']}", entry['id'], entry['duration'])
+            for entry in playlist['entries'][:groups.max_items()]
+        ]
+        if not items:
+            return JsonResponse({'error': 'The playlist has no videos that can be downloaded'}, status=422)
+    else:
+        items = [(url, youtube_client.extract_video_id(url), None) for url in urls]
+    
+    # Sort every video out before anything is created, so admission sees the whole batch
+    quality = cache.quality_for(format_type)
+    plan = []
+    fetches, expected_total = 0, 0
+    for url, video_id, duration in items:
+        failure = known_failure(video_id)
+        artifact = None if failure else cache.lookup(video_id, format_type, quality)
+        expected = None
+        if not failure and not artifact:
+            expected = admission.estimated_bytes(video_id, format_type, None, youtube_client.client_order(url), duration)
+            if not flight.in_flight(video_id, format_type, quality):
+                fetches += 1
+                expected_total += expected
+        plan.append((url, video_id, failure, artifact, expected))
+    
+    # The whole group is admitted or turned away
+    rejection = admission.check_device(device_id)
+    if rejection is None and fetches:
+        rejection = admission.check_fetch(expected_total, fetches)
+    if rejection:
+        return rejected_response(rejection)
+    
+    group = DownloadGroup.objects.create(
+        device_id=device_id,
+        format_choice=format_type,
+        source_url=playlist_url,
+        title=title,
+        max_parallel=parallel,
+    )
+    now = timezone.now()
+    members = []
+    for url, video_id, failure, artifact, expected in plan:
+        if failure:
+            download_request = create_request(
+                url, format_type, device_id, user_agent, group=group, status='failed', error_kind=PERMANENT
+            )
+            requests_total.inc(served='rejected')
+        elif artifact:
+            download_request = create_request(url, format_type, device_id, user_agent, group=group, status='processing')
+            serve_from_cache(download_request, artifact)
+        else:
+            download_request = create_request(
+                url, format_type, device_id, user_agent, group=group, status='queued',
+                priority=priority_for(expected, now),
+            )
+            join_or_queue(download_request, video_id)
+        members.append(download_request)
+    
+    if any(member.status == 'queued' for member in members):
+        job_queue.submit(group)
+    
+    return JsonResponse({
+        'message': f'{len(members)} downloads queued as one batch',
+        'group_id': group.id,
+        'title': title,
+        'status': groups.group_status(Counter(member.status for member in members)),
+        'total': len(members),
+        'format': format_type,
+        'items': [
+            {'request_id': member.id, 'url': member.url, 'status': member.status}
+            for member in members
+        ],
+    })
+
+def rejected_response(rejection):
+    """429/503 with Retry-After for a request admission control turned away"""
+    response = JsonResponse({
+        'error': rejection.message,
+        'reason': rejection.reason,
+        'retry_after': rejection.retry_after,
+    }, status=rejection.status)
+    response['Retry-After'] = str(rejection.retry_after)
+    return response
+
+@async_view(["GET"])
+async def check_status(request, request_id):
     try:
-        download_request = DownloadRequest.objects.get(id=request_id)
-        progress = download_progress.get(request_id, 0)
+        download_request = await DownloadRequest.objects.aget(id=request_id)
+        # Followers report the progress of the fetch they joined
+        progress = await sync_to_async(download_progress.get, thread_sensitive=False)(
+            download_request.leader_id or request_id
+        )
+        if download_request.status == 'completed':
+            progress = 100
         
         response_data = {
             'status': download_request.status,
@@ -394,24 +929,146 @@ def check_status(request, request_id):
         }
         
         if download_request.status == 'failed':
-            response_data['error'] = getattr(download_request, 'error_message', 'Download failed')
+            response_data['error'] = ERROR_MESSAGES.get(download_request.error_kind, 'Download failed')
+            response_data['error_kind'] = download_request.error_kind
         
         return JsonResponse(response_data)
         
     except DownloadRequest.DoesNotExist:
         return JsonResponse({'error': 'Download request not found'}, status=404)
 
-@require_http_methods(["GET"])
+@async_view(["GET"])
+async def stream_status(request, request_id):
+    """Server-Sent Events stream of a job's progress, ending with one completed/failed event"""
+    exists = await DownloadRequest.objects.filter(id=request_id).aexists()
+    if not exists:
+        return JsonResponse({'error': 'Download request not found'}, status=404)
+    
+    response = StreamingHttpResponse(
+        job_events(download_progress, request_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # let nginx pass events through unbuffered
+    return for_server(request, response)
+
+@require_http_methods(["GET", "HEAD"])
 def download_file(request):
-    file_path = request.GET.get('path')
+    file_path = media_path(request.GET.get('path'))
     
-    if not file_path or not os.path.exists(file_path):
+    if not file_path:
         return JsonResponse({'error': 'File not found'}, status=404)
     
-    filename = os.path.basename(file_path)
-    response = FileResponse(open(file_path, 'rb'))
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    # Files are stored under their video ID; hand them out under their title
+    title = DownloadRequest.objects.filter(file_path=file_path).exclude(video_title=None).values_list(
+        'video_title', flat=True
+    ).first()
+    filename = f"{title}{os.path.splitext(file_path)[1]}" if title else None
+    
+    return serve_media(request, file_path, as_attachment=True, filename=filename)
+
+@require_http_methods(["GET"])
+def download_zip(request):
+    """Stream one ZIP of a device's finished downloads, built on the fly from MEDIA_ROOT.
+    
+    Files are stored, not recompressed, and nothing is written to disk, so
+    the response starts at once and memory stays flat however large it gets.
+    """
+    device_id = request.GET.get('device_id')
+    if not device_id:
+        return JsonResponse({'error': 'Device ID is required'}, status=400)
+    
+    try:
+        ids = [int(value) for value in request.GET.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid ids'}, status=400)
+    if not ids:
+        return JsonResponse({'error': 'ids is required'}, status=400)
+    if len(ids) > ZIP_MAX_ITEMS:
+        return JsonResponse({'error': f'At most {ZIP_MAX_ITEMS} downloads per archive'}, status=400)
+    
+    rows = DownloadRequest.objects.filter(
+        id__in=ids, device_id=device_id, status='completed', file_exists=True
+    ).values_list('id', 'file_path', 'video_title')
+    by_id = {row_id: (file_path, title) for row_id, file_path, title in rows}
+    
+    # In the order asked for, each file once, under its title like download_file
+    entries = []
+    paths = set()
+    names = set()
+    for row_id in ids:
+        file_path, title = by_id.get(row_id, (None, None))
+        file_path = media_path(file_path)
+        if not file_path or file_path in paths:
+            continue
+        paths.add(file_path)
+        
+        stem, ext = os.path.splitext(os.path.basename(file_path))
+        stem = UNSAFE_NAME_CHARS.sub('_', title).strip() if title else stem
+        name = f"{stem}{ext}"
+        copy = 1
+        while name.lower() in names:
+            copy += 1
+            name = f"{stem} ({copy}){ext}"
+        names.add(name.lower())
+        entries.append((name, file_path))
+    
+    if not entries:
+        return JsonResponse({'error': 'No finished downloads found'}, status=404)
+    
+    response = StreamingHttpResponse(zip_stream(entries), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, f'downloads-{len(entries)}.zip')
+    response['Cache-Control'] = 'no-store'
+    response['X-Accel-Buffering'] = 'no'  # do not let nginx buffer the archive
+    return for_server(request, response)
+
+@async_view(["GET"])
+async def stream_file(request, request_id):
+    """Serve an mp4 while it is still downloading, or the finished file once it is done"""
+    try:
+        download_request = await DownloadRequest.objects.aget(id=request_id)
+    except DownloadRequest.DoesNotExist:
+        return JsonResponse({'error': 'Download request not found'}, status=404)
+    
+    if download_request.format_choice != 'mp4':
+        # Post-processed formats only exist once ffmpeg is done
+        return JsonResponse({'error': 'Progressive delivery is only available for mp4'}, status=409)
+    
+    # Followers read the file their leader is writing
+    watch_id = download_request.leader_id or request_id
+    deadline = time.monotonic() + LIVE_START_TIMEOUT
+    
+    # Waiting for the job to start holds no thread: the loop sleeps between checks
+    while True:
+        await download_request.arefresh_from_db()
+        if download_request.status == 'completed':
+            file_path = media_path(download_request.file_path)
+            if not file_path:
+                return JsonResponse({'error': 'File not found'}, status=404)
+            return await sync_to_async(serve_media)(request, file_path)
+        if download_request.status == 'failed':
+            return JsonResponse({'error': 'Download failed'}, status=409)
+        if download_request.status == 'cancelled':
+            return JsonResponse({'error': 'Download cancelled'}, status=409)
+        
+        record = await sync_to_async(download_progress.record)(watch_id) or {}
+        part_path = media_path(record.get('tmpfilename'))
+        if part_path and record.get('status') == 'processing':
+            break
+        
+        if time.monotonic() > deadline:
+            return JsonResponse({'error': 'Download has not started yet'}, status=503)
+        await asyncio.sleep(0.25)
+    
+    filename = os.path.basename(record.get('filename') or part_path)
+    response = StreamingHttpResponse(
+        follow_growing_file(part_path, lambda: download_progress.record(watch_id)),
+        content_type='video/mp4'
+    )
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    response['X-Accel-Buffering'] = 'no'  # do not let nginx buffer the whole file
+    return for_server(request, response)
 
 @require_http_methods(["GET"])
 def get_video_info(request):
@@ -422,23 +1079,9 @@ def get_video_info(request):
     
     try:
         # Use mobile client for info extraction
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'noplaylist': True,
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['android'],
-                }
-            },
-            'http_headers': youtube_client.get_mobile_headers(),
-            'no_check_certificate': False,
-            'ignoreerrors': False,
-            'extractor_retries': 2,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        with youtube_client.ydl_pool.acquire('mobile', 'info') as ydl:
+            # Cached per video so the following download can skip extraction
+            info = extract_raw_info(ydl, url, youtube_client.extract_video_id(url), 'mobile')
             
             if 'entries' in info:
                 info = info['entries'][0]
@@ -455,37 +1098,75 @@ def get_video_info(request):
     except Exception as e:
         return JsonResponse({'error': f'Info extraction failed: {str(e)}'}, status=500)
 
+def encode_history_cursor(created_at, row_id):
+    """Opaque keyset cursor for the row a history page ended on"""
+    return urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+def decode_history_cursor(cursor):
+    created_at, row_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(row_id)
+
 @require_http_methods(["GET"])
 def get_download_history(request):
+    """Completed downloads for a device, newest first, one keyset page at a time.
+    
+    The body stays a plain list; the cursor for the next page comes back in
+    the X-Next-Cursor header and is passed back as ?cursor=.
+    """
     try:
         device_id = request.GET.get('device_id')
         
         if not device_id:
             return JsonResponse({'error': 'Device ID is required'}, status=400)
         
+        try:
+            limit = min(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid limit'}, status=400)
+        limit = max(limit, 1)
+        
+        # Served straight from dl_device_history_idx, no per-row disk access
         completed_downloads = DownloadRequest.objects.filter(
             status='completed', 
-            device_id=device_id
-        ).order_by('-created_at')
+            device_id=device_id,
+            file_exists=True,
+        ).order_by('-created_at', '-id')
+        
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                created_at, row_id = decode_history_cursor(cursor)
+            except (ValueError, UnicodeDecodeError, binascii.Error):
+                return JsonResponse({'error': 'Invalid cursor'}, status=400)
+            completed_downloads = completed_downloads.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=row_id)
+            )
+        
+        rows = list(completed_downloads.values(
+            'id', 'url', 'format_choice', 'created_at', 'file_path', 'file_size',
+            'video_title', 'video_thumbnail', 'video_duration',
+        )[:limit + 1])
         
         downloads_list = []
-        for download in completed_downloads:
-            if download.file_path and os.path.exists(download.file_path):
-                file_size = os.path.getsize(download.file_path)
-                downloads_list.append({
-                    'id': download.id,
-                    'title': getattr(download, 'video_title', os.path.basename(download.file_path)),
-                    'file_path': download.file_path,
-                    'file_name': os.path.basename(download.file_path),
-                    'file_size': file_size,
-                    'format': download.format_choice,
-                    'thumbnail': getattr(download, 'video_thumbnail', ''),
-                    'duration': getattr(download, 'video_duration', 0),
-                    'created_at': download.created_at.isoformat(),
-                    'url': download.url
-                })
+        for row in rows[:limit]:
+            downloads_list.append({
+                'id': row['id'],
+                'title': row['video_title'] or os.path.basename(row['file_path']),
+                'file_path': row['file_path'],
+                'file_name': os.path.basename(row['file_path']),
+                'file_size': row['file_size'],
+                'format': row['format_choice'],
+                'thumbnail': row['video_thumbnail'],
+                'duration': row['video_duration'],
+                'created_at': row['created_at'].isoformat(),
+                'url': row['url']
+            })
         
-        return JsonResponse(downloads_list, safe=False)
+        response = JsonResponse(downloads_list, safe=False)
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            response['X-Next-Cursor'] = encode_history_cursor(last['created_at'], last['id'])
+        return response
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -501,9 +1182,10 @@ def delete_download(request, download_id):
         
         download = DownloadRequest.objects.get(id=download_id, device_id=device_id)
         
-        if download.file_path and os.path.exists(download.file_path):
+        # Only remove the file once no other request shares it
+        if cache.release(download) and download.file_path and os.path.exists(download.file_path):
             os.remove(download.file_path)
-            print(f"🗑️ Deleted file: {download.file_path}")
+            logger.info("Deleted file %s", download.file_path, extra={'request_id': download.id})
         
         download.delete()
         
@@ -514,23 +1196,106 @@ def delete_download(request, download_id):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def cancel_download(request, download_id):
+    """Stop a queued or running download, freeing its worker and partial files"""
+    try:
+        device_id = request.GET.get('device_id') or json.loads(request.body or '{}').get('device_id')
+        
+        if not device_id:
+            return JsonResponse({'error': 'Device ID is required'}, status=400)
+        
+        download = DownloadRequest.objects.get(id=download_id, device_id=device_id)
+        
+        if not cancel_job(download):
+            return JsonResponse({'error': f'Download already {download.status}', 'status': download.status}, status=409)
+        
+        return JsonResponse({'message': 'Download cancelled', 'request_id': download.id, 'status': 'cancelled'})
+        
+    except DownloadRequest.DoesNotExist:
+        return JsonResponse({'error': 'Download not found or access denied'}, status=404)
+
 @require_http_methods(["GET"])
-def play_file(request):
-    file_path = request.GET.get('path')
+def batch_status(request, group_id):
+    """Aggregated status and progress of a job group, with one entry per video"""
+    try:
+        group = DownloadGroup.objects.get(id=group_id)
+    except DownloadGroup.DoesNotExist:
+        return JsonResponse({'error': 'Batch not found'}, status=404)
     
-    if not file_path or not os.path.exists(file_path):
-        return JsonResponse({'error': 'File not found'}, status=404)
+    members = group.requests.order_by('id').values(
+        'id', 'url', 'status', 'leader_id', 'video_title', 'file_path', 'error_kind'
+    )
+    counts = Counter()
+    items = []
+    done = 0.0
+    for member in members:
+        status = member['status']
+        counts[status] += 1
+        progress = 0
+        if status == 'completed':
+            progress = 100
+        elif status in ('processing', 'waiting'):
+            # Followers report the progress of the fetch they joined
+            progress = download_progress.get(member['leader_id'] or member['id'])
+        done += 100 if status in DONE else progress
+        
+        item = {
+            'request_id': member['id'],
+            'url': member['url'],
+            'status': status,
+            'progress': round(progress, 1),
+            'video_title': member['video_title'],
+            'file_path': member['file_path'],
+        }
+        if status == 'failed':
+            item['error'] = ERROR_MESSAGES.get(member['error_kind'], 'Download failed')
+            item['error_kind'] = member['error_kind']
+        items.append(item)
     
-    filename = os.path.basename(file_path)
-    response = FileResponse(open(file_path, 'rb'))
+    return JsonResponse({
+        'group_id': group.id,
+        'title': group.title,
+        'format': group.format_choice,
+        'status': groups.group_status(counts),
+        # Finished members count as done whatever their outcome
+        'progress': round(done / len(items), 1) if items else 0,
+        'total': len(items),
+        'counts': counts,
+        'max_parallel': group.max_parallel,
+        'items': items,
+    })
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def cancel_batch(request, group_id):
+    """Cancel every unfinished download of a job group"""
+    try:
+        device_id = request.GET.get('device_id') or json.loads(request.body or '{}').get('device_id')
+        
+        if not device_id:
+            return JsonResponse({'error': 'Device ID is required'}, status=400)
+        
+        group = DownloadGroup.objects.get(id=group_id, device_id=device_id)
+        
+        cancelled_count = 0
+        for download in group.requests.filter(status__in=UNFINISHED):
+            cancelled_count += cancel_job(download)
+        
+        return JsonResponse({'message': f'{cancelled_count} downloads cancelled', 'group_id': group.id, 'cancelled': cancelled_count})
+        
+    except DownloadGroup.DoesNotExist:
+        return JsonResponse({'error': 'Batch not found or access denied'}, status=404)
+
+@require_http_methods(["GET", "HEAD"])
+def play_file(request):
+    file_path = media_path(request.GET.get('path'))
     
-    if file_path.lower().endswith('.mp4'):
-        response['Content-Type'] = 'video/mp4'
-    elif file_path.lower().endswith('.mp3'):
-        response['Content-Type'] = 'audio/mpeg'
+    if not file_path:
+        return JsonResponse({'error': 'File not found'}, status=404)
     
-    response['Content-Disposition'] = f'inline; filename="{filename}"'
-    return response
+    return serve_media(request, file_path)
 
 @require_http_methods(["GET"])
 def search_youtube(request):
@@ -539,24 +1304,13 @@ def search_youtube(request):
     if not query:
         return JsonResponse({'error': 'Search query is required'}, status=400)
     
+    cached = metadata_cache.get(search_key(query))
+    if cached is not None:
+        return JsonResponse(cached, safe=False)
+    
     try:
         # Use web client for search
-        ydl_opts = {
-            'quiet': True,
-            'extract_flat': True,
-            'default_search': 'ytsearch10',
-            'noplaylist': True,
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['web'],
-                }
-            },
-            'http_headers': youtube_client.get_web_headers(),
-            'no_check_certificate': False,
-            'ignoreerrors': True,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with youtube_client.ydl_pool.acquire('web', 'search') as ydl:
             info = ydl.extract_info(query, download=False)
             
             results = []
@@ -571,6 +1325,7 @@ def search_youtube(request):
                     'view_count': entry.get('view_count'),
                 })
             
+            metadata_cache.set(search_key(query), results, metadata_setting('SEARCH_TTL'))
             return JsonResponse(results, safe=False)
             
     except Exception as e:
@@ -588,24 +1343,39 @@ def client_status(request):
     }
     return JsonResponse(status)
 
-# System cleanup
-def cleanup_old_downloads():
-    """Clean up old download files"""
-    try:
-        media_dir = settings.MEDIA_ROOT
-        if os.path.exists(media_dir):
-            for filename in os.listdir(media_dir):
-                file_path = os.path.join(media_dir, filename)
-                # Delete files older than 24 hours
-                if os.path.isfile(file_path):
-                    file_age = time.time() - os.path.getctime(file_path)
-                    if file_age > 86400:  # 24 hours
-                        os.remove(file_path)
-                        print(f"🧹 Cleaned up: {filename}")
-    except Exception as e:
-        print(f"Cleanup failed: {e}")
+@require_http_methods(["GET"])
+def queue_status(request):
+    """Queue depth and worker usage per lane, plus the transcode pool and bandwidth budget"""
+    return JsonResponse({
+        **job_queue.stats(),
+        'transcode': transcode_pool.stats(),
+        'bandwidth': bandwidth_budget.stats(),
+        'admission': admission.stats(),
+    })
 
-# Start cleanup thread
-cleanup_thread = threading.Thread(target=cleanup_old_downloads)
-cleanup_thread.daemon = True
-cleanup_thread.start()
\ No newline at end of file
+@require_http_methods(["GET"])
+def metrics(request):
+    """Prometheus metrics: job stage timings, failures, bytes and cache use, plus pool gauges"""
+    queue = job_queue.stats()
+    lanes = queue['lanes'].items()
+    transcode = transcode_pool.stats()
+    bandwidth = bandwidth_budget.stats()
+    admitted = admission.stats()
+    gauges = [
+        ('my_mp4_jobs_queued', 'Jobs waiting to be claimed', [({'lane': lane}, c['queued']) for lane, c in lanes]),
+        ('my_mp4_jobs_processing', 'Jobs being downloaded by any worker', [({'lane': lane}, c['processing']) for lane, c in lanes]),
+        ('my_mp4_jobs_active', 'Jobs running in this process', [({'lane': lane}, c['active']) for lane, c in lanes]),
+        ('my_mp4_workers', 'Worker slots in this process', [({'lane': lane}, c['workers']) for lane, c in lanes]),
+        ('my_mp4_oldest_queued_seconds', 'Age of the oldest queued job', [({}, queue['oldest_queued_seconds'])]),
+        ('my_mp4_transcode_jobs', 'ffmpeg encodes in this process', [
+            ({'state': 'waiting'}, transcode['waiting']),
+            ({'state': 'running'}, transcode['running']),
+        ]),
+        ('my_mp4_bandwidth_connections', 'Download connections granted in this process', [({}, bandwidth['connections'])]),
+        ('my_mp4_bandwidth_connection_bps', 'Measured throughput per connection', [({}, bandwidth['connection_bps'])]),
+        ('my_mp4_admission_limit', 'Admission control thresholds', [
+            ({'limit': name}, value) for name, value in admitted['limits'].items()
+        ]),
+        ('my_mp4_media_free_bytes', 'Free space on the MEDIA_ROOT filesystem', [({}, admitted['free_bytes'])]),
+    ]
+    return HttpResponse(registry.render(gauges), content_type=METRICS_CONTENT_TYPE)
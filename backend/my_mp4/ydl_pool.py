@@ -0,0 +1,164 @@
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+ytdlp_logger = logging.getLogger('my_mp4.ytdlp')
+
+POOL_DEFAULTS = {
+    # Idle YoutubeDL instances kept per (client profile, format)
+    'MAX_IDLE': 4,
+    # Instances older than this are rebuilt so cookies and sessions stay fresh
+    'MAX_AGE': 3600,
+    # Shared on-disk cache for YouTube player JS and signature/nsig solutions
+    'CACHE_DIR': os.path.join(settings.BASE_DIR, '.ytdlp-cache'),
+}
+
+
+def pool_setting(name):
+    """Read a YTDLP_POOL setting, falling back to the defaults"""
+    return getattr(settings, 'YTDLP_POOL', {}).get(name, POOL_DEFAULTS[name])
+
+
+def format_hook_pp(pooled):
+    """before_dl postprocessor handing the chosen format to the job's format hook"""
+    from yt_dlp.postprocessor import PostProcessor
+
+    class FormatChosen(PostProcessor):
+        def run(self, info):
+            hook = pooled.format_hook
+            if hook is not None:
+                # Read by the downloader, which is only built after this
+                self._downloader.params.update(hook(info) or {})
+            return [], info
+
+    return FormatChosen()
+
+
+class PooledYDL:
+    """A warm YoutubeDL plus the per-job hooks its callbacks go to"""
+
+    def __init__(self, opts):
+        self.job_hook = None
+        self.format_hook = None
+        self.created = time.monotonic()
+        opts = dict(opts)
+        opts['progress_hooks'] = [self._dispatch_progress]
+        opts.setdefault('cachedir', pool_setting('CACHE_DIR'))
+        # Imported on first use; yt-dlp is the heaviest import in the app
+        import urllib3
+        import yt_dlp
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        
+        # yt-dlp's own messages go through logging, not stdout
+        opts.setdefault('logger', ytdlp_logger)
+        opts.setdefault('noprogress', True)
+        self.ydl = yt_dlp.YoutubeDL(opts)
+        self.ydl.add_post_processor(format_hook_pp(self), when='before_dl')
+        self.defaults = dict(self.ydl.params)
+
+    def _dispatch_progress(self, d):
+        hook = self.job_hook
+        if hook is not None:
+            hook(d)
+
+    def expired(self):
+        return time.monotonic() - self.created > pool_setting('MAX_AGE')
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception as e:
+            logger.warning("YoutubeDL close failed: %s", e)
+
+
+class YDLPool:
+    """Reusable YoutubeDL instances keyed by client profile and format.
+
+    Building a YoutubeDL sets up extractors, the HTTP request director and the
+    cookie jar; keeping instances warm also keeps their keep-alive connections
+    and in-memory player caches. A YoutubeDL is not thread-safe, so each
+    instance is checked out by one job at a time.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _idle_queue(self, key):
+        with self._lock:
+            return self._idle.setdefault(key, queue.LifoQueue())
+
+    @contextmanager
+    def acquire(self, profile, format_type, progress_hook=None, overrides=None, format_hook=None):
+        """Check out a YoutubeDL for one job.
+
+        `overrides` are applied to the instance's params for this job only,
+        and the progress hook is attached without rebuilding the object.
+        `format_hook` is called with the info dict of the chosen format just
+        before it is downloaded; the params it returns apply to the download.
+        """
+        key = (profile, format_type)
+        idle = self._idle_queue(key)
+
+        pooled = None
+        while pooled is None:
+            try:
+                pooled = idle.get_nowait()
+            except queue.Empty:
+                pooled = PooledYDL(self.factory(profile, format_type))
+                with self._lock:
+                    self.created += 1
+                break
+            if pooled.expired():
+                pooled.close()
+                pooled = None
+            else:
+                with self._lock:
+                    self.reused += 1
+
+        pooled.job_hook = progress_hook
+        pooled.format_hook = format_hook
+        if overrides:
+            pooled.ydl.params.update(overrides)
+
+        healthy = False
+        try:
+            yield pooled.ydl
+            healthy = True
+        finally:
+            pooled.job_hook = None
+            pooled.format_hook = None
+            # Put the params back the way the factory built them
+            pooled.ydl.params.clear()
+            pooled.ydl.params.update(pooled.defaults)
+
+            if healthy and idle.qsize() < pool_setting('MAX_IDLE'):
+                idle.put(pooled)
+            else:
+                # A failed job may have left the instance in a bad state
+                pooled.close()
+
+    def clear(self):
+        with self._lock:
+            idle_queues = list(self._idle.values())
+            self._idle = {}
+        for idle in idle_queues:
+            while True:
+                try:
+                    idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+    def stats(self):
+        with self._lock:
+            idle = {f"{profile}/{fmt}": q.qsize() for (profile, fmt), q in self._idle.items()}
+        return {'created': self.created, 'reused': self.reused, 'idle': idle}
@@ -0,0 +1,120 @@
+"""Run one yt-dlp download in a child process.
+
+Used by the asyncio engine (engine.py). Reads a JSON job line from stdin and
+writes one JSON event per line to stdout:
+
+    {"event": "format", "info": {...chosen format(s)...}}
+    {"event": "progress", ...yt-dlp progress fields...}
+    {"event": "done", "info": {...}, "filename": "..."}
+    {"event": "error", "message": "...", "kind": "transient"}
+
+After a "format" event the child waits for one more stdin line: the ydl
+params of the bandwidth grant the parent allocated for that format.
+
+Deliberately free of Django so the child starts quickly.
+"""
+import json
+import sys
+import time
+
+import yt_dlp
+from yt_dlp.postprocessor import PostProcessor
+from yt_dlp.utils import download_range_func
+
+from my_mp4.errors import classify
+
+# Progress fields forwarded to the parent's progress_hook
+PROGRESS_KEYS = (
+    'status', '_percent_str', 'downloaded_bytes', 'total_bytes',
+    'total_bytes_estimate', 'tmpfilename', 'filename', 'speed', 'eta', 'elapsed',
+)
+
+# Result fields the parent stores on the DownloadRequest
+INFO_KEYS = ('id', 'title', 'thumbnail', 'duration', 'filesize', 'filesize_approx', 'acodec')
+
+# Format fields the parent sizes the job's bandwidth grant from
+FORMAT_KEYS = ('format_id', 'protocol', 'filesize', 'filesize_approx')
+
+# Seconds between forwarded 'downloading' events
+PROGRESS_INTERVAL = 0.2
+
+
+def emit(event, **data):
+    sys.stdout.write(json.dumps({'event': event, **data}) + '\n')
+    sys.stdout.flush()
+
+
+def make_progress_hook():
+    last = [0.0]
+
+    def hook(d):
+        now = time.monotonic()
+        if d.get('status') == 'downloading' and now - last[0] < PROGRESS_INTERVAL:
+            return
+        last[0] = now
+        emit('progress', **{key: d.get(key) for key in PROGRESS_KEYS if d.get(key) is not None})
+
+    return hook
+
+
+def chosen_format(info):
+    """What the parent needs to know of the format(s) about to be downloaded"""
+    formats = info.get('requested_formats') or [info]
+    return {
+        **{key: info.get(key) for key in ('format_id', 'duration', 'section_start', 'section_end')},
+        'requested_formats': [
+            dict({key: f.get(key) for key in FORMAT_KEYS}, fragments=bool(f.get('fragments')))
+            for f in formats
+        ],
+    }
+
+
+class AwaitGrant(PostProcessor):
+    """Before the download: report the chosen format and apply the parent's grant"""
+
+    def run(self, info):
+        emit('format', info=chosen_format(info))
+        reply = sys.stdin.readline()
+        if not reply:
+            raise RuntimeError("Parent closed the job pipe")
+        self._downloader.params.update(json.loads(reply))
+        return [], info
+
+
+def run(job):
+    opts = dict(job['opts'])
+    opts['progress_hooks'] = [make_progress_hook()]
+    # stdout carries the event protocol
+    opts['logtostderr'] = True
+    opts['noprogress'] = True
+    if job.get('sections'):
+        # Clip requests: fetch only these time ranges (see clips.py)
+        opts['download_ranges'] = download_range_func(None, [tuple(section) for section in job['sections']])
+        opts['force_keyframes_at_cuts'] = False
+
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        ydl.add_post_processor(AwaitGrant(), when='before_dl')
+        raw_info = job.get('raw_info')
+        if raw_info is not None:
+            info = ydl.process_ie_result(raw_info, download=True)
+        else:
+            info = ydl.extract_info(job['url'], download=True)
+
+        if 'entries' in info:
+            info = info['entries'][0]
+
+        emit('done', info={key: info.get(key) for key in INFO_KEYS}, filename=ydl.prepare_filename(info))
+
+
+def main():
+    job = json.loads(sys.stdin.readline())
+    try:
+        run(job)
+    except Exception as e:
+        emit('error', message=str(e), kind=classify(e).kind)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())